@@ -11,6 +11,8 @@ from datetime import datetime
 import json
 from dotenv import load_dotenv
 
+from workbook_reader import WorkbookReader
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -28,16 +30,14 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 def read_excel_file(file_path):
     """
     Lê a planilha Excel e retorna os dados
+    (uma única abertura em modo somente leitura para todas as abas e cache por hash
+    do conteúdo: ver workbook_reader.py)
     """
     try:
-        # Ler todas as abas da planilha
-        excel_file = pd.ExcelFile(file_path)
-        print(f"Abas encontradas: {excel_file.sheet_names}")
+        sheets_data = WorkbookReader(file_path).read_sheets()
+        print(f"Abas encontradas: {list(sheets_data)}")
         
-        sheets_data = {}
-        for sheet_name in excel_file.sheet_names:
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            sheets_data[sheet_name] = df
+        for sheet_name, df in sheets_data.items():
             print(f"\nAba '{sheet_name}': {len(df)} linhas, {len(df.columns)} colunas")
             print(f"Colunas: {list(df.columns)}")
             
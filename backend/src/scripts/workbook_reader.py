@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Leitura da planilha Excel (.xlsm) com uma única abertura e cache binário
+
+- o arquivo é lido do disco uma única vez; o hash SHA-256 do conteúdo identifica a versão
+- se já existe cache para esse hash, as abas são carregadas do cache (Parquet, ou
+  pickle quando a aba tem tipos que o Parquet não aceita) sem nenhum parse de XML
+- caso contrário o workbook é aberto uma única vez, em modo somente leitura
+  (streaming do openpyxl), e todas as abas são convertidas a partir dessa abertura.
+  Converter abas em processos separados exigiria reabrir o workbook inteiro em cada
+  processo (o openpyxl não compartilha o workbook aberto), o que custa mais do que o
+  paralelismo economiza
+"""
+
+import hashlib
+import io
+import json
+import os
+
+import pandas as pd
+
+# Diretório do cache (pode ser alterado com EXCEL_CACHE_DIR)
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.excel_cache')
+
+
+def _save_sheet(df, base_path):
+    """Grava a aba no cache; retorna o nome do arquivo gravado"""
+    try:
+        path = base_path + '.parquet'
+        df.to_parquet(path, index=False)
+    except Exception:
+        # Sem pyarrow, ou colunas com tipos mistos / cabeçalhos não textuais
+        if os.path.exists(path):
+            os.remove(path)
+        path = base_path + '.pkl'
+        df.to_pickle(path)
+    return os.path.basename(path)
+
+
+def _load_sheet(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+class WorkbookReader:
+    """
+    Lê todas as abas de um workbook, usando o cache quando o conteúdo não mudou
+    """
+
+    def __init__(self, file_path, cache_dir=None):
+        self.file_path = file_path
+        self.cache_dir = cache_dir or os.getenv('EXCEL_CACHE_DIR') or DEFAULT_CACHE_DIR
+        self.content_hash = None
+
+    def read_sheets(self):
+        """
+        Retorna {nome da aba: DataFrame}, na ordem das abas do workbook
+        """
+        with open(self.file_path, 'rb') as f:
+            content = f.read()
+        self.content_hash = hashlib.sha256(content).hexdigest()
+
+        sheets = self._read_cache()
+        if sheets is not None:
+            print(f"Planilha sem alterações (hash {self.content_hash[:12]}): abas carregadas do cache")
+            return sheets
+
+        sheets = self._parse_workbook(content)
+        self._write_cache(sheets)
+        return sheets
+
+    def _parse_workbook(self, content):
+        # Uma única abertura (somente leitura) para todas as abas
+        with pd.ExcelFile(io.BytesIO(content), engine='openpyxl') as excel_file:
+            return {sheet_name: excel_file.parse(sheet_name) for sheet_name in excel_file.sheet_names}
+
+    @property
+    def _cache_path(self):
+        return os.path.join(self.cache_dir, self.content_hash)
+
+    def _read_cache(self):
+        index_path = os.path.join(self._cache_path, 'sheets.json')
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            return {entry['sheet']: _load_sheet(os.path.join(self._cache_path, entry['file'])) for entry in index}
+        except Exception as e:
+            print(f"Cache da planilha inválido, relendo o arquivo: {e}")
+            return None
+
+    def _write_cache(self, sheets):
+        try:
+            os.makedirs(self._cache_path, exist_ok=True)
+            index = []
+            for position, (sheet_name, df) in enumerate(sheets.items()):
+                file_name = _save_sheet(df, os.path.join(self._cache_path, f"sheet_{position:03d}"))
+                index.append({'sheet': sheet_name, 'file': file_name})
+            # O índice é gravado por último: cache incompleto nunca é usado
+            with open(os.path.join(self._cache_path, 'sheets.json'), 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+        except OSError as e:
+            print(f"Não foi possível gravar o cache da planilha: {e}")
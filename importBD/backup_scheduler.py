@@ -2,14 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import json
-import urllib.request
-import urllib.parse
-import urllib.error
-import csv
 import os
 import shutil
 from datetime import datetime, timedelta
-import time
+
+from backup_store import BackupStore
+from backup_writer import write_manifest
+from supabase_client import get_client
+from incremental_backup import BackupState, backup_changes, detect_deletes, init_watermark, seed_ids
+from table_stats import table_stats
 
 # Configuração do Supabase
 SUPABASE_URL = "https://sxbslulfitfsijqrzljd.supabase.co"
@@ -17,82 +18,103 @@ SUPABASE_ANON_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZS
 
 # Configurações de backup
 BACKUP_RETENTION_DAYS = 30  # Manter backups por 30 dias
-MAX_BACKUP_FOLDERS = 10     # Máximo de pastas de backup
+MAX_BACKUP_FOLDERS = 10     # Máximo de pastas de backup completo
+FULL_BACKUP_INTERVAL_HOURS = 24  # Backup completo no máximo a cada 24h; nas demais execuções, incremental
+ID_CHECK_INTERVAL_HOURS = 24     # Detecção de exclusões (comparação dos ids) a cada 24h
+BACKUP_STATE_FILE = 'backup_state.json'  # Marcas d'água dos incrementais
+BACKUP_STORE_DIR = 'backup_store'        # Repositório deduplicado dos backups completos (snapshots)
+SNAPSHOT_RETENTION = {'hourly': 24, 'daily': 30, 'weekly': 26, 'monthly': 24}  # Snapshots mantidos por camada
 
 def make_supabase_request(method, endpoint, params=None):
     """Faz uma requisição HTTP para o Supabase"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    
-    if params:
-        query_string = urllib.parse.urlencode(params)
-        url += f"?{query_string}"
-    
-    headers = {
-        'apikey': SUPABASE_ANON_KEY,
-        'Authorization': f'Bearer {SUPABASE_ANON_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    req = urllib.request.Request(url, headers=headers, method=method)
-    
     try:
-        with urllib.request.urlopen(req) as response:
-            if response.status in [200, 201, 204]:
-                try:
-                    return json.loads(response.read().decode('utf-8'))
-                except:
-                    return {'success': True}
-            return None
+        response = get_client(SUPABASE_URL, SUPABASE_ANON_KEY).request(method, endpoint, params=params)
+        try:
+            return response.json()
+        except ValueError:
+            return {'success': True}
     except Exception as e:
         print(f"Erro na requisição: {e}")
         return None
 
-def create_incremental_backup(backup_dir, last_backup_time=None):
-    """Cria backup incremental baseado na última data de backup"""
+def create_incremental_backup(backup_dir, state):
+    """
+    Cria backup incremental: só as linhas criadas/alteradas desde a marca d'água
+    (updated_at, id) de cada tabela, guardada em state
+    """
     print("📊 Criando backup incremental...")
     
+    client = get_client(SUPABASE_URL, SUPABASE_ANON_KEY)
     tables = ['clients', 'contracts', 'payments']
     total_new_records = 0
+    files = {}
     
     for table in tables:
-        print(f"\n🔍 Verificando novos registros em '{table}'...")
-        
-        # Parâmetros para buscar registros novos/atualizados
-        params = {'select': '*', 'limit': '1000'}
-        
-        if last_backup_time:
-            # Buscar apenas registros criados/atualizados após o último backup
-            params['created_at'] = f'gte.{last_backup_time}'
+        print(f"\n🔍 Verificando registros novos/alterados em '{table}'...")
         
-        data = make_supabase_request('GET', table, params)
-        
-        if data and len(data) > 0:
-            # Salvar dados incrementais
-            filename = f"{table}_incremental_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            filepath = os.path.join(backup_dir, filename)
-            
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = data[0].keys()
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(data)
+        try:
+            total_new_records += backup_changes(client, table, backup_dir, state, files)
             
-            print(f"✅ {len(data)} novos registros salvos em {filename}")
-            total_new_records += len(data)
-        else:
-            print(f"ℹ️  Nenhum registro novo em '{table}'")
+            # Exclusões não aparecem em updated_at: compara os ids de tempos em tempos
+            if state.id_check_due(table, ID_CHECK_INTERVAL_HOURS):
+                print(f"🔎 Verificando exclusões em '{table}'...")
+                detect_deletes(client, table, backup_dir, state, files)
+        except Exception as e:
+            print(f"❌ Erro no backup incremental de '{table}': {e}")
+        
+        # A marca d'água só avança depois que o arquivo da tabela foi gravado
+        state.save()
     
+    write_manifest(backup_dir, files, extra={'supabase_url': SUPABASE_URL, 'backup_type': 'incremental'})
     return total_new_records
 
-def cleanup_old_backups(base_dir):
-    """Remove backups antigos para economizar espaço"""
+def create_snapshot(store, client, tables):
+    """Backup completo das tabelas como snapshot no repositório deduplicado"""
+    snapshot = store.create_snapshot(client, tables)
+    
+    for table, entry in snapshot['tables'].items():
+        if 'error' in entry:
+            print(f"❌ Erro no backup de '{table}': {entry['error']}")
+        else:
+            print(f"✅ {table}: {entry['rows']:,} registros, {len(entry['chunks'])} blocos "
+                  f"({entry['new_chunks']} novos, {entry['new_bytes'] / 1024:.1f} KB gravados)")
+    print(f"📸 Snapshot {snapshot['id']} ({snapshot['status']})")
+    return snapshot
+
+def seed_snapshot_ids(store, snapshot, state):
+    """
+    Ids de cada tabela do snapshot como referência da próxima verificação de exclusões:
+    o que for excluído depois do backup completo aparece no incremental seguinte
+    """
+    for table, entry in snapshot['tables'].items():
+        if 'error' in entry:
+            continue
+        try:
+            ids = (str(row['id']) for row in store.read_rows(snapshot['id'], table, verify=False))
+            seed_ids(state, table, ids, snapshot['created_at'])
+        except Exception as e:
+            print(f"⚠️  Ids de '{table}' não registrados: {e}")
+
+def prune_store(store):
+    """Aplica a retenção em camadas aos snapshots e remove os blocos sem referência"""
+    print("\n🧹 Limpando snapshots antigos...")
+    
+    removed = store.prune(SNAPSHOT_RETENTION)
+    for snapshot_id in removed:
+        print(f"🗑️  Snapshot removido: {snapshot_id}")
+    
+    chunks, freed = store.gc()
+    print(f"✅ {len(removed)} snapshots e {chunks} blocos removidos ({freed / 1024 / 1024:.1f} MB liberados)")
+
+def cleanup_old_backups(base_dir, prefix='backup_supabase_', max_folders=MAX_BACKUP_FOLDERS):
+    """Remove backups antigos para economizar espaço (max_folders=None: só pela idade)"""
     print("\n🧹 Limpando backups antigos...")
     
     backup_folders = []
     
     # Encontrar todas as pastas de backup
     for item in os.listdir(base_dir):
-        if item.startswith('backup_supabase_') and os.path.isdir(os.path.join(base_dir, item)):
+        if item.startswith(prefix) and os.path.isdir(os.path.join(base_dir, item)):
             folder_path = os.path.join(base_dir, item)
             folder_time = os.path.getctime(folder_path)
             backup_folders.append((folder_path, folder_time))
@@ -108,7 +130,8 @@ def cleanup_old_backups(base_dir):
         folder_date = datetime.fromtimestamp(folder_time)
         
         # Remover se for muito antigo OU se exceder o limite máximo
-        if folder_date < cutoff_date or len(backup_folders) - removed_count > MAX_BACKUP_FOLDERS:
+        too_many = max_folders is not None and len(backup_folders) - removed_count > max_folders
+        if folder_date < cutoff_date or too_many:
             try:
                 shutil.rmtree(folder_path)
                 print(f"🗑️  Removido: {os.path.basename(folder_path)}")
@@ -122,25 +145,25 @@ def cleanup_old_backups(base_dir):
         print(f"✅ {removed_count} backups antigos removidos")
 
 def get_database_stats():
-    """Obtém estatísticas do banco de dados"""
-    stats = {}
+    """
+    Obtém estatísticas do banco de dados: contagem (HEAD com count=exact, sem
+    baixar as linhas) e último updated_at de cada tabela, consultadas em paralelo
+    """
     tables = ['clients', 'contracts', 'payments']
-    
-    for table in tables:
-        data = make_supabase_request('GET', table, {'select': '*', 'limit': '10000'})
-        stats[table] = len(data) if data else 0
-    
-    return stats
+    return table_stats(get_client(SUPABASE_URL, SUPABASE_ANON_KEY), tables, max_columns=['updated_at'])
 
-def create_backup_report(backup_dir, stats, backup_type="full"):
+def create_backup_report(backup_dir, stats, backup_type="full", last_updated=None, snapshot=None):
     """Cria relatório detalhado do backup"""
     report = {
         'timestamp': datetime.now().isoformat(),
         'backup_type': backup_type,
+        'snapshot': snapshot,
         'database_stats': stats,
+        'last_updated': last_updated or {},
         'backup_location': backup_dir,
         'supabase_url': SUPABASE_URL,
         'retention_policy': f"{BACKUP_RETENTION_DAYS} dias",
+        'snapshot_retention': SNAPSHOT_RETENTION,
         'max_backups': MAX_BACKUP_FOLDERS
     }
     
@@ -156,44 +179,71 @@ def main():
     print(f"🕒 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     base_dir = "/Users/insitutoareluna/Documents/finance/importBD"
+    state = BackupState(os.path.join(base_dir, BACKUP_STATE_FILE))
+    full_backup = state.full_due(FULL_BACKUP_INTERVAL_HOURS)
     
     # Criar diretório de backup
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_dir = os.path.join(base_dir, f"backup_supabase_{timestamp}")
+    prefix = "backup_supabase_" if full_backup else "backup_incremental_"
+    backup_dir = os.path.join(base_dir, f"{prefix}{timestamp}")
     os.makedirs(backup_dir, exist_ok=True)
     
     print(f"📁 Diretório de backup: {backup_dir}")
     
     # Obter estatísticas do banco
     print("\n📊 Coletando estatísticas do banco...")
-    stats = get_database_stats()
-    
-    for table, count in stats.items():
-        print(f"   • {table}: {count:,} registros")
+    table_info = get_database_stats()
+    stats = {table: info['count'] or 0 for table, info in table_info.items()}
+    last_updated = {table: info.get('max', {}).get('updated_at') for table, info in table_info.items()}
     
-    # Executar backup completo
-    print("\n🚀 Executando backup completo...")
-    os.system(f"cd {base_dir} && python3 backup_supabase.py")
+    for table, info in table_info.items():
+        if 'error' in info:
+            print(f"   • {table}: erro ao contar ({info['error']})")
+        else:
+            print(f"   • {table}: {stats[table]:,} registros (última atualização: {last_updated[table] or '-'})")
     
-    # Mover arquivos para o diretório organizado
-    latest_backup = None
-    for item in os.listdir(base_dir):
-        if item.startswith('backup_supabase_') and os.path.isdir(os.path.join(base_dir, item)):
-            item_path = os.path.join(base_dir, item)
-            if latest_backup is None or os.path.getctime(item_path) > os.path.getctime(latest_backup):
-                latest_backup = item_path
+    if full_backup:
+        # Marcas d'água antes do backup completo: o que mudar durante ele entra no próximo incremental
+        client = get_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+        for table in table_info:
+            try:
+                init_watermark(client, table, state)
+            except Exception as e:
+                print(f"⚠️  Marca d'água de '{table}' não definida: {e}")
+        
+        # Executar backup completo: snapshot no repositório deduplicado (só os blocos que mudaram são gravados)
+        print("\n🚀 Executando backup completo...")
+        store = BackupStore(os.path.join(base_dir, BACKUP_STORE_DIR))
+        snapshot = create_snapshot(store, client, list(table_info))
+        seed_snapshot_ids(store, snapshot, state)
+        if snapshot['status'] == 'completed':
+            state.mark_full()
+        state.save()
+        latest_backup = backup_dir
+        
+        # Retenção em camadas e remoção dos blocos que nenhum snapshot usa mais
+        prune_store(store)
+    else:
+        # Executar backup incremental (só o que mudou desde a última execução)
+        print("\n🚀 Executando backup incremental...")
+        new_records = create_incremental_backup(backup_dir, state)
+        print(f"📊 {new_records:,} registros novos/alterados")
+        latest_backup = backup_dir
     
     # Criar relatório
     if latest_backup:
-        report_file = create_backup_report(latest_backup, stats)
+        report_file = create_backup_report(latest_backup, stats, backup_type="full" if full_backup else "incremental",
+                                           last_updated=last_updated,
+                                           snapshot=snapshot['id'] if full_backup else None)
         print(f"📋 Relatório criado: {os.path.basename(report_file)}")
     
-    # Limpeza de backups antigos
+    # Limpeza de backups antigos (incrementais: só pela idade)
     cleanup_old_backups(base_dir)
+    cleanup_old_backups(base_dir, prefix='backup_incremental_', max_folders=None)
     
     print("\n✅ Sistema de backup executado com sucesso!")
     print(f"📦 Backup salvo em: {latest_backup}")
     print(f"📊 Total de registros: {sum(stats.values()):,}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
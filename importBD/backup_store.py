@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Repositório de backups deduplicado (endereçado por conteúdo), com retenção em camadas
+
+Cada backup completo em pasta própria repete quase tudo do anterior. Aqui as
+tabelas são guardadas em blocos de linhas ("chunks") nomeados pelo SHA-256 do
+conteúdo, e um snapshot é só um manifesto com a lista de blocos de cada tabela:
+- um bloco que já existe no repositório não é gravado de novo, então um snapshot
+  novo só grava os blocos que mudaram
+- os cortes entre blocos dependem do id da linha (crc32(id) % CHUNK_AVG_ROWS),
+  não da posição: uma linha inserida ou alterada muda só o bloco dela, e os
+  vizinhos continuam iguais aos do snapshot anterior
+- retenção em camadas (prune): mantém o snapshot completo mais recente de cada
+  uma das últimas N horas, dias, semanas e meses; o completo mais recente nunca
+  sai, e os parciais (com tabela que falhou) só ficam enquanto forem mais novos
+- coleta de lixo (gc): remove os blocos que nenhum snapshot usa mais
+
+Estrutura (dentro de path):
+    chunks/ab/abcdef...   linhas em JSON (uma por linha, chaves ordenadas), gzip
+    snapshots/<id>.json   {"id", "created_at", "tables": {tabela: {"rows",
+                           "chunks": [[sha256, linhas], ...]}}}
+
+Blocos e manifestos são gravados em arquivo temporário e renomeados: um snapshot
+interrompido não deixa nada pela metade, só blocos sem referência (que o gc
+remove). O gc não toca em blocos recentes (gc_grace), que podem ser de um
+snapshot ainda em andamento.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from parallel_backup import backup_concurrency
+from supabase_client import SupabaseClient
+from table_reader import iter_rows
+
+CHUNK_AVG_ROWS = 1024   # Tamanho médio dos blocos (em linhas)
+CHUNK_MAX_ROWS = 8192   # Corte forçado: nenhum bloco passa disso
+GC_GRACE_SECONDS = 3600
+
+# Chave do período de cada camada de retenção
+RETENTION_TIERS = {
+    'hourly': lambda created: created.strftime('%Y-%m-%d %H'),
+    'daily': lambda created: created.date(),
+    'weekly': lambda created: created.isocalendar()[:2],
+    'monthly': lambda created: (created.year, created.month),
+}
+DEFAULT_RETENTION = {'hourly': 24, 'daily': 14, 'weekly': 8, 'monthly': 12}
+
+
+def _is_boundary(row: Dict[str, Any]) -> bool:
+    return zlib.crc32(str(row.get('id')).encode('utf-8')) % CHUNK_AVG_ROWS == 0
+
+
+def _encode(rows: Sequence[Dict[str, Any]]) -> bytes:
+    return ''.join(json.dumps(row, sort_keys=True, ensure_ascii=False, separators=(',', ':')) + '\n'
+                   for row in rows).encode('utf-8')
+
+
+def select_retained(snapshots: Sequence[Tuple[str, datetime, str]], policy: Mapping[str, int]) -> Set[str]:
+    """
+    ids dos snapshots (id, criação, status) mantidos por policy ({camada: quantidade},
+    ex.: {'daily': 14}): em cada camada, o completo mais recente de cada um dos últimos
+    N períodos com snapshot completo. Um parcial (alguma tabela falhou) não ocupa a vaga
+    de um completo: só fica enquanto for mais recente que o último completo
+    """
+    ordered = sorted(snapshots, key=lambda item: item[1], reverse=True)
+    completed = [(snapshot_id, created) for snapshot_id, created, status in ordered if status == 'completed']
+    latest = completed[0][1] if completed else None
+    retained = {snapshot_id for snapshot_id, created, _ in ordered if latest is None or created > latest}
+    if completed:
+        retained.add(completed[0][0])
+    for tier, limit in policy.items():
+        if tier not in RETENTION_TIERS:
+            raise ValueError(f"Camada de retenção deve ser uma de {', '.join(RETENTION_TIERS)}: {tier}")
+        periods = set()
+        for snapshot_id, created in completed:
+            period = RETENTION_TIERS[tier](created)
+            if period in periods:
+                continue
+            if len(periods) >= limit:
+                break
+            periods.add(period)
+            retained.add(snapshot_id)
+    return retained
+
+
+class BackupStore:
+    """Repositório de blocos e snapshots em path"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.chunks_dir = os.path.join(path, 'chunks')
+        self.snapshots_dir = os.path.join(path, 'snapshots')
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------ blocos
+
+    def chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _put_chunk(self, data: bytes) -> Tuple[str, int]:
+        """Grava o bloco se ainda não existir. Devolve (sha256, bytes gravados)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            # Reaproveitado: renova a data para o gc não removê-lo durante este snapshot
+            os.utime(path)
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(gzip.compress(data, mtime=0))
+        os.replace(temporary, path)
+        return digest, os.path.getsize(path)
+
+    def read_chunk(self, digest: str, verify: bool = True) -> bytes:
+        with open(self.chunk_path(digest), 'rb') as f:
+            data = gzip.decompress(f.read())
+        if verify and hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Bloco {digest} corrompido (SHA-256 diferente do nome)")
+        return data
+
+    # ------------------------------------------------------------------ snapshots
+
+    def _backup_table(self, client: SupabaseClient, table: str) -> Dict[str, Any]:
+        chunks: List[List[Any]] = []
+        stats = {'rows': 0, 'new_chunks': 0, 'new_bytes': 0}
+        pending: List[Dict[str, Any]] = []
+
+        def flush():
+            digest, written = self._put_chunk(_encode(pending))
+            chunks.append([digest, len(pending)])
+            stats['new_chunks'] += 1 if written else 0
+            stats['new_bytes'] += written
+            pending.clear()
+
+        for row in iter_rows(client, table, prefetch=False):
+            pending.append(row)
+            stats['rows'] += 1
+            if _is_boundary(row) or len(pending) >= CHUNK_MAX_ROWS:
+                flush()
+        if pending:
+            flush()
+        return {'rows': stats['rows'], 'chunks': chunks,
+                'new_chunks': stats['new_chunks'], 'new_bytes': stats['new_bytes']}
+
+    def create_snapshot(self, client: SupabaseClient, tables: Sequence[str],
+                        concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Lê tables (em paralelo, até BACKUP_CONCURRENCY leituras) e grava o snapshot. Uma tabela
+        com erro fica com 'error' no manifesto e o snapshot com status 'partial'
+        """
+        created = datetime.now()
+        snapshot = {'id': created.strftime('%Y%m%dT%H%M%S'), 'created_at': created.isoformat(),
+                    'status': 'completed', 'tables': {}}
+        workers = min(concurrency or backup_concurrency(), client.pool_size, max(len(tables), 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {table: executor.submit(self._backup_table, client, table) for table in tables}
+            for table, future in futures.items():
+                try:
+                    snapshot['tables'][table] = future.result()
+                except Exception as e:
+                    snapshot['tables'][table] = {'error': str(e)}
+                    snapshot['status'] = 'partial'
+
+        path = os.path.join(self.snapshots_dir, f"{snapshot['id']}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+        os.replace(temporary, path)
+        return snapshot
+
+    def snapshot_ids(self) -> List[str]:
+        """ids dos snapshots, do mais antigo ao mais recente"""
+        return sorted(name[:-len('.json')] for name in os.listdir(self.snapshots_dir) if name.endswith('.json'))
+
+    def load_snapshot(self, snapshot_id: str) -> Dict[str, Any]:
+        with open(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_rows(self, snapshot_id: str, table: str, verify: bool = True) -> Iterator[Dict[str, Any]]:
+        """Linhas de table no snapshot, em ordem de id (para restaurar ou exportar)"""
+        for digest, _ in self.load_snapshot(snapshot_id)['tables'][table].get('chunks', []):
+            for line in self.read_chunk(digest, verify).decode('utf-8').splitlines():
+                yield json.loads(line)
+
+    def verify_snapshot(self, snapshot_id: str, checksums: bool = False) -> List[str]:
+        """Blocos do snapshot ausentes (ou corrompidos, com checksums=True)"""
+        problems = []
+        for table, entry in self.load_snapshot(snapshot_id)['tables'].items():
+            for digest, _ in entry.get('chunks', []):
+                if not os.path.exists(self.chunk_path(digest)):
+                    problems.append(f"{table}: bloco {digest} não encontrado")
+                elif checksums:
+                    try:
+                        self.read_chunk(digest)
+                    except (ValueError, OSError) as e:
+                        problems.append(f"{table}: {e}")
+        return problems
+
+    # ------------------------------------------------------------------ retenção
+
+    def prune(self, policy: Optional[Mapping[str, int]] = None, dry_run: bool = False) -> List[str]:
+        """Remove os snapshots fora da política de retenção. Devolve os ids removidos"""
+        snapshots = []
+        for snapshot_id in self.snapshot_ids():
+            snapshot = self.load_snapshot(snapshot_id)
+            snapshots.append((snapshot_id, datetime.fromisoformat(snapshot['created_at']),
+                              snapshot.get('status', 'completed')))
+        retained = select_retained(snapshots, policy or DEFAULT_RETENTION)
+        removed = [snapshot_id for snapshot_id, _, _ in snapshots if snapshot_id not in retained]
+        if not dry_run:
+            for snapshot_id in removed:
+                os.remove(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+        return removed
+
+    def gc(self, grace: float = GC_GRACE_SECONDS, dry_run: bool = False) -> Tuple[int, int]:
+        """
+        Remove os blocos sem referência em nenhum snapshot (e mais antigos que grace
+        segundos). Devolve (blocos removidos, bytes liberados)
+        """
+        referenced = set()
+        for snapshot_id in self.snapshot_ids():
+            for entry in self.load_snapshot(snapshot_id)['tables'].values():
+                referenced.update(digest for digest, _ in entry.get('chunks', []))
+
+        cutoff = time.time() - grace
+        removed = freed = 0
+        for prefix in os.listdir(self.chunks_dir):
+            directory = os.path.join(self.chunks_dir, prefix)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                # Temporários de um snapshot interrompido também saem depois do prazo
+                if name in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                freed += os.path.getsize(path)
+                removed += 1
+                if not dry_run:
+                    os.remove(path)
+        return removed, freed
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gravação de backups compactados (CSV gzip/zstd ou Parquet) com manifesto
+
+As páginas lidas do Supabase vão direto para o arquivo compactado, sem montar a
+tabela na memória. Ao fechar cada arquivo ficam registrados no manifesto
+(manifest.json do diretório do backup):
+- colunas e tipos (tipos JSON observados no CSV; tipos Arrow no Parquet)
+- número de linhas
+- tamanho em bytes e SHA-256 do arquivo gravado (calculados durante a escrita)
+
+verify_backup confere um diretório pelo manifesto: existência e tamanho dos
+arquivos (rápido) e, com checksums=True, o SHA-256 - sem descompactar nem
+interpretar nada.
+
+Formatos (BACKUP_FORMAT, padrão csv.gz):
+- csv.gz: biblioteca padrão; arquivos determinísticos (sem data no cabeçalho gzip)
+- csv.zst: exige zstandard (menor e mais rápido que gzip)
+- parquet: exige pyarrow; colunar, com compressão zstd
+- csv: sem compressão
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from import_journal import file_sha256
+
+try:
+    import zstandard
+except ImportError:  # dependência opcional
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dependência opcional
+    pa = None
+
+FORMAT_ENV = 'BACKUP_FORMAT'
+FORMATS = ('csv', 'csv.gz', 'csv.zst', 'parquet')
+DEFAULT_FORMAT = 'csv.gz'
+MANIFEST_FILE = 'manifest.json'
+# Linhas acumuladas por row group do Parquet (páginas de 1000 linhas dariam row groups pequenos demais)
+PARQUET_ROW_GROUP_ROWS = 50000
+# Linhas seguradas na memória esperando um valor nas colunas que só têm nulos
+PARQUET_SCHEMA_MAX_ROWS = 4 * PARQUET_ROW_GROUP_ROWS
+
+
+def backup_format(fmt: Optional[str] = None) -> str:
+    """Formato escolhido (ou BACKUP_FORMAT), validando as dependências opcionais"""
+    fmt = (fmt or os.getenv(FORMAT_ENV, '').strip().lower() or DEFAULT_FORMAT)
+    if fmt not in FORMATS:
+        raise ValueError(f"{FORMAT_ENV} deve ser um de {', '.join(FORMATS)}: {fmt}")
+    if fmt == 'csv.zst' and zstandard is None:
+        raise ImportError("O formato csv.zst exige o pacote zstandard (pip install zstandard)")
+    if fmt == 'parquet' and pa is None:
+        raise ImportError("O formato parquet exige o pacote pyarrow (pip install pyarrow)")
+    return fmt
+
+
+def _json_type(value: Any) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, (dict, list)):
+        return 'json'
+    return 'string'
+
+
+class _HashingWriter(io.RawIOBase):
+    """Arquivo binário que calcula SHA-256 e tamanho do que é gravado"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.sha256.update(data)
+        self.bytes += len(data)
+        self.raw.write(data)
+        return len(data)
+
+    def flush(self):
+        self.raw.flush()
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self.raw.close()
+
+
+class TableBackupWriter:
+    """
+    Grava as linhas de uma tabela em directory/<name>.<formato>, página a página.
+    close() devolve a entrada do manifesto (None se nenhuma linha foi gravada)
+    """
+
+    def __init__(self, directory: str, name: str, fmt: Optional[str] = None):
+        self.format = backup_format(fmt)
+        self.name = name
+        self.filename = f"{name}.{self.format}"
+        self.path = os.path.join(directory, self.filename)
+        self.rows = 0
+        self.columns: Optional[List[str]] = None
+        self._types: Dict[str, set] = {}
+        self._file: Optional[_HashingWriter] = None
+        self._stream = None  # compressor (csv.gz/csv.zst)
+        self._text = None
+        self._writer = None  # csv.DictWriter ou pq.ParquetWriter
+        self._schema = None
+        self._text_columns: set = set()  # colunas sem valor na inferência, gravadas como texto
+        self._pending: List[Dict[str, Any]] = []
+
+    def _open(self, first_row: Dict[str, Any]):
+        self.columns = list(first_row.keys())
+        self._file = _HashingWriter(open(self.path, 'wb'))
+        if self.format == 'parquet':
+            return
+        if self.format == 'csv.gz':
+            self._stream = gzip.GzipFile(filename='', mode='wb', fileobj=self._file, mtime=0)
+        elif self.format == 'csv.zst':
+            self._stream = zstandard.ZstdCompressor(level=10).stream_writer(self._file, closefd=False)
+        else:
+            self._stream = self._file
+        self._text = io.TextIOWrapper(self._stream, encoding='utf-8', newline='', write_through=True)
+        self._writer = csv.DictWriter(self._text, fieldnames=self.columns)
+        self._writer.writeheader()
+
+    def write_rows(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            if self._file is None:
+                self._open(row)
+            # Objetos/listas (jsonb) vão como texto JSON nos dois formatos
+            record = {key: json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                      for key, value in row.items()}
+            if self.format == 'parquet':
+                self._pending.append(record)
+                if len(self._pending) % PARQUET_ROW_GROUP_ROWS == 0:
+                    self._flush_parquet()
+            else:
+                for key, value in row.items():
+                    self._types.setdefault(key, set()).add(_json_type(value))
+                self._writer.writerow(record)
+            self.rows += 1
+
+    def _flush_parquet(self, final: bool = False):
+        if not self._pending:
+            return
+        if self._schema is None:
+            inferred = pa.Table.from_pylist(self._pending).schema
+            # Coluna só com nulos até aqui ainda não tem tipo: os blocos ficam na memória
+            # até aparecer um valor (ou até PARQUET_SCHEMA_MAX_ROWS linhas / fim da tabela)
+            if (not final and len(self._pending) < PARQUET_SCHEMA_MAX_ROWS
+                    and any(pa.types.is_null(field.type) for field in inferred)):
+                return
+            # JSON não distingue inteiro de numeric, então números viram float64;
+            # colunas que continuam só com nulos viram texto (valores que aparecerem depois
+            # são gravados como texto JSON, em vez de derrubar o backup)
+            fields = []
+            for field in inferred:
+                if pa.types.is_null(field.type):
+                    field = field.with_type(pa.string())
+                    self._text_columns.add(field.name)
+                elif pa.types.is_integer(field.type):
+                    field = field.with_type(pa.float64())
+                fields.append(field)
+            self._schema = pa.schema(fields)
+            self._writer = pq.ParquetWriter(self._file, self._schema, compression='zstd')
+        rows = self._pending
+        if self._text_columns:
+            rows = [{key: json.dumps(value, ensure_ascii=False)
+                     if key in self._text_columns and value is not None and not isinstance(value, str) else value
+                     for key, value in row.items()} for row in rows]
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self._schema))
+        self._pending = []
+
+    def close(self) -> Optional[Dict[str, Any]]:
+        if self._file is None:
+            return None
+        if self.format == 'parquet':
+            self._flush_parquet(final=True)
+            self._writer.close()
+            schema = [{'name': field.name, 'type': str(field.type)} for field in self._schema]
+        else:
+            self._text.flush()
+            self._text.detach()
+            if self._stream is not self._file:
+                self._stream.close()
+            schema = [{'name': column, 'type': '|'.join(sorted(self._types.get(column, {'null'})))}
+                      for column in self.columns]
+        self._file.close()
+        return {
+            'file': self.filename,
+            'format': self.format,
+            'rows': self.rows,
+            'bytes': self._file.bytes,
+            'sha256': self._file.sha256.hexdigest(),
+            'columns': schema,
+        }
+
+    def abort(self):
+        """Descarta o arquivo incompleto (erro no meio da leitura)"""
+        try:
+            if self._file is not None:
+                self._file.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def write_manifest(directory: str, files: Dict[str, Optional[Dict[str, Any]]],
+                   extra: Optional[Dict[str, Any]] = None) -> str:
+    """Grava directory/manifest.json com uma entrada por tabela (None: tabela vazia)"""
+    tables = {name: entry or {'file': None, 'rows': 0} for name, entry in files.items()}
+    manifest = {
+        'created_at': datetime.now().isoformat(),
+        'tables': tables,
+        'total_rows': sum(entry['rows'] for entry in tables.values()),
+        'total_bytes': sum(entry.get('bytes', 0) for entry in tables.values()),
+    }
+    manifest.update(extra or {})
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def verify_backup(directory: str, checksums: bool = False) -> List[str]:
+    """
+    Confere os arquivos do manifesto: existência e tamanho (e SHA-256 com checksums=True).
+    Devolve a lista de problemas encontrados (vazia se estiver tudo certo)
+    """
+    with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    problems = []
+    for table, table_entry in manifest['tables'].items():
+        # Tabelas divididas em faixas (parallel_backup) têm um arquivo por faixa em parts
+        for entry in table_entry.get('parts', [table_entry]):
+            if not entry.get('file'):
+                continue
+            path = os.path.join(directory, entry['file'])
+            if not os.path.exists(path):
+                problems.append(f"{table}: arquivo {entry['file']} não encontrado")
+            elif os.path.getsize(path) != entry['bytes']:
+                problems.append(f"{table}: tamanho de {entry['file']} ({os.path.getsize(path)}) "
+                                f"diferente do manifesto ({entry['bytes']})")
+            elif checksums and file_sha256(path) != entry['sha256']:
+                problems.append(f"{table}: SHA-256 de {entry['file']} diferente do manifesto")
+    return problems
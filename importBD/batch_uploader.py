@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Envio concorrente de lotes para o Supabase, com limite de lotes em andamento
+
+Os importadores enviavam um lote de 100 linhas por vez, esperando cada resposta:
+o tempo total era quase só latência de rede. Aqui até max_in_flight lotes ficam
+em andamento ao mesmo tempo (threads, compartilhando o pool do supabase_client):
+- backpressure: o próximo lote só é montado/enviado quando há vaga, então a
+  memória não cresce com o tamanho da importação
+- o progresso é reportado na ordem dos lotes, mesmo que terminem fora de ordem
+- sucessos e falhas são somados por lote e por linha em um UploadSummary
+- com bisect=True, um lote recusado pelo servidor por causa dos dados (400,
+  409, 413, 422) é dividido ao meio e reenviado até isolar as linhas ruins: as
+  boas são gravadas e as recusadas voltam em BatchResult.rejected, com o erro
+
+A concorrência padrão vem de SUPABASE_UPLOAD_CONCURRENCY (padrão: 4).
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from supabase_client import SupabaseHTTPError
+
+CONCURRENCY_ENV = 'SUPABASE_UPLOAD_CONCURRENCY'
+DEFAULT_CONCURRENCY = 4
+
+# Recusas causadas pelo conteúdo do lote (o insert em lote do PostgREST é uma
+# transação só: uma linha inválida derruba o lote inteiro). 401/403/404 valem
+# para qualquer linha, e dividir o lote não adianta
+BISECT_STATUSES = frozenset({400, 409, 413, 422})
+
+
+def upload_concurrency() -> int:
+    """Lotes simultâneos configurados em SUPABASE_UPLOAD_CONCURRENCY"""
+    value = os.getenv(CONCURRENCY_ENV, '').strip()
+    if not value:
+        return DEFAULT_CONCURRENCY
+    concurrency = int(value)
+    if concurrency <= 0:
+        raise ValueError(f"{CONCURRENCY_ENV} deve ser positivo: {value}")
+    return concurrency
+
+
+# (linha, status HTTP, erro) de cada linha recusada
+RejectedRow = Tuple[Any, Optional[int], str]
+
+
+class BatchResult(NamedTuple):
+    number: int  # 1, 2, ... na ordem de envio
+    rows: int
+    success: bool
+    status: Optional[int] = None  # status HTTP da falha, se houver
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    rejected: Tuple[RejectedRow, ...] = ()  # linhas isoladas pela bisseção (as demais foram gravadas)
+
+    @property
+    def committed_rows(self) -> int:
+        """Linhas do lote gravadas no banco"""
+        if self.success:
+            return self.rows
+        return self.rows - len(self.rejected) if self.rejected else 0
+
+
+class UploadSummary:
+    """Resultado agregado de uma importação em lotes"""
+
+    def __init__(self):
+        self.results: List[BatchResult] = []
+        self.succeeded_rows = 0
+        self.failed_rows = 0
+        self.elapsed = 0.0
+
+    def add(self, result: BatchResult):
+        self.results.append(result)
+        self.succeeded_rows += result.committed_rows
+        self.failed_rows += result.rows - result.committed_rows
+
+    @property
+    def succeeded_batches(self) -> int:
+        return sum(1 for result in self.results if result.success)
+
+    @property
+    def failures(self) -> List[BatchResult]:
+        return [result for result in self.results if not result.success]
+
+
+def _bisect(batch: Sequence[Any], send: Callable[[Sequence[Any]], Any],
+            error: SupabaseHTTPError) -> List[RejectedRow]:
+    """
+    Reenvia as metades de um lote recusado até isolar as linhas recusadas.
+    Com uma linha ruim em 100, são cerca de 2*log2(100) = 14 requisições.
+    Só recusas de conteúdo (BISECT_STATUSES) viram linhas recusadas; qualquer outra
+    falha (5xx/429 após as retentativas, rede) é levantada, e o lote inteiro fica
+    como falha, para ser reenviado numa retomada em vez de ir para o dead letter
+    """
+    if len(batch) == 1:
+        return [(batch[0], error.status, error.text)]
+    rejected: List[RejectedRow] = []
+    middle = len(batch) // 2
+    for half in (batch[:middle], batch[middle:]):
+        try:
+            send(half)
+        except SupabaseHTTPError as e:
+            if e.status not in BISECT_STATUSES:
+                raise
+            rejected.extend(_bisect(half, send, e))
+    return rejected
+
+
+def _send_batch(number: int, batch: Sequence[Any], send: Callable[[Sequence[Any]], Any],
+                bisect: bool = False) -> BatchResult:
+    """
+    Executa send(batch); qualquer exceção vira uma falha do lote (as demais continuam)
+    """
+    start = time.perf_counter()
+    try:
+        send(batch)
+    except SupabaseHTTPError as e:
+        if bisect and e.status in BISECT_STATUSES and len(batch) > 1:
+            try:
+                rejected = _bisect(batch, send, e)
+            except SupabaseHTTPError as failure:
+                return BatchResult(number, len(batch), False, failure.status, failure.text,
+                                   time.perf_counter() - start)
+            except Exception as failure:
+                return BatchResult(number, len(batch), False, None, str(failure), time.perf_counter() - start)
+            if rejected:
+                return BatchResult(number, len(batch), False, e.status, e.text,
+                                   time.perf_counter() - start, tuple(rejected))
+            # As metades passaram (recusa que não se repetiu)
+            return BatchResult(number, len(batch), True, elapsed=time.perf_counter() - start)
+        return BatchResult(number, len(batch), False, e.status, e.text, time.perf_counter() - start)
+    except Exception as e:
+        return BatchResult(number, len(batch), False, None, str(e), time.perf_counter() - start)
+    return BatchResult(number, len(batch), True, elapsed=time.perf_counter() - start)
+
+
+def upload_batches(batches: Iterable[Any], send: Callable[[Sequence[Any]], Any],
+                   max_in_flight: Optional[int] = None,
+                   on_result: Optional[Callable[[BatchResult], None]] = None,
+                   numbered: bool = False, bisect: bool = False) -> UploadSummary:
+    """
+    Envia os lotes com até max_in_flight requisições simultâneas.
+    send(batch) deve levantar exceção em caso de falha.
+    Com numbered=True, batches produz pares (número, lote) (ex.: retomada, em que
+    alguns números são pulados); senão os lotes são numerados 1, 2, 3, ...
+    on_result é chamado na ordem de envio, na thread que chamou upload_batches.
+    bisect liga a divisão de lotes recusados (ver BISECT_STATUSES)
+    """
+    max_in_flight = max_in_flight or upload_concurrency()
+    summary = UploadSummary()
+    completed: Dict[int, BatchResult] = {}
+    positions: Dict[Future, int] = {}
+    next_position = 0
+    start = time.perf_counter()
+
+    def collect(done: Iterable[Future]):
+        nonlocal next_position
+        for future in done:
+            completed[positions.pop(future)] = future.result()
+        # Reporta só a sequência contígua já concluída, para manter a ordem
+        while next_position in completed:
+            result = completed.pop(next_position)
+            summary.add(result)
+            if on_result is not None:
+                on_result(result)
+            next_position += 1
+
+    items = batches if numbered else enumerate(batches, 1)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight: Set[Future] = set()
+        for position, (number, batch) in enumerate(items):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(_send_batch, number, batch, send, bisect)
+            positions[future] = position
+            in_flight.add(future)
+        collect(wait(in_flight).done)
+
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+
+def chunked(rows: Sequence[Any], batch_size: int) -> Iterable[Sequence[Any]]:
+    """Fatias consecutivas de batch_size linhas"""
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos conversores da planilha de contratos com dados sintéticos
+
+Gera planilhas "Contratos Ativos" sintéticas (contratos x meses configuráveis, com
+células sujas como 'ß', '#NAME?', '0,00', '-1.534,37' e nomes repetidos) e mede
+cada conversor em vários tamanhos: tempo, contratos/s e pico de memória.
+
+Cada execução roda em um processo próprio, num diretório temporário com uma
+cópia limpa dos dados, para que o pico de memória de um conversor não contamine
+o do seguinte e as saídas de um não sirvam de entrada para outro.
+
+Uso:
+    python benchmark_converters.py --sizes 1000x24,5000x36 --json bench.json
+    python benchmark_converters.py --baseline bench.json --tolerance 0.2
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+INPUT_FILE = 'contratosAtivosFinal.csv'
+# csv_converter.py lê a exportação com o nome da aba
+CONVERTER_INPUT_FILE = 'contratosAtivosFinal - Contratos Ativos.csv'
+CONTRACTS_FILE = 'contracts.csv'
+
+# Conversor -> arquivo de pagamentos gerado (usado para contar as parcelas)
+CONVERTERS = {
+    'csv_converter': 'payments.csv',
+    'csv_converter_payments': 'payments.csv',
+    'rebuild_payments': 'payments_rebuilt.csv',
+    'generate_payments_csv': 'payments.csv',
+    'PaymentsGenerator': 'payments.csv',
+}
+
+DEFAULT_SIZES = '500x24,2000x36,5000x48'
+
+MONTHS = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez']
+LEADING_COLUMNS = [
+    'Nome', 'Local', 'Contrato', 'N', 'Área', 'Gestora', 'Médico - Contrato', 'Método',
+    'Início', 'Fim', 'Parcelas', 'Total', ' Entrada ', ' Comp I ', ' Comp II ', 'Valor de Parcela'
+]
+
+
+def format_money(value):
+    """Valor no formato europeu da planilha (-1.534,37)"""
+    text = f"{abs(value):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    return f"-{text}" if value < 0 else text
+
+
+def month_headers(months, start_year=23, start_month=2):
+    """Cabeçalhos de mês como na planilha ('mar./23', ...)"""
+    headers = []
+    year, month = start_year, start_month
+    for _ in range(months):
+        headers.append(f"{MONTHS[month]}./{year:02d}")
+        month += 1
+        if month == 12:
+            month, year = 0, year + 1
+    return headers
+
+
+def random_cell(rng):
+    """Célula de parcela: vazia, paga (negativa), pendente ou suja"""
+    p = rng.random()
+    if p < 0.45:
+        return ''
+    if p < 0.70:
+        return format_money(-rng.uniform(100, 2500))
+    if p < 0.88:
+        return format_money(rng.uniform(100, 2500))
+    if p < 0.92:
+        return '0,00'
+    if p < 0.95:
+        return 'ß'
+    if p < 0.97:
+        return '#NAME?'
+    return f" € {format_money(rng.uniform(10, 999))} "
+
+
+def generate_spreadsheet(directory, contracts, months, seed=42, duplicate_rate=0.05):
+    """
+    Grava a planilha sintética e o contracts.csv correspondente (external_id -> id)
+    em directory. Retorna o caminho da planilha
+    """
+    rng = random.Random(seed)
+    path = os.path.join(directory, INPUT_FILE)
+
+    with open(path, 'w', newline='', encoding='utf-8') as f, \
+            open(os.path.join(directory, CONTRACTS_FILE), 'w', newline='', encoding='utf-8') as m:
+        writer = csv.writer(f)
+        mapping = csv.writer(m)
+        writer.writerow(LEADING_COLUMNS + month_headers(months))
+        mapping.writerow(['id', 'external_id'])
+
+        for i in range(contracts):
+            # Nomes repetidos (mesmo cliente com outro contrato, ou linha duplicada)
+            if i and rng.random() < duplicate_rate:
+                name = f"CLIENTE {rng.randrange(i)} SILVA"
+            else:
+                name = f"CLIENTE {i} SILVA"
+            contract = str(rng.choice([i, i, rng.randrange(max(i, 1))]))
+            row = [
+                name, 'Lisboa', contract, str(i), 'Ortodontia', 'Gestora', 'Dr. Exemplo',
+                rng.choice(['MB', 'TB', 'DD', '']),
+                f"2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", '2026-12-31',
+                str(months), format_money(rng.uniform(1000, 25000)),
+                rng.choice(['', format_money(500), '0,00']),
+                rng.choice(['', '', f" € {format_money(300)} ", 'ß']),
+                rng.choice(['', '', format_money(1200), '#NAME?']),
+                format_money(rng.uniform(50, 800)),
+            ]
+            row.extend(random_cell(rng) for _ in range(months))
+            writer.writerow(row)
+            mapping.writerow([f"00000000-0000-4000-8000-{i:012d}", f"{name}_{contract}"])
+
+    shutil.copyfile(path, os.path.join(directory, CONVERTER_INPUT_FILE))
+    return path
+
+
+def peak_memory_mb():
+    """Pico de memória residente do processo atual (ru_maxrss é KB no Linux, bytes no macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def load_converter(name):
+    """
+    Importa o conversor e retorna a função que o executa no diretório atual
+    (a importação fica fora da medição)
+    """
+    sys.path.insert(0, SCRIPT_DIR)
+
+    if name == 'csv_converter':
+        import csv_converter
+        return csv_converter.main
+    if name == 'csv_converter_payments':
+        import csv_converter_payments
+        return csv_converter_payments.main
+    if name == 'rebuild_payments':
+        import rebuild_payments
+        return rebuild_payments.process_payments
+    if name == 'generate_payments_csv':
+        import generate_payments_csv
+        return generate_payments_csv.main
+    if name == 'PaymentsGenerator':
+        from generate_payments_from_contratos import PaymentsGenerator
+
+        def run():
+            # Sem a confirmação interativa de main()
+            generator = PaymentsGenerator()
+            generator.load_contract_mapping(CONTRACTS_FILE)
+            payments = generator.process_contratos_file(INPUT_FILE)
+            generator.save_payments_csv(payments, 'payments.csv')
+        return run
+    raise ValueError(f"Conversor desconhecido: {name}")
+
+
+def run_one(name):
+    """
+    Modo do processo filho: roda o conversor com a saída suprimida e imprime
+    a medição em JSON na última linha
+    """
+    converter = load_converter(name)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        converter()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    result = {
+        'wall_s': time.perf_counter() - wall_start,
+        'cpu_s': time.process_time() - cpu_start,
+        'peak_mb': peak_memory_mb(),
+    }
+    print(json.dumps(result))
+
+
+def count_rows(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8') as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+def measure(name, data_dir, contracts):
+    """Roda um conversor num processo novo, sobre uma cópia dos dados"""
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as work_dir:
+        for file_name in os.listdir(data_dir):
+            shutil.copyfile(os.path.join(data_dir, file_name), os.path.join(work_dir, file_name))
+
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-one', name],
+            cwd=work_dir, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True
+        )
+        if completed.returncode != 0:
+            return {'converter': name, 'error': completed.stderr.strip().splitlines()[-1:]}
+
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        result.update(
+            converter=name,
+            contracts=contracts,
+            payments=count_rows(os.path.join(work_dir, CONVERTERS[name])),
+            rows_per_s=contracts / result['wall_s'] if result['wall_s'] else 0.0,
+        )
+        return result
+
+
+def parse_sizes(text):
+    """'1000x24,5000x36' -> [(1000, 24), (5000, 36)]"""
+    sizes = []
+    for item in text.split(','):
+        contracts, months = item.lower().split('x')
+        sizes.append((int(contracts), int(months)))
+    return sizes
+
+
+def print_report(results):
+    print(f"\n{'conversor':<24} {'tamanho':>10} {'tempo (s)':>10} {'cpu (s)':>9} "
+          f"{'contratos/s':>12} {'parcelas':>10} {'pico (MB)':>10}")
+    print('-' * 91)
+    for r in results:
+        size = f"{r['contracts']}x{r['months']}"
+        if 'error' in r:
+            print(f"{r['converter']:<24} {size:>10}  ERRO: {' '.join(r['error'])}")
+            continue
+        print(f"{r['converter']:<24} {size:>10} {r['wall_s']:>10.2f} {r['cpu_s']:>9.2f} "
+              f"{r['rows_per_s']:>12,.0f} {r['payments']:>10,} {r['peak_mb']:>10.1f}")
+
+
+def compare_baseline(results, baseline_file, tolerance):
+    """
+    Compara com um relatório anterior; retorna as regressões (mais lento ou mais
+    memória do que baseline * (1 + tolerance))
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = {(r['converter'], r['contracts'], r['months']): r
+                    for r in json.load(f)['results'] if 'error' not in r}
+
+    regressions = []
+    for r in results:
+        before = baseline.get((r['converter'], r['contracts'], r['months']))
+        if before is None or 'error' in r:
+            continue
+        for metric in ('wall_s', 'peak_mb'):
+            if r[metric] > before[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{r['converter']} {r['contracts']}x{r['months']}: {metric} "
+                    f"{before[metric]:.2f} -> {r[metric]:.2f}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos conversores com planilhas sintéticas')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'tamanhos contratosxmeses separados por vírgula (padrão: {DEFAULT_SIZES})')
+    parser.add_argument('--converters', default=','.join(CONVERTERS),
+                        help='conversores a medir, separados por vírgula')
+    parser.add_argument('--seed', type=int, default=42, help='semente dos dados sintéticos')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help='fração de nomes repetidos')
+    parser.add_argument('--json', help='grava o relatório neste arquivo')
+    parser.add_argument('--baseline', help='relatório anterior para detectar regressões')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='piora aceita em relação ao baseline (padrão: 0.25 = 25%%)')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args.run_one)
+        return 0
+
+    converters = [name.strip() for name in args.converters.split(',') if name.strip()]
+    unknown = [name for name in converters if name not in CONVERTERS]
+    if unknown:
+        parser.error(f"conversores desconhecidos: {', '.join(unknown)}")
+
+    results = []
+    for contracts, months in parse_sizes(args.sizes):
+        with tempfile.TemporaryDirectory(prefix='bench_data_') as data_dir:
+            print(f"Gerando planilha sintética: {contracts} contratos x {months} meses...")
+            generate_spreadsheet(data_dir, contracts, months, args.seed, args.duplicate_rate)
+            for name in converters:
+                print(f"  {name}...")
+                result = measure(name, data_dir, contracts)
+                result.update(contracts=contracts, months=months)
+                results.append(result)
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"\nRelatório salvo em {args.json}")
+
+    if args.baseline:
+        regressions = compare_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\n⚠️  Regressões em relação ao baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print("\n✅ Nenhuma regressão em relação ao baseline")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
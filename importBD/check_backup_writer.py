@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Verificação do backup_writer com dados sintéticos (sem acesso ao Supabase)
+
+Grava tabelas em um diretório temporário e relê os arquivos, conferindo:
+- coluna nula nas primeiras linhas e preenchida depois (ex.: amount None e
+  depois 10.5): o Parquet fica com o tipo do valor, sem perder linhas
+- coluna nula por mais de PARQUET_SCHEMA_MAX_ROWS linhas: vira texto e os
+  valores que aparecem depois são gravados como texto, sem derrubar o backup
+- CSV gzip: mesmas linhas na releitura e manifesto conferido por verify_backup
+
+Uso:
+    python check_backup_writer.py
+"""
+
+import csv
+import gzip
+import io
+import sys
+import tempfile
+
+import backup_writer
+from backup_writer import TableBackupWriter, verify_backup, write_manifest
+
+
+def _write(directory, name, fmt, rows, page_size=7):
+    writer = TableBackupWriter(directory, name, fmt)
+    for start in range(0, len(rows), page_size):
+        writer.write_rows(rows[start:start + page_size])
+    return writer.close()
+
+
+def check_parquet_late_values(directory):
+    import pyarrow.parquet as pq
+
+    rows = [{'id': f'{i:04d}', 'amount': None if i < 30 else 10.5 + i} for i in range(60)]
+    entry = _write(directory, 'late_values', 'parquet', rows)
+    table = pq.read_table(f"{directory}/{entry['file']}")
+    assert table.num_rows == 60, table.num_rows
+    assert str(table.schema.field('amount').type) == 'double', table.schema
+    assert table.column('amount').to_pylist() == [row['amount'] for row in rows]
+    return entry
+
+
+def check_parquet_null_beyond_limit(directory):
+    import pyarrow.parquet as pq
+
+    rows = [{'id': f'{i:04d}', 'paid_date': None if i < 50 else '2024-01-01', 'amount': None if i < 55 else 1.5}
+            for i in range(60)]
+    entry = _write(directory, 'null_beyond_limit', 'parquet', rows)
+    table = pq.read_table(f"{directory}/{entry['file']}")
+    assert table.num_rows == 60, table.num_rows
+    assert table.column('paid_date').to_pylist()[50:] == ['2024-01-01'] * 10
+    assert table.column('amount').to_pylist()[55:] == ['1.5'] * 5
+    return entry
+
+
+def check_csv_roundtrip(directory):
+    rows = [{'id': f'{i:04d}', 'name': f'cliente {i}', 'meta': {'n': i} if i % 3 == 0 else None} for i in range(25)]
+    entry = _write(directory, 'roundtrip', 'csv.gz', rows)
+    with gzip.open(f"{directory}/{entry['file']}", 'rb') as f:
+        read = list(csv.DictReader(io.TextIOWrapper(f, encoding='utf-8', newline='')))
+    assert [row['id'] for row in read] == [row['id'] for row in rows]
+    assert read[3]['meta'] == '{"n": 3}', read[3]
+    return entry
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        files = {'roundtrip': check_csv_roundtrip(directory)}
+        if backup_writer.pa is None:
+            print("⚠️  pyarrow não instalado: verificações do Parquet puladas")
+        else:
+            files['late_values'] = check_parquet_late_values(directory)
+            # Limites pequenos para exercitar a inferência adiada com poucas linhas
+            backup_writer.PARQUET_ROW_GROUP_ROWS, backup_writer.PARQUET_SCHEMA_MAX_ROWS = 10, 40
+            files['null_beyond_limit'] = check_parquet_null_beyond_limit(directory)
+        write_manifest(directory, files)
+        problems = verify_backup(directory, checksums=True)
+        assert not problems, problems
+    print(f"✅ {len(files)} verificações do backup_writer concluídas")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
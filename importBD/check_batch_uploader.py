@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Verificação da bisseção de lotes do batch_uploader (sem acesso ao Supabase)
+
+Envia lotes de pagamentos por import_payments_batch com um cliente falso no
+lugar do Supabase, conferindo:
+- um pagamento recusado (400) em 100: os outros 99 são gravados e ele volta
+  em rejected, para o dead letter
+- metade do lote sem contrato mapeado (pagamentos agrupados por contrato): a
+  metade vazia não derruba a bisseção e o pagamento recusado é isolado
+- falha que não é de conteúdo (503) durante a bisseção: o lote inteiro fica
+  como falha, sem linhas recusadas (volta na retomada, não no dead letter)
+
+Uso:
+    python check_batch_uploader.py
+"""
+
+import sys
+
+import import_payments_supabase
+from batch_uploader import _send_batch
+from supabase_client import SupabaseHTTPError
+
+
+class FakeClient:
+    """post recusa lotes com algum external_id em fail (status) e guarda os gravados"""
+
+    def __init__(self, fail):
+        self.fail = fail
+        self.stored = []
+
+    def post(self, endpoint, data=None, headers=None):
+        for payment in data:
+            status = self.fail.get(payment['external_id'])
+            if status:
+                raise SupabaseHTTPError(status, 'Erro', b'{"message": "recusado"}', 'POST', f'/rest/v1/{endpoint}')
+        self.stored.extend(payment['external_id'] for payment in data)
+
+
+def _payments(unmapped_from=None):
+    return [{'id': f'p{i:03d}', 'contract_id': 'sem-contrato' if unmapped_from is not None and i >= unmapped_from
+             else 'c1', 'amount': 10.0, 'status': 'pending'} for i in range(100)]
+
+
+def _send(payments, fail):
+    client = FakeClient(fail)
+    import_payments_supabase.get_supabase = lambda: client
+    mapping = {'c1': 'uuid-c1'}
+    result = _send_batch(1, payments, lambda batch: import_payments_supabase.import_payments_batch(batch, mapping),
+                         bisect=True)
+    return result, client
+
+
+def check_rejected_row():
+    result, client = _send(_payments(), {'p003': 400})
+    assert [row['id'] for row, _, _ in result.rejected] == ['p003'], result
+    assert result.committed_rows == 99 and len(client.stored) == 99, result
+
+
+def check_unmapped_half():
+    result, client = _send(_payments(unmapped_from=50), {'p003': 400})
+    assert [row['id'] for row, _, _ in result.rejected] == ['p003'], result
+    assert result.status == 400, result
+    assert sorted(client.stored) == [f'p{i:03d}' for i in range(50) if i != 3], client.stored
+
+
+def check_server_error():
+    result, _ = _send(_payments(), {'p003': 400, 'p080': 503})
+    assert not result.success and not result.rejected and result.status == 503, result
+    assert result.committed_rows == 0, result
+
+
+def main():
+    checks = [check_rejected_row, check_unmapped_half, check_server_error]
+    for check in checks:
+        check()
+    print(f"✅ {len(checks)} verificações da bisseção concluídas")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
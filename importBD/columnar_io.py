@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Saída colunar tipada (Parquet / Arrow IPC) para clients, contracts e payments
+
+Os geradores gravam CSV e todos os scripts seguintes relêem tudo como texto,
+convertendo valores e datas de novo a cada leitura. Com CONTRATOS_TABLE_FORMAT=parquet
+(ou arrow) as tabelas intermediárias também são gravadas em formato colunar, ao lado
+do CSV, com tipos reais: valores em float64, datas em date32 e status/payment_type
+como categorias.
+Os loaders leem esse arquivo diretamente (Arrow IPC é lido por memory map, sem cópia).
+
+O formato padrão continua sendo CSV. pyarrow é uma dependência opcional, exigida
+apenas quando um formato colunar é escolhido.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # dependência opcional
+    pa = None
+
+# Variável de ambiente com o formato das tabelas intermediárias: csv, parquet ou arrow
+TABLE_FORMAT_ENV = 'CONTRATOS_TABLE_FORMAT'
+TABLE_FORMATS = ('csv', 'parquet', 'arrow')
+_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Tipos de cada tabela (colunas ausentes no arquivo são ignoradas)
+TABLE_SCHEMAS = {
+    'clients': {
+        'numeric': (),
+        'dates': ('birth_date',),
+        'categories': ('country', 'status'),
+    },
+    'contracts': {
+        'numeric': ('value', 'total_amount', 'installment_amount', 'down_payment'),
+        'dates': ('start_date', 'end_date'),
+        'categories': ('status', 'payment_frequency'),
+    },
+    'payments': {
+        'numeric': ('amount',),
+        'dates': ('due_date', 'paid_date', 'payment_date'),
+        'categories': ('status', 'payment_type', 'payment_method'),
+    },
+}
+
+
+def table_format() -> str:
+    """Formato configurado em CONTRATOS_TABLE_FORMAT (padrão: csv)"""
+    fmt = os.getenv(TABLE_FORMAT_ENV, 'csv').strip().lower() or 'csv'
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"{TABLE_FORMAT_ENV} inválido: {fmt} (use {', '.join(TABLE_FORMATS)})")
+    if fmt != 'csv' and pa is None:
+        raise RuntimeError(f"{TABLE_FORMAT_ENV}={fmt} requer o pacote pyarrow (pip install pyarrow)")
+    return fmt
+
+
+def table_path(csv_path: str, fmt: str) -> str:
+    """Caminho do arquivo no formato pedido (payments.csv -> payments.parquet)"""
+    if fmt == 'csv':
+        return csv_path
+    return os.path.splitext(csv_path)[0] + _EXTENSIONS[fmt]
+
+
+def _parse_dates(values: pd.Series):
+    """(texto sem brancos, datas); datas inválidas viram NaT"""
+    text = values.astype('string').str.strip()
+    text = text.mask(text == '')
+    return text, pd.to_datetime(text, errors='coerce', format='ISO8601')
+
+
+def _is_date_column(values: pd.Series) -> bool:
+    """Se todos os valores preenchidos são datas ISO"""
+    text, parsed = _parse_dates(values)
+    return not (parsed.isna() & text.notna()).any()
+
+
+def _date_column(values: pd.Series) -> pd.Series:
+    """
+    Converte para datas; se algum valor preenchido não for uma data ISO,
+    a coluna é mantida como texto para não perder informação
+    """
+    text, parsed = _parse_dates(values)
+    if (parsed.isna() & text.notna()).any():
+        return values
+    return parsed.dt.normalize()
+
+
+def typed_frame(df: pd.DataFrame, table: str, text_dates: Sequence[str] = (),
+                categories: Optional[Dict[str, Sequence[str]]] = None) -> pd.DataFrame:
+    """
+    Aplica os tipos da tabela a um DataFrame lido/gerado como texto.
+    text_dates e categories fixam os tipos decididos para o arquivo inteiro quando o
+    DataFrame é só um bloco dele (convert_csv): colunas de data mantidas como texto e
+    o conjunto de categorias de cada coluna
+    """
+    schema = TABLE_SCHEMAS[table]
+    categories = categories or {}
+    typed = df.copy()
+    for column in schema['numeric']:
+        if column in typed.columns:
+            typed[column] = pd.to_numeric(typed[column], errors='coerce').astype('float64')
+    for column in schema['dates']:
+        if column in typed.columns and column not in text_dates:
+            typed[column] = _date_column(typed[column])
+    for column in schema['categories']:
+        if column in typed.columns:
+            values = typed[column].astype('string').fillna('')
+            typed[column] = (pd.Categorical(values, categories=categories[column]) if column in categories
+                             else values.astype('category'))
+    return typed
+
+
+def _arrow_table(df: pd.DataFrame) -> 'pa.Table':
+    """Tabela Arrow com datas gravadas como date32 (sem hora)"""
+    arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+    for index, field in enumerate(arrow_table.schema):
+        if pa.types.is_timestamp(field.type):
+            arrow_table = arrow_table.set_column(index, field.name, arrow_table.column(index).cast(pa.date32()))
+    return arrow_table
+
+
+def write_table(df: pd.DataFrame, csv_path: str, table: str, fmt: Optional[str] = None) -> Optional[str]:
+    """
+    Grava o CSV (exatamente como DataFrame.to_csv) e, se configurado, a versão
+    colunar tipada. Retorna o caminho do arquivo colunar (None se o formato for csv)
+    """
+    fmt = fmt or table_format()
+    df.to_csv(csv_path, index=False)
+    if fmt == 'csv':
+        return None
+
+    path = table_path(csv_path, fmt)
+    arrow_table = _arrow_table(typed_frame(df, table))
+    if fmt == 'parquet':
+        pq.write_table(arrow_table, path)
+    else:
+        feather.write_feather(arrow_table, path, compression='uncompressed')
+    return path
+
+
+def _file_types(csv_path: str, table: str, chunksize: int):
+    """
+    Primeira leitura (só das colunas de data e categoria) para decidir os tipos do
+    arquivo inteiro: datas que ficam como texto e as categorias de cada coluna
+    """
+    schema = TABLE_SCHEMAS[table]
+    header = pd.read_csv(csv_path, dtype=str, nrows=0).columns
+    dates = [column for column in schema['dates'] if column in header]
+    category_columns = [column for column in schema['categories'] if column in header]
+    text_dates = set()
+    values: Dict[str, set] = {column: set() for column in category_columns}
+    if dates or category_columns:
+        with pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunksize,
+                         usecols=dates + category_columns) as reader:
+            for chunk in reader:
+                text_dates.update(column for column in dates
+                                  if column not in text_dates and not _is_date_column(chunk[column]))
+                for column in category_columns:
+                    values[column].update(chunk[column].unique())
+    return text_dates, {column: sorted(found) for column, found in values.items()}
+
+
+def convert_csv(csv_path: str, table: str, fmt: Optional[str] = None, chunksize: int = 50000) -> Optional[str]:
+    """
+    Gera a versão colunar de um CSV já gravado (usado após a escrita em stream),
+    em blocos para manter a memória limitada. Retorna None se o formato for csv
+    """
+    fmt = fmt or table_format()
+    if fmt == 'csv':
+        return None
+
+    # Tipos decididos para o arquivo inteiro: um bloco com uma data fora do padrão
+    # mais adiante não pode contradizer o esquema do primeiro
+    text_dates, categories = _file_types(csv_path, table, chunksize)
+
+    path = table_path(csv_path, fmt)
+    writer = None
+    schema = None
+    try:
+        with pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunksize) as reader:
+            for chunk in reader:
+                arrow_table = _arrow_table(typed_frame(chunk, table, text_dates, categories))
+                if writer is None:
+                    schema = arrow_table.schema
+                    writer = (pq.ParquetWriter(path, schema) if fmt == 'parquet'
+                              else pa.ipc.new_file(path, schema))
+                writer.write_table(arrow_table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
+
+
+def read_table(csv_path: str, table: str, columns: Optional[Sequence[str]] = None,
+               fmt: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lê uma tabela intermediária no formato configurado.
+    Formatos colunares voltam já tipados; CSV é lido como texto (como nos scripts antigos)
+    """
+    fmt = fmt or table_format()
+    path = table_path(csv_path, fmt)
+    if fmt == 'csv':
+        return pd.read_csv(path, dtype=str, keep_default_na=False, usecols=columns)
+    if fmt == 'parquet':
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def read_table_records(csv_path: str, table: str, fmt: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Linhas de uma tabela colunar no mesmo formato de csv.DictReader, exceto pelos
+    valores numéricos, que já vêm convertidos (float ou None): datas em ISO e
+    textos ausentes como ''
+    """
+    df = read_table(csv_path, table, fmt=fmt)
+    numeric = [column for column in TABLE_SCHEMAS[table]['numeric'] if column in df.columns]
+
+    records = []
+    for column in df.columns:
+        values = df[column]
+        if column in numeric:
+            converted = [None if pd.isna(value) else float(value) for value in values.tolist()]
+        else:
+            converted = ['' if value is None or value is pd.NaT or (isinstance(value, float) and pd.isna(value))
+                         else value.isoformat() if hasattr(value, 'isoformat') else str(value)
+                         for value in values.astype(object).tolist()]
+        records.append(converted)
+
+    return [dict(zip(df.columns, row)) for row in zip(*records)]
@@ -5,27 +5,22 @@ Script de conversão de CSV para importação no banco de dados
 Converte dados de contratos em três tabelas relacionais: clients, contracts e payments
 """
 
+import csv
+import numpy as np
 import pandas as pd
-import uuid
-import re
-from datetime import datetime, date
+from datetime import datetime
 import os
 from collections import defaultdict
 
+from columnar_io import convert_csv
+from monetary_parser import monetary_column, parse_monetary_series, parse_monetary_value
+import record_ids
+from spreadsheet_layout import chunk_size_from_env, compile_layout, read_spreadsheet_chunks
+
 def clean_currency_value(value):
-    """Limpa valores monetários e converte para float"""
-    if pd.isna(value) or value == '' or value == 'ß':
-        return 0.0
-    
-    # Remove símbolos de moeda, espaços e converte vírgulas para pontos
-    cleaned = str(value).replace('€', '').replace(' ', '').replace(',', '.')
-    # Remove parênteses (valores negativos)
-    cleaned = cleaned.replace('(', '').replace(')', '')
-    
-    try:
-        return float(cleaned)
-    except ValueError:
-        return 0.0
+    """Limpa valores monetários e converte para float (via monetary_parser)"""
+    amount = parse_monetary_value(value)
+    return 0.0 if amount is None else amount
 
 def is_valid_row(row):
     """Verifica se uma linha contém dados válidos suficientes"""
@@ -48,192 +43,213 @@ def clean_nan_value(value, default=''):
         return default
     return str(value).strip()
 
-def parse_date_column(date_str):
-    """Converte string de data do cabeçalho (ex: 'jan./24') para data"""
-    if pd.isna(date_str) or date_str == '':
-        return None
-    
-    # Mapear meses em português para números
-    month_map = {
-        'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
-        'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12,
-        'maio': 5  # Variação encontrada no CSV
-    }
-    
-    # Extrair mês e ano da string
-    match = re.match(r'([a-z]+)\.?/(\d+)', date_str.lower())
-    if match:
-        month_str, year_str = match.groups()
-        month = month_map.get(month_str)
-        if month:
-            # Assumir que anos de 2 dígitos são 20xx
-            year = int(year_str)
-            if year < 100:
-                year += 2000
-            return date(year, month, 1)
-    
-    return None
+# Colunas de cada tabela de saída, na ordem em que são gravadas
+CLIENT_COLUMNS = [
+    'id', 'first_name', 'last_name', 'email', 'phone', 'mobile', 'tax_id', 'birth_date',
+    'address', 'city', 'state', 'postal_code', 'country', 'status', 'notes', 'external_id',
+    'created_at', 'updated_at'
+]
+CONTRACT_COLUMNS = [
+    'id', 'client_id', 'contract_number', 'description', 'value', 'start_date', 'end_date',
+    'status', 'payment_frequency', 'notes', 'external_id', 'created_at', 'updated_at'
+]
+PAYMENT_COLUMNS = [
+    'id', 'contract_id', 'amount', 'due_date', 'paid_date', 'status', 'payment_method',
+    'notes', 'external_id', 'created_at', 'updated_at'
+]
 
-def generate_clients_csv(df):
-    """Gera arquivo clients.csv removendo duplicatas e filtrando dados inválidos"""
-    clients = []
-    seen_clients = set()
-    client_counter = defaultdict(int)
+class ContractsConverter:
+    """
+    Converte a planilha de contratos nas três tabelas numa única passagem:
+    cada linha é validada uma vez e gera seu cliente, contrato e parcelas,
+    gravados imediatamente nos CSVs de saída
+    """
     
-    # Filtrar linhas válidas
-    valid_rows = [row for _, row in df.iterrows() if is_valid_row(row)]
-    print(f"Filtradas {len(df) - len(valid_rows)} linhas inválidas")
+    def __init__(self, clients_writer, contracts_writer, payments_writer):
+        self.clients_writer = clients_writer
+        self.contracts_writer = contracts_writer
+        self.payments_writer = payments_writer
+        
+        self.client_map = {}  # nome -> client_id
+        self.contract_map = {}  # external_id -> contract_id
+        self.client_counter = defaultdict(int)
+        self.contract_counter = defaultdict(int)
+        self.payment_counter = 0
+        self.layout = None
+        
+        # Payments recebem external_id sequencial (únicos por construção), então
+        # só clients e contracts precisam guardar os ids já emitidos
+        self.external_ids = {'clients': set(), 'contracts': set()}
+        self.stats = {
+            'total_rows': 0,
+            'invalid_rows': 0,
+            'clients': 0,
+            'contracts': 0,
+            'payments': 0,
+            'duplicates': {'clients': 0, 'contracts': 0, 'payments': 0}
+        }
     
-    for row in valid_rows:
-        name = clean_nan_value(row.get('Nome', ''), '').strip()
-        if name and name not in seen_clients:
-            # Dividir nome em primeiro e último nome
-            name_parts = name.split()
-            first_name = name_parts[0] if name_parts else ''
-            last_name = ' '.join(name_parts[1:]) if len(name_parts) > 1 else ''
+    def process_dataframe(self, df):
+        """
+        Processa todas as linhas de um DataFrame da planilha. Pode ser chamado
+        bloco a bloco (modo streaming): mapeamentos e contadores são mantidos
+        """
+        # Papéis das colunas resolvidos no primeiro bloco; valores monetários de uma vez por bloco
+        if self.layout is None:
+            self.layout = compile_layout(df.columns)
+        layout = self.layout
+        payment_values = parse_monetary_series(layout.month_block(df))
+        
+        # Valor total de cada contrato (soma absoluta de todas as parcelas);
+        # se não houver parcelas, usar o valor total do CSV
+        installment_totals = np.nansum(payment_values.amounts, axis=1)
+        contract_totals = np.where(installment_totals != 0, installment_totals,
+                                   monetary_column(df, 'Total').to_numpy())
+        
+        for row_pos, row in enumerate(df.to_dict('records')):
+            self.stats['total_rows'] += 1
             
-            # Gerar external_id único com contador
-            client_counter[name] += 1
-            external_id = f"{name}_{client_counter[name]:03d}" if client_counter[name] > 1 else name
+            if not is_valid_row(row):
+                self.stats['invalid_rows'] += 1
+                continue
             
-            client = {
-                'id': str(uuid.uuid4()),
-                'first_name': first_name,
-                'last_name': last_name,
-                'email': '',  # Não disponível no CSV
-                'phone': '',  # Não disponível no CSV
-                'mobile': '',  # Não disponível no CSV
-                'tax_id': '',  # Não disponível no CSV
-                'birth_date': '',  # Não disponível no CSV
-                'address': '',  # Não disponível no CSV
-                'city': '',  # Não disponível no CSV
-                'state': '',  # Não disponível no CSV
-                'postal_code': '',  # Não disponível no CSV
-                'country': 'Portugal',  # Assumindo Portugal baseado na moeda
-                'status': 'active',
-                'notes': f"Local: {clean_nan_value(row.get('Local', ''))}, Área: {clean_nan_value(row.get('Área', ''))}",
-                'external_id': external_id,
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat()
-            }
-            clients.append(client)
-            seen_clients.add(name)
+            name = clean_nan_value(row.get('Nome', ''), '').strip()
+            self._emit_client(row, name)
+            contract_key = self._emit_contract(row, name, contract_totals[row_pos])
+            self._emit_payments(row, name, contract_key, layout, payment_values, row_pos)
     
-    return pd.DataFrame(clients)
-
-def generate_contracts_csv(df, clients_df):
-    """Gera arquivo contracts.csv com validações e external_id melhorado"""
-    contracts = []
-    contract_counter = defaultdict(int)
+    def _track_external_id(self, table, external_id):
+        if external_id in self.external_ids[table]:
+            self.stats['duplicates'][table] += 1
+        self.external_ids[table].add(external_id)
     
-    # Criar mapeamento de nome para client_id
-    client_map = dict(zip(clients_df['external_id'], clients_df['id']))
+    def _emit_client(self, row, name):
+        """Grava o cliente na primeira vez em que o nome aparece"""
+        if not name or name in self.client_map:
+            return
+        
+        # Dividir nome em primeiro e último nome
+        name_parts = name.split()
+        first_name = name_parts[0] if name_parts else ''
+        last_name = ' '.join(name_parts[1:]) if len(name_parts) > 1 else ''
+        
+        # Gerar external_id único com contador
+        self.client_counter[name] += 1
+        external_id = f"{name}_{self.client_counter[name]:03d}" if self.client_counter[name] > 1 else name
+        
+        client = {
+            'id': record_ids.client_id(external_id),
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': '',  # Não disponível no CSV
+            'phone': '',  # Não disponível no CSV
+            'mobile': '',  # Não disponível no CSV
+            'tax_id': '',  # Não disponível no CSV
+            'birth_date': '',  # Não disponível no CSV
+            'address': '',  # Não disponível no CSV
+            'city': '',  # Não disponível no CSV
+            'state': '',  # Não disponível no CSV
+            'postal_code': '',  # Não disponível no CSV
+            'country': 'Portugal',  # Assumindo Portugal baseado na moeda
+            'status': 'active',
+            'notes': f"Local: {clean_nan_value(row.get('Local', ''))}, Área: {clean_nan_value(row.get('Área', ''))}",
+            'external_id': external_id,
+            'created_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat()
+        }
+        self.clients_writer.writerow(client)
+        self.client_map[external_id] = client['id']
+        self.stats['clients'] += 1
+        self._track_external_id('clients', external_id)
     
-    # Filtrar linhas válidas
-    valid_rows = [row for _, row in df.iterrows() if is_valid_row(row)]
+    def _emit_contract(self, row, name, total_value):
+        """
+        Grava o contrato da linha, vinculado ao cliente pelo nome.
+        Retorna o external_id do contrato (None se o cliente não existir)
+        """
+        client_id = self.client_map.get(name)
+        if not client_id:
+            return None
+        
+        # Gerar external_id único para contrato
+        contract_number = clean_nan_value(row.get('N', ''), 'SEM_NUMERO')  # Coluna N tem o número do contrato
+        contract_status = clean_nan_value(row.get('Contrato', ''), 'Ativo')  # Coluna Contrato tem o status
+        contract_key = f"{name}_{contract_status}"
+        self.contract_counter[contract_key] += 1
+        external_id = f"{contract_key}_{self.contract_counter[contract_key]:03d}" if self.contract_counter[contract_key] > 1 else contract_key
+        
+        contract = {
+            'id': record_ids.contract_id(external_id),
+            'client_id': client_id,
+            'contract_number': contract_number,
+            'description': f"Contrato {clean_nan_value(row.get('Área', ''))} - {clean_nan_value(row.get('Método', ''))}",
+            'value': float(total_value),
+            'start_date': clean_nan_value(row.get('Início', '')),
+            'end_date': clean_nan_value(row.get('Fim', '')),
+            'status': 'active' if contract_status.lower() == 'ativo' else 'inactive',
+            'payment_frequency': 'monthly',
+            'notes': f"Gestora: {clean_nan_value(row.get('Gestora', ''))}, Médico: {clean_nan_value(row.get('Médico - Contrato', ''))}",
+            'external_id': external_id,
+            'created_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat()
+        }
+        self.contracts_writer.writerow(contract)
+        self.contract_map[external_id] = contract['id']
+        self.stats['contracts'] += 1
+        self._track_external_id('contracts', external_id)
+        return external_id
     
-    for row in valid_rows:
-        name = clean_nan_value(row.get('Nome', ''), '').strip()
-        client_id = client_map.get(name)
+    def _emit_payments(self, row, name, contract_key, layout, payment_values, row_pos):
+        """
+        Grava as parcelas da linha (uma por célula de mês preenchida).
+        contract_key é o external_id do contrato gerado pela própria linha, usado no ID das parcelas
+        """
+        contract_number = clean_nan_value(row.get('Contrato', ''), 'SEM_NUMERO')
+        lookup_key = f"{name}_{contract_number}"
+        contract_id = self.contract_map.get(lookup_key)
+        if not contract_id:
+            return
+        contract_key = contract_key or lookup_key
         
-        if client_id:
-            # Calcular valor total do contrato (soma absoluta de todas as parcelas)
-            total_value = 0.0
-            
-            # Encontrar colunas de parcelas (a partir da coluna 29)
-            payment_columns = df.columns[29:]  # Colunas de parcelas começam na posição 29
+        payment_method = clean_nan_value(row.get('Método', ''))
+        
+        for col_pos, month in enumerate(layout.months):
+            value = payment_values.amounts[row_pos, col_pos]
             
-            for col in payment_columns:
-                if col and not pd.isna(row[col]):
-                    value = clean_currency_value(row[col])
-                    total_value += abs(value)
+            # Pular vazios, inválidos e valores zero
+            if np.isnan(value) or value == 0:
+                continue
             
-            # Se não houver parcelas, usar o valor total do CSV
-            if total_value == 0:
-                total_value = clean_currency_value(row.get('Total', 0))
+            # Determinar status baseado no sinal do valor
+            is_negative = payment_values.negative[row_pos, col_pos]
+            status = 'paid' if is_negative else 'pending'
             
-            # Gerar external_id único para contrato
-            contract_number = clean_nan_value(row.get('N', ''), 'SEM_NUMERO')  # Coluna N tem o número do contrato
-            contract_status = clean_nan_value(row.get('Contrato', ''), 'Ativo')  # Coluna Contrato tem o status
-            contract_key = f"{name}_{contract_status}"
-            contract_counter[contract_key] += 1
-            external_id = f"{contract_key}_{contract_counter[contract_key]:03d}" if contract_counter[contract_key] > 1 else contract_key
+            # Gerar external_id único sequencial
+            self.payment_counter += 1
+            external_id = f"PAYMENT_{self.payment_counter:06d}"
             
-            contract = {
-                'id': str(uuid.uuid4()),
-                'client_id': client_id,
-                'contract_number': contract_number,
-                'description': f"Contrato {clean_nan_value(row.get('Área', ''))} - {clean_nan_value(row.get('Método', ''))}",
-                'value': total_value,
-                'start_date': clean_nan_value(row.get('Início', '')),
-                'end_date': clean_nan_value(row.get('Fim', '')),
-                'status': 'active' if contract_status.lower() == 'ativo' else 'inactive',
-                'payment_frequency': 'monthly',
-                'notes': f"Gestora: {clean_nan_value(row.get('Gestora', ''))}, Médico: {clean_nan_value(row.get('Médico - Contrato', ''))}",
+            payment = {
+                'id': record_ids.payment_id(contract_key, 'normalPayment', month.due_date),
+                'contract_id': contract_id,
+                'amount': float(value),
+                'due_date': month.due_date,
+                'paid_date': month.due_date if status == 'paid' else '',
+                'status': status,
+                'payment_method': payment_method,
+                'notes': f"Parcela {month.header}",
                 'external_id': external_id,
                 'created_at': datetime.now().isoformat(),
                 'updated_at': datetime.now().isoformat()
             }
-            contracts.append(contract)
-    
-    return pd.DataFrame(contracts)
+            self.payments_writer.writerow(payment)
+            self.stats['payments'] += 1
 
-def generate_payments_csv(df, contracts_df):
-    """Gera arquivo payments.csv com todas as parcelas e external_id único"""
-    payments = []
-    payment_counter = 0
-    
-    # Criar mapeamento de external_id para contract_id
-    contract_map = dict(zip(contracts_df['external_id'], contracts_df['id']))
-    
-    # Filtrar linhas válidas
-    valid_rows = [row for _, row in df.iterrows() if is_valid_row(row)]
-    
-    for row in valid_rows:
-        name = clean_nan_value(row.get('Nome', ''), '').strip()
-        contract_number = clean_nan_value(row.get('Contrato', ''), 'SEM_NUMERO')
-        contract_external_id = f"{name}_{contract_number}"
-        contract_id = contract_map.get(contract_external_id)
-        
-        if contract_id:
-            # Processar todas as colunas de parcelas (a partir da coluna 29)
-            payment_columns = df.columns[29:]
-            
-            for col in payment_columns:
-                if col and not pd.isna(row[col]) and str(row[col]).strip() != '':
-                    value = clean_currency_value(row[col])
-                    
-                    # Pular valores zero
-                    if value == 0:
-                        continue
-                    
-                    # Determinar status baseado no sinal do valor
-                    is_negative = str(row[col]).strip().startswith('(') or str(row[col]).strip().startswith('-')
-                    status = 'paid' if is_negative else 'pending'
-                    
-                    # Converter data da coluna
-                    due_date = parse_date_column(col)
-                    
-                    # Gerar external_id único sequencial
-                    payment_counter += 1
-                    external_id = f"PAYMENT_{payment_counter:06d}"
-                    
-                    payment = {
-                        'id': str(uuid.uuid4()),
-                        'contract_id': contract_id,
-                        'amount': abs(value),
-                        'due_date': due_date.isoformat() if due_date else '',
-                        'paid_date': due_date.isoformat() if status == 'paid' and due_date else '',
-                        'status': status,
-                        'payment_method': clean_nan_value(row.get('Método', '')),
-                        'notes': f"Parcela {col}",
-                        'external_id': external_id,
-                        'created_at': datetime.now().isoformat(),
-                        'updated_at': datetime.now().isoformat()
-                    }
-                    payments.append(payment)
-    
-    return pd.DataFrame(payments)
+def open_csv_writer(path, columns):
+    """Abre um CSV de saída para gravação em stream, já com o cabeçalho"""
+    f = open(path, 'w', newline='', encoding='utf-8')
+    writer = csv.DictWriter(f, fieldnames=columns, lineterminator='\n')
+    writer.writeheader()
+    return f, writer
 
 def main():
     """Função principal com validações e estatísticas melhoradas"""
@@ -244,47 +260,65 @@ def main():
         print(f"Erro: Arquivo {input_file} não encontrado!")
         return
     
-    print(f"Lendo arquivo {input_file}...")
-    df = pd.read_csv(input_file, encoding='utf-8')
-    
-    print(f"Processando {len(df)} registros totais...")
-    
-    # Contar linhas válidas
-    valid_rows = [row for _, row in df.iterrows() if is_valid_row(row)]
-    invalid_count = len(df) - len(valid_rows)
-    print(f"Encontradas {invalid_count} linhas inválidas que serão filtradas")
+    # Com CONTRATOS_CHUNK_SIZE definido, a planilha é lida em blocos (memória limitada)
+    chunksize = chunk_size_from_env()
     
-    # Gerar CSVs
-    print("\nGerando clients.csv...")
-    clients_df = generate_clients_csv(df)
-    clients_df.to_csv('clients.csv', index=False, encoding='utf-8')
-    print(f"Gerados {len(clients_df)} clientes únicos")
+    print(f"Lendo arquivo {input_file}...")
+    if chunksize:
+        print(f"Modo streaming: blocos de {chunksize} linhas")
+        chunks = read_spreadsheet_chunks(input_file, chunksize, encoding='utf-8')
+    else:
+        df = pd.read_csv(input_file, encoding='utf-8')
+        print(f"Processando {len(df)} registros totais...")
+        chunks = [df]
     
-    print("\nGerando contracts.csv...")
-    contracts_df = generate_contracts_csv(df, clients_df)
-    contracts_df.to_csv('contracts.csv', index=False, encoding='utf-8')
-    print(f"Gerados {len(contracts_df)} contratos")
+    # Gerar os três CSVs numa única passagem
+    print("\nGerando clients.csv, contracts.csv e payments.csv...")
+    clients_file, clients_writer = open_csv_writer('clients.csv', CLIENT_COLUMNS)
+    contracts_file, contracts_writer = open_csv_writer('contracts.csv', CONTRACT_COLUMNS)
+    payments_file, payments_writer = open_csv_writer('payments.csv', PAYMENT_COLUMNS)
+    try:
+        converter = ContractsConverter(clients_writer, contracts_writer, payments_writer)
+        for chunk in chunks:
+            converter.process_dataframe(chunk)
+    finally:
+        clients_file.close()
+        contracts_file.close()
+        payments_file.close()
     
-    print("\nGerando payments.csv...")
-    payments_df = generate_payments_csv(df, contracts_df)
-    payments_df.to_csv('payments.csv', index=False, encoding='utf-8')
-    print(f"Geradas {len(payments_df)} parcelas")
+    stats = converter.stats
+    if chunksize:
+        print(f"Processados {stats['total_rows']} registros totais")
+    print(f"Encontradas {stats['invalid_rows']} linhas inválidas que foram filtradas")
+    print(f"Gerados {stats['clients']} clientes únicos")
+    print(f"Gerados {stats['contracts']} contratos")
+    print(f"Geradas {stats['payments']} parcelas")
     
     # Verificar duplicatas de external_id
     print("\n=== Verificação de External IDs ===")
-    client_duplicates = clients_df['external_id'].duplicated().sum()
-    contract_duplicates = contracts_df['external_id'].duplicated().sum()
-    payment_duplicates = payments_df['external_id'].duplicated().sum()
+    client_duplicates = stats['duplicates']['clients']
+    contract_duplicates = stats['duplicates']['contracts']
+    payment_duplicates = stats['duplicates']['payments']
     
     print(f"Duplicatas de external_id em clients: {client_duplicates}")
     print(f"Duplicatas de external_id em contracts: {contract_duplicates}")
     print(f"Duplicatas de external_id em payments: {payment_duplicates}")
     
+    # Versão colunar tipada (CONTRATOS_TABLE_FORMAT=parquet/arrow)
+    columnar_files = [
+        convert_csv('clients.csv', 'clients'),
+        convert_csv('contracts.csv', 'contracts'),
+        convert_csv('payments.csv', 'payments')
+    ]
+    
     print("\n=== Conversão concluída com sucesso! ===")
     print("Arquivos gerados:")
     print("- clients.csv")
     print("- contracts.csv")
     print("- payments.csv")
+    for path in columnar_files:
+        if path:
+            print(f"- {path}")
     
     if client_duplicates == 0 and contract_duplicates == 0 and payment_duplicates == 0:
         print("\n✅ Nenhuma duplicata de external_id encontrada!")
@@ -292,4 +326,4 @@ def main():
         print("\n⚠️  Ainda existem duplicatas de external_id. Verifique os dados de origem.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
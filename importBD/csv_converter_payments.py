@@ -6,27 +6,20 @@ Converte dados de contratos em três tabelas relacionais: clients, contracts e p
 Versão modificada para gerar corretamente a planilha payments conforme instruções
 """
 
+import numpy as np
 import pandas as pd
 import uuid
-import re
-from datetime import datetime, date
+from datetime import datetime
 import os
 from collections import defaultdict
 
+from monetary_parser import monetary_column, parse_monetary_series, parse_monetary_value
+from spreadsheet_layout import compile_layout
+
 def clean_currency_value(value):
-    """Limpa valores monetários e converte para float"""
-    if pd.isna(value) or value == '' or value == 'ß':
-        return 0.0
-    
-    # Remove símbolos de moeda, espaços e converte vírgulas para pontos
-    cleaned = str(value).replace('€', '').replace(' ', '').replace(',', '.')
-    # Remove parênteses (valores negativos)
-    cleaned = cleaned.replace('(', '').replace(')', '')
-    
-    try:
-        return float(cleaned)
-    except ValueError:
-        return 0.0
+    """Limpa valores monetários e converte para float (via monetary_parser)"""
+    amount = parse_monetary_value(value)
+    return 0.0 if amount is None else amount
 
 def is_valid_row(row):
     """Verifica se uma linha contém dados válidos suficientes"""
@@ -49,32 +42,6 @@ def clean_nan_value(value, default=''):
         return default
     return str(value).strip()
 
-def parse_date_column(date_str):
-    """Converte string de data do cabeçalho (ex: 'jan./24') para data"""
-    if pd.isna(date_str) or date_str == '':
-        return None
-    
-    # Mapear meses em português para números
-    month_map = {
-        'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
-        'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12,
-        'maio': 5  # Variação encontrada no CSV
-    }
-    
-    # Extrair mês e ano da string
-    match = re.match(r'([a-z]+)\.?/(\d+)', date_str.lower())
-    if match:
-        month_str, year_str = match.groups()
-        month = month_map.get(month_str)
-        if month:
-            # Assumir que anos de 2 dígitos são 20xx
-            year = int(year_str)
-            if year < 100:
-                year += 2000
-            return date(year, month, 1)
-    
-    return None
-
 def generate_clients_csv(df):
     """Gera arquivo clients.csv removendo duplicatas e filtrando dados inválidos"""
     clients = []
@@ -124,6 +91,10 @@ def generate_contracts_csv(df, clients_df):
     # Criar mapeamento de nome para client_id
     client_map = dict(zip(clients_df['external_id'], clients_df['id']))
     
+    # Colunas monetárias convertidas de uma vez
+    total_amounts = monetary_column(df, 'Total')
+    installment_amounts = monetary_column(df, 'Valor de Parcela')
+    
     # Filtrar linhas válidas
     valid_rows = [row for _, row in df.iterrows() if is_valid_row(row)]
     
@@ -143,8 +114,8 @@ def generate_contracts_csv(df, clients_df):
                 'client_id': client_id,
                 'contract_number': contract_number,
                 'description': clean_nan_value(row.get('Descrição', '')),
-                'total_amount': clean_currency_value(row.get('Total', 0)),
-                'installment_amount': clean_currency_value(row.get('Valor de Parcela', 0)),
+                'total_amount': total_amounts[row.name],
+                'installment_amount': installment_amounts[row.name],
                 'start_date': clean_nan_value(row.get('Data Início', '')),
                 'end_date': clean_nan_value(row.get('Data Fim', '')),
                 'status': clean_nan_value(row.get('Status', 'active')),
@@ -166,6 +137,12 @@ def generate_payments_csv(df, contracts_df):
     # Criar mapeamento de external_id para contract_id
     contract_map = dict(zip(contracts_df['external_id'], contracts_df['id']))
     
+    # Valor total e parcelas (meses identificados no cabeçalho), convertidos
+    # de uma vez para todas as linhas
+    layout = compile_layout(df.columns)
+    total_amounts = monetary_column(df, 'Total')
+    payment_values = parse_monetary_series(layout.month_block(df))
+    
     # Filtrar linhas válidas
     valid_rows = [row for _, row in df.iterrows() if is_valid_row(row)]
     
@@ -176,54 +153,46 @@ def generate_payments_csv(df, contracts_df):
         contract_id = contract_map.get(contract_external_id)
         
         if contract_id:
-            # Obter valor total do contrato da coluna 12 (índice 11)
-            total_amount = clean_currency_value(row.iloc[11]) if len(row) > 11 else 0.0
+            row_pos = df.index.get_loc(row.name)
+            
+            # Obter valor total do contrato
+            total_amount = total_amounts[row.name]
             
-            # Processar parcelas a partir da coluna 20 (índice 19)
-            if len(row) > 19:  # Verificar se há colunas suficientes
-                # Começar da coluna 20 (índice 19)
-                for col_index in range(19, len(row)):
-                    col_name = df.columns[col_index] if col_index < len(df.columns) else f"Col_{col_index + 1}"
-                    value = row.iloc[col_index]
-                    
-                    if not pd.isna(value) and str(value).strip() != '':
-                        cleaned_value = clean_currency_value(value)
-                        
-                        # Pular valores zero
-                        if cleaned_value == 0:
-                            continue
-                        
-                        # Determinar status baseado no sinal do valor
-                        # Se negativo = paid, se positivo = pending
-                        original_str = str(value).strip()
-                        is_negative = original_str.startswith('(') or original_str.startswith('-') or cleaned_value < 0
-                        status = 'paid' if is_negative else 'pending'
-                        
-                        # Converter data da coluna
-                        due_date = parse_date_column(col_name)
-                        
-                        # Gerar external_id único sequencial
-                        payment_counter += 1
-                        external_id = f"PAYMENT_{payment_counter:06d}"
-                        
-                        # Calcular número da parcela (coluna 20 = parcela 1)
-                        installment_number = col_index - 18  # col_index 19 = parcela 1
-                        
-                        payment = {
-                            'id': str(uuid.uuid4()),
-                            'contract_id': contract_id,
-                            'amount': abs(cleaned_value),  # Sempre positivo
-                            'due_date': due_date.isoformat() if due_date else '',
-                            'paid_date': due_date.isoformat() if status == 'paid' and due_date else '',
-                            'status': status,
-                            'payment_method': clean_nan_value(row.get('Método', '')),
-                            'notes': f"Parcela {installment_number}",  # Número da parcela nas notes
-                            'external_id': external_id,
-                            'created_at': datetime.now().isoformat(),
-                            'updated_at': datetime.now().isoformat(),
-                            'payment_type': 'normal'  # Valor padrão conforme instruções
-                        }
-                        payments.append(payment)
+            # Processar parcelas (primeiro mês = parcela 1)
+            for offset, month in enumerate(layout.months):
+                cleaned_value = payment_values.amounts[row_pos, offset]
+                
+                # Pular vazios, inválidos e valores zero
+                if np.isnan(cleaned_value) or cleaned_value == 0:
+                    continue
+                
+                # Determinar status baseado no sinal do valor
+                # Se negativo = paid, se positivo = pending
+                is_negative = payment_values.negative[row_pos, offset]
+                status = 'paid' if is_negative else 'pending'
+                
+                # Gerar external_id único sequencial
+                payment_counter += 1
+                external_id = f"PAYMENT_{payment_counter:06d}"
+                
+                # Número da parcela pela ordem dos meses
+                installment_number = offset + 1
+                
+                payment = {
+                    'id': str(uuid.uuid4()),
+                    'contract_id': contract_id,
+                    'amount': abs(cleaned_value),  # Sempre positivo
+                    'due_date': month.due_date,
+                    'paid_date': month.due_date if status == 'paid' else '',
+                    'status': status,
+                    'payment_method': clean_nan_value(row.get('Método', '')),
+                    'notes': f"Parcela {installment_number}",  # Número da parcela nas notes
+                    'external_id': external_id,
+                    'created_at': datetime.now().isoformat(),
+                    'updated_at': datetime.now().isoformat(),
+                    'payment_type': 'normal'  # Valor padrão conforme instruções
+                }
+                payments.append(payment)
     
     return pd.DataFrame(payments)
 
@@ -285,8 +254,8 @@ def main():
     
     print("\n=== MODIFICAÇÕES APLICADAS ===")
     print("✅ Adicionada coluna payment_type com valor padrão 'normal'")
-    print("✅ Valor total do contrato obtido da coluna 12")
-    print("✅ Parcelas processadas a partir da coluna 20")
+    print("✅ Valor total do contrato obtido da coluna Total")
+    print("✅ Parcelas processadas a partir das colunas de mês do cabeçalho")
     print("✅ Status baseado no sinal: negativo = paid, positivo = pending")
     print("✅ Número da parcela registrado na coluna notes")
 
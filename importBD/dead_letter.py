@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CSV de "dead letter" com as linhas recusadas pelo Supabase em uma importação
+
+As linhas isoladas pela bisseção dos lotes (batch_uploader) são gravadas com as
+mesmas colunas da origem mais error_batch, error_status e error. Depois de
+corrigidas, podem ser reimportadas sem repetir a importação inteira.
+
+O arquivo só é criado se alguma linha for recusada.
+"""
+
+import csv
+from typing import Any, List, Optional
+
+from batch_uploader import BatchResult
+
+ERROR_COLUMNS = ['error_batch', 'error_status', 'error']
+
+
+class DeadLetterWriter:
+    """
+    Grava em path as linhas recusadas de cada BatchResult (chamado na ordem dos lotes)
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.append = append
+        self.count = 0
+        self._file = None
+        self._writer: Optional[csv.DictWriter] = None
+
+    def _open(self, first_row: Any):
+        fieldnames: List[str] = list(first_row.keys()) if isinstance(first_row, dict) else ['row']
+        new_file = True
+        if self.append:
+            try:
+                with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                    header = next(csv.reader(f), None)
+                if header:
+                    fieldnames = [name for name in header if name not in ERROR_COLUMNS]
+                    new_file = False
+            except FileNotFoundError:
+                pass
+        self._file = open(self.path, 'a' if not new_file else 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames + ERROR_COLUMNS, extrasaction='ignore')
+        if new_file:
+            self._writer.writeheader()
+
+    def write(self, result: BatchResult):
+        for row, status, error in result.rejected:
+            if self._writer is None:
+                self._open(row)
+            record = dict(row) if isinstance(row, dict) else {'row': row}
+            record.update(error_batch=result.number, error_status=status, error=error)
+            self._writer.writerow(record)
+            self.count += 1
+        if result.rejected:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coletor de erros agregado e limitado para os logs dos geradores
+
+Em vez de guardar um dict por célula inválida, os erros são contados por
+(tipo do erro, coluna) e cada grupo mantém só uma amostra de até sample_size
+exemplos. A memória e o tamanho do log ficam constantes, por mais suja que seja
+a planilha.
+
+A amostra é a dos sample_size erros com menor hash do conteúdo (bottom-k): é
+uniforme, e não depende da ordem de chegada. Por isso a soma dos coletores de
+várias faixas (merge) dá exatamente a mesma amostra de uma execução única,
+com qualquer número de processos.
+
+O detalhe completo (um erro por linha, em JSON lines) pode ser gravado em um
+arquivo à parte, em streaming, com detail_file.
+
+O tipo do erro é o campo 'kind', se existir, ou o texto de 'error' até o ':'
+("Valor inválido ou zero", "Contrato não encontrado no mapeamento", ...).
+"""
+
+import hashlib
+import heapq
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_SAMPLE_SIZE = 5
+
+BucketKey = Tuple[str, str]
+
+
+def error_kind(error: Dict[str, Any]) -> str:
+    return error.get('kind') or str(error.get('error', '')).split(':', 1)[0].strip()
+
+
+def _priority(error: Dict[str, Any], seed: int) -> int:
+    """Prioridade do erro na amostra: hash do conteúdo (empate só entre erros idênticos)"""
+    text = json.dumps(error, sort_keys=True, ensure_ascii=False, default=str)
+    return int.from_bytes(hashlib.blake2b(f"{seed}:{text}".encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class ErrorCollector:
+    """
+    Contagens por (tipo, coluna) com amostras limitadas por grupo
+    """
+
+    def __init__(self, sample_size: int = DEFAULT_SAMPLE_SIZE, detail_file: Optional[str] = None,
+                 keep_details: bool = False, seed: int = 0):
+        self.sample_size = sample_size
+        self.total = 0
+        self._counts: Dict[BucketKey, int] = {}
+        # Por grupo, heap (prioridade negada, ordem de chegada, erro) com os sample_size
+        # erros de menor prioridade: o topo é o de maior prioridade, o próximo a sair
+        self._samples: Dict[BucketKey, List[Tuple[int, int, Dict[str, Any]]]] = {}
+        self._added = 0
+        # Semente fixa: a mesma entrada gera o mesmo log
+        self.seed = seed
+        self.detail_file = detail_file
+        self._detail = open(detail_file, 'w', encoding='utf-8') if detail_file else None
+        # Sem arquivo próprio, os detalhes podem ser guardados para outro coletor
+        # gravar (faixas processadas em outros processos)
+        self.details: Optional[List[Dict[str, Any]]] = [] if keep_details else None
+
+    def add(self, error: Dict[str, Any]):
+        key = (error_kind(error), str(error.get('column', '')))
+        count = self._counts.get(key, 0) + 1
+        self._counts[key] = count
+        self.total += 1
+
+        self._sample(key, error)
+
+        if self._detail is not None:
+            self._detail.write(json.dumps(error, ensure_ascii=False) + '\n')
+        elif self.details is not None:
+            self.details.append(error)
+
+    def _sample(self, key: BucketKey, error: Dict[str, Any]):
+        if self.sample_size <= 0:
+            return
+        self._added += 1
+        entry = (-_priority(error, self.seed), self._added, error)
+        samples = self._samples.setdefault(key, [])
+        if len(samples) < self.sample_size:
+            heapq.heappush(samples, entry)
+        elif entry[0] > samples[0][0]:
+            heapq.heapreplace(samples, entry)
+
+    def _sample_list(self, key: BucketKey) -> List[Dict[str, Any]]:
+        """Amostra do grupo em ordem crescente de prioridade"""
+        return [error for _, _, error in sorted(self._samples.get(key, []), key=lambda entry: -entry[0])]
+
+    def extend(self, errors: Iterable[Dict[str, Any]]):
+        for error in errors:
+            self.add(error)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumo serializável em JSON: total e grupos em ordem decrescente de contagem"""
+        buckets = sorted(self._counts.items(), key=lambda item: (-item[1], item[0]))
+        summary = {
+            'total': self.total,
+            'sample_size': self.sample_size,
+            'by_kind': [
+                {'kind': kind, 'column': column, 'count': count, 'samples': self._sample_list((kind, column))}
+                for (kind, column), count in buckets
+            ]
+        }
+        if self.detail_file:
+            summary['detail_file'] = self.detail_file
+        return summary
+
+    def merge(self, summary: Dict[str, Any], details: Optional[Iterable[Dict[str, Any]]] = None):
+        """
+        Acumula o resumo de outro coletor (ex.: de uma faixa processada em outro
+        processo, com o mesmo sample_size e seed). Os menores hashes da união são os
+        menores hashes de cada lado, então a amostra é a mesma de um coletor único
+        """
+        for bucket in summary['by_kind']:
+            key = (bucket['kind'], bucket['column'])
+            for error in bucket['samples']:
+                self._sample(key, error)
+            self._counts[key] = self._counts.get(key, 0) + bucket['count']
+            self.total += bucket['count']
+
+        for error in details or ():
+            if self._detail is not None:
+                self._detail.write(json.dumps(error, ensure_ascii=False) + '\n')
+            elif self.details is not None:
+                self.details.append(error)
+
+    def close(self):
+        if self._detail is not None:
+            self._detail.close()
+            self._detail = None
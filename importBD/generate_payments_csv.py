@@ -2,8 +2,8 @@
 # -*- coding: utf-8 -*-
 """
 Script para gerar payments.csv com regras específicas:
-- Colunas 14-15: downPayment (sempre paid)
-- Colunas 20+: normalPayment (negativo=paid, positivo=pending)
+- Colunas Comp I / Comp II: downPayment (sempre paid)
+- Colunas de mês (ex.: 'mar./23'): normalPayment (negativo=paid, positivo=pending)
 """
 
 import csv
@@ -11,6 +11,8 @@ import uuid
 from datetime import datetime
 import re
 
+from spreadsheet_layout import compile_layout
+
 class PaymentsGenerator:
     def __init__(self):
         self.contracts_map = {}  # external_id -> contract_id
@@ -47,16 +49,27 @@ class PaymentsGenerator:
         
         with open(original_csv_file, 'r', encoding='utf-8') as f:
             reader = csv.reader(f)
-            headers = next(reader)  # Pula o cabeçalho
+            headers = next(reader)
+            
+            # Papéis das colunas resolvidos uma única vez a partir do cabeçalho
+            layout = compile_layout(headers)
+            name_pos = layout.position('Nome')
+            contract_pos = layout.position('Contrato')
+            comp1 = layout.down_payment('comp_i')
+            comp2 = layout.down_payment('comp_ii')
             
             payment_counter = 0
             
             for row_idx, row in enumerate(reader, 1):
-                if len(row) < 30:  # Verifica se há colunas suficientes
+                if not any(cell.strip() for cell in row):  # Ignora linhas vazias
                     continue
                 
-                client_name = row[0]
-                contract_number = row[2]
+                # Completa linhas mais curtas que o cabeçalho
+                if len(row) < len(layout.columns):
+                    row = row + [''] * (len(layout.columns) - len(row))
+                
+                client_name = row[name_pos]
+                contract_number = row[contract_pos]
                 external_id = f"{client_name}_{contract_number}"
                 
                 # Verifica se o contrato existe
@@ -66,8 +79,8 @@ class PaymentsGenerator:
                 
                 contract_id = self.contracts_map[external_id]
                 
-                # Processa entrada - Comp I (coluna 13, índice 13)
-                comp1_value = self.clean_currency_value(row[13]) if len(row) > 13 else 0.0
+                # Processa entrada - Comp I
+                comp1_value = self.clean_currency_value(row[comp1.position]) if comp1 else 0.0
                 if comp1_value > 0:
                     payment_counter += 1
                     payment = {
@@ -84,8 +97,8 @@ class PaymentsGenerator:
                     }
                     self.payments.append(payment)
                 
-                # Processa entrada - Comp II (coluna 14, índice 14)
-                comp2_value = self.clean_currency_value(row[14]) if len(row) > 14 else 0.0
+                # Processa entrada - Comp II
+                comp2_value = self.clean_currency_value(row[comp2.position]) if comp2 else 0.0
                 if comp2_value > 0:
                     payment_counter += 1
                     payment = {
@@ -102,11 +115,11 @@ class PaymentsGenerator:
                     }
                     self.payments.append(payment)
                 
-                # Processa parcelas normais (a partir da coluna 20, índice 29)
+                # Processa parcelas normais (colunas de mês do layout)
                 parcela_num = 3  # Começa da parcela 3 (após as duas entradas)
                 
-                for col_idx in range(29, len(row)):  # A partir da coluna 30 (índice 29)
-                    value_str = row[col_idx].strip()
+                for month in layout.months:
+                    value_str = row[month.position].strip()
                     if not value_str or value_str == '':
                         continue
                     
@@ -124,8 +137,8 @@ class PaymentsGenerator:
                         'id': str(uuid.uuid4()),
                         'contract_id': contract_id,
                         'amount': abs(clean_value),
-                        'due_date': datetime.now().strftime('%Y-%m-%d'),
-                        'payment_date': datetime.now().strftime('%Y-%m-%d') if status == 'paid' else '',
+                        'due_date': month.due_date,
+                        'payment_date': month.due_date if status == 'paid' else '',
                         'status': status,
                         'payment_type': 'normalPayment',
                         'notes': str(parcela_num),
@@ -5,127 +5,78 @@ Script para gerar payments.csv a partir de ContratosAtivosFinal.csv
 Seguindo as especificações detalhadas em instrucoesCorrections.md
 """
 
+import argparse
+import numpy as np
 import pandas as pd
-import uuid
+import os
 import json
-import re
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Tuple, Any
 import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import record_ids
+
+from columnar_io import convert_csv, read_table, write_table
+from error_collector import DEFAULT_SAMPLE_SIZE, ErrorCollector
+from monetary_parser import parse_monetary_series, parse_monetary_value
+from payment_accumulator import TIMESTAMP_COLUMNS, PaymentAccumulator
+from payments_manifest import build_manifest, load_manifest, row_hashes, save_manifest
+from spreadsheet_layout import (DOWN_PAYMENT_ROLES, SpreadsheetLayout, chunk_size_from_env, compile_layout,
+                                parse_month_header, read_spreadsheet_chunks)
+from stage_metrics import StageHook, StageMetrics, logging_hook
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class PaymentsGenerator:
-    def __init__(self):
+    # Colunas do formato longo usado internamente antes de materializar os registros
+    LONG_COLUMNS = ['row', 'seq', 'payment_id', 'amount', 'due_date', 'paid_date', 'status',
+                    'payment_type', 'notes', 'payment_method']
+    
+    # Colunas do payments.csv, na ordem exata especificada
+    PAYMENT_COLUMNS = [
+        'id', 'contract_id', 'amount', 'due_date', 'paid_date', 'status',
+        'payment_method', 'notes', 'external_id', 'created_at', 'updated_at', 'payment_type'
+    ]
+    
+    def __init__(self, stage_hook: Optional[StageHook] = None, error_sample_size: int = DEFAULT_SAMPLE_SIZE,
+                 error_detail_file: Optional[str] = None):
         self.contract_mapping = {}
+        self.key_occurrences = defaultdict(int)  # ocorrências de cada chave de contrato já vistas
+        self.batch_timestamp = datetime.now(timezone.utc).isoformat()  # created_at/updated_at do lote
+        self.metrics = StageMetrics(hook=stage_hook)  # tempo/memória por etapa (ver stage_metrics)
+        # Erros agregados por (tipo, coluna) com amostras limitadas; detalhe completo
+        # opcional em JSON lines (ver error_collector). Vai para log_data['errors'] em save_log
+        self.errors = ErrorCollector(error_sample_size, error_detail_file)
         self.log_data = {
             'total_processed_contracts': 0,
             'total_generated_payments': 0,
             'ignored_lines': [],
-            'errors': [],
             'statistics': {
                 'by_status': {'paid': 0, 'pending': 0},
                 'by_payment_type': {'downPayment': 0, 'normalPayment': 0}
-            }
-        }
-        
-        # Mapeamento de meses PT/BR
-        self.month_mapping = {
-            'jan': 1, 'janeiro': 1,
-            'fev': 2, 'fevereiro': 2,
-            'mar': 3, 'março': 3, 'marco': 3,
-            'abr': 4, 'abril': 4,
-            'mai': 5, 'maio': 5,
-            'jun': 6, 'junho': 6,
-            'jul': 7, 'julho': 7,
-            'ago': 8, 'agosto': 8,
-            'set': 9, 'setembro': 9,
-            'out': 10, 'outubro': 10,
-            'nov': 11, 'novembro': 11,
-            'dez': 12, 'dezembro': 12
+            },
+            'stages': self.metrics.stages
         }
+
     
     def normalize_monetary_value(self, value_str: str) -> Optional[float]:
         """
-        Normaliza valores monetários removendo €, espaços e convertendo vírgula para ponto
-        Retorna sempre o valor absoluto
+        Normaliza valores monetários (€, espaços, separadores europeus) via monetary_parser
+        Retorna sempre o valor absoluto, ou None se vazio/inválido
         """
-        if pd.isna(value_str) or value_str == '' or value_str is None:
-            return None
-            
-        try:
-            # Converter para string se não for
-            value_str = str(value_str).strip()
-            
-            # Remover € e espaços
-            value_str = value_str.replace('€', '').replace(' ', '')
-            
-            # Trocar vírgula por ponto
-            value_str = value_str.replace(',', '.')
-            
-            # Converter para float e retornar valor absoluto
-            return abs(float(value_str))
-            
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Erro ao normalizar valor '{value_str}': {e}")
-            return None
+        amount = parse_monetary_value(value_str)
+        return None if amount is None else abs(amount)
     
     def parse_date_header(self, header: str) -> Optional[str]:
         """
-        Parser robusto para cabeçalhos de data em PT/BR
+        Parser para cabeçalhos de data em PT/BR (ver spreadsheet_layout.parse_month_header)
         Retorna data no formato ISO YYYY-MM-DD
         """
-        if pd.isna(header) or header == '' or header is None:
-            return None
-            
-        try:
-            header = str(header).strip().lower()
-            
-            # Padrões de regex para diferentes formatos
-            patterns = [
-                # mar./23, jan./24, maio/27
-                r'^([a-z]+)\.?/([0-9]{2,4})$',
-                # Nov/31, Nov/2031
-                r'^([a-z]+)/([0-9]{2,4})$',
-                # 03/2025, 03/25
-                r'^([0-9]{1,2})/([0-9]{2,4})$'
-            ]
-            
-            for pattern in patterns:
-                match = re.match(pattern, header)
-                if match:
-                    part1, part2 = match.groups()
-                    
-                    # Se part1 é um mês em texto
-                    if part1 in self.month_mapping:
-                        month = self.month_mapping[part1]
-                        year = int(part2)
-                        
-                        # Ajustar ano se for de 2 dígitos (todos os anos são 20XX)
-                        if year < 100:
-                            year = 2000 + year
-                            
-                        return f"{year:04d}-{month:02d}-01"
-                    
-                    # Se part1 é um número (mês)
-                    elif part1.isdigit():
-                        month = int(part1)
-                        year = int(part2)
-                        
-                        # Ajustar ano se for de 2 dígitos (todos os anos são 20XX)
-                        if year < 100:
-                            year = 2000 + year
-                            
-                        if 1 <= month <= 12:
-                            return f"{year:04d}-{month:02d}-01"
-            
-            return None
-            
-        except Exception as e:
-            logger.warning(f"Erro ao parsear cabeçalho de data '{header}': {e}")
-            return None
+        return parse_month_header(header)
     
     def load_contract_mapping(self, contracts_file: str) -> bool:
         """
@@ -133,11 +84,14 @@ class PaymentsGenerator:
         Usa external_id como chave de mapeamento
         """
         try:
-            contracts_df = pd.read_csv(contracts_file)
-            
-            for _, row in contracts_df.iterrows():
-                if pd.notna(row['external_id']):
-                    self.contract_mapping[row['external_id']] = row['id']
+            # CSV ou, se configurado, a versão colunar gerada junto dele
+            with self.metrics.stage('mapping_load') as stage:
+                contracts_df = read_table(contracts_file, 'contracts', columns=['external_id', 'id'])
+                stage['rows'] = len(contracts_df)
+                
+                for external_id, contract_id in zip(contracts_df['external_id'], contracts_df['id']):
+                    if pd.notna(external_id) and external_id != '':
+                        self.contract_mapping[external_id] = contract_id
             
             logger.info(f"Carregados {len(self.contract_mapping)} mapeamentos de contratos")
             return True
@@ -154,259 +108,584 @@ class PaymentsGenerator:
         contrato = str(row['Contrato']).strip() if pd.notna(row['Contrato']) else ''
         return f"{nome}_{contrato}"
     
-    def process_contratos_file(self, input_file: str) -> List[Dict[str, Any]]:
+    def process_contratos_file(self, input_file: str, workers: int = 1) -> pd.DataFrame:
         """
-        Processa o arquivo ContratosAtivosFinal.csv e gera os dados de pagamentos
+        Processa o arquivo ContratosAtivosFinal.csv e gera os dados de pagamentos.
+        Com workers > 1 as linhas são divididas entre processos (ver _build_payments_sharded)
         """
         try:
-            df = pd.read_csv(input_file)
-            payments_data = []
+            df = self._read_contratos(input_file)
             
             logger.info(f"Processando {len(df)} linhas do arquivo {input_file}")
             
-            for idx, row in df.iterrows():
-                self.log_data['total_processed_contracts'] += 1
-                
-                # Obter contract_id via mapeamento
-                contract_key = self.get_contract_key(row)
-                contract_id = self.contract_mapping.get(contract_key)
-                
-                if not contract_id:
-                    error_msg = f"Contrato não encontrado no mapeamento: {contract_key}"
-                    self.log_data['errors'].append({
-                        'line': idx + 2,  # +2 porque idx começa em 0 e temos header
-                        'contract_key': contract_key,
-                        'error': error_msg
-                    })
-                    logger.warning(f"Linha {idx + 2}: {error_msg}")
-                    continue
-                
-                # Processar down payments (colunas 14 e 15)
-                self._process_down_payments(row, contract_id, payments_data, idx + 2)
-                
-                # Processar parcelas mensais (coluna 31 em diante)
-                self._process_monthly_payments(row, contract_id, payments_data, idx + 2, df.columns)
-            
-            return payments_data
+            if workers > 1 and len(df) > 1:
+                payments_data = self._build_payments_sharded(df, workers)
+            else:
+                payments_data = self._build_payments(df)
+            with self.metrics.stage('payments_assembly'):
+                return payments_data.to_frame()
             
         except Exception as e:
             logger.error(f"Erro ao processar arquivo: {e}")
             raise
     
-    def _process_down_payments(self, row: pd.Series, contract_id: str, payments_data: List[Dict], line_num: int):
-        """
-        Processa down payments das colunas 14 e 15 (Comp I e Comp II)
-        Também processa a coluna 'Entrada' se houver valor
-        """
-        # Obter data de início do contrato
-        start_date = None
-        if pd.notna(row.get('Início')):
-            try:
-                start_date = pd.to_datetime(row['Início']).strftime('%Y-%m-%d')
-            except:
-                self.log_data['errors'].append({
-                    'line': line_num,
-                    'error': f"Data de início inválida: {row.get('Início')}"
-                })
-        
-        # Processar Entrada (se houver)
-        entrada_value = self.normalize_monetary_value(row.get(' Entrada '))
-        if entrada_value is not None and entrada_value > 0:
-            payment = self._create_payment_record(
-                contract_id=contract_id,
-                amount=entrada_value,
-                due_date=start_date,
-                paid_date=start_date,
-                status='paid',  # Sempre paid para down payments
-                payment_type='downPayment',
-                notes='',
-                payment_method=row.get('Método', '')
-            )
-            payments_data.append(payment)
-            self.log_data['statistics']['by_payment_type']['downPayment'] += 1
-            self.log_data['statistics']['by_status']['paid'] += 1
-        
-        # Processar Comp I (coluna 14)
-        comp1_value = self.normalize_monetary_value(row.get(' Comp I '))
-        if comp1_value is not None and comp1_value > 0:
-            payment = self._create_payment_record(
-                contract_id=contract_id,
-                amount=comp1_value,
-                due_date=start_date,
-                paid_date=start_date,
-                status='paid',  # Sempre paid para down payments
-                payment_type='downPayment',
-                notes='',
-                payment_method=row.get('Método', '')
-            )
-            payments_data.append(payment)
-            self.log_data['statistics']['by_payment_type']['downPayment'] += 1
-            self.log_data['statistics']['by_status']['paid'] += 1
-        
-        # Processar Comp II (coluna 15)
-        comp2_value = self.normalize_monetary_value(row.get(' Comp II '))
-        if comp2_value is not None and comp2_value > 0:
-            payment = self._create_payment_record(
-                contract_id=contract_id,
-                amount=comp2_value,
-                due_date=start_date,
-                paid_date=start_date,
-                status='paid',  # Sempre paid para down payments
-                payment_type='downPayment',
-                notes='',
-                payment_method=row.get('Método', '')
-            )
-            payments_data.append(payment)
-            self.log_data['statistics']['by_payment_type']['downPayment'] += 1
-            self.log_data['statistics']['by_status']['paid'] += 1
-    
-    def _process_monthly_payments(self, row: pd.Series, contract_id: str, payments_data: List[Dict], line_num: int, columns: pd.Index):
-        """
-        Processa parcelas mensais a partir da coluna 31 (índice 30)
-        """
-        parcela_num = 1
-        
-        # Começar da coluna 31 (índice 30)
-        for col_idx in range(30, len(columns)):
-            col_name = columns[col_idx]
-            cell_value = row.iloc[col_idx]
-            
-            # Ignorar células vazias
-            if pd.isna(cell_value) or str(cell_value).strip() == '':
-                continue
-            
-            # Normalizar valor
-            amount = self.normalize_monetary_value(cell_value)
-            if amount is None or amount == 0:
-                self.log_data['errors'].append({
-                    'line': line_num,
-                    'column': col_name,
-                    'value': str(cell_value),
-                    'error': 'Valor inválido ou zero'
-                })
-                continue
-            
-            # Determinar status baseado no sinal original
-            original_value = str(cell_value).strip().replace('€', '').replace(' ', '')
-            is_negative = original_value.startswith('-')
-            status = 'paid' if is_negative else 'pending'
-            
-            # Parsear data do cabeçalho
-            due_date = self.parse_date_header(col_name)
-            if not due_date:
-                self.log_data['errors'].append({
-                    'line': line_num,
-                    'column': col_name,
-                    'value': str(cell_value),
-                    'error': f'Data imparseável no cabeçalho: {col_name}'
-                })
-                continue
-            
-            # Definir paid_date
-            paid_date = due_date if status == 'paid' else ''
-            
-            # Criar registro de pagamento
-            payment = self._create_payment_record(
-                contract_id=contract_id,
-                amount=amount,
-                due_date=due_date,
-                paid_date=paid_date,
-                status=status,
-                payment_type='normalPayment',
-                notes=str(parcela_num),
-                payment_method=row.get('Método', '')
-            )
-            
-            payments_data.append(payment)
-            self.log_data['statistics']['by_payment_type']['normalPayment'] += 1
-            self.log_data['statistics']['by_status'][status] += 1
-            
-            parcela_num += 1
+    def stream_contratos_file(self, input_file: str, output_file: str, chunksize: int,
+                              preview_lines: int = 10) -> pd.DataFrame:
+        """
+        Modo streaming: lê o arquivo em blocos de chunksize linhas e grava os pagamentos
+        de cada bloco em output_file assim que são gerados, de modo que a memória
+        depende do tamanho do bloco e não do arquivo.
+        Retorna apenas os primeiros registros, para preview
+        """
+        layout = None
+        preview = pd.DataFrame(columns=self.PAYMENT_COLUMNS)
+        payments_data = self._new_accumulator()  # reaproveitado entre blocos
+        row_offset = 0
+        total_payments = 0
+        
+        try:
+            with open(output_file, 'w', newline='', encoding='utf-8') as f:
+                for chunk in self.metrics.timed_iter('csv_read', read_spreadsheet_chunks(input_file, chunksize)):
+                    if layout is None:
+                        layout = self._compile_layout(chunk.columns)
+                    
+                    payments_data.clear()
+                    self._build_payments(chunk, layout, payments=payments_data)
+                    with self.metrics.stage('payments_assembly'):
+                        chunk_payments = payments_data.to_frame()
+                    with self.metrics.stage('csv_write', rows=len(chunk_payments)):
+                        chunk_payments.to_csv(f, index=False, header=(row_offset == 0))
+                    
+                    if len(preview) < preview_lines:
+                        preview = pd.concat([preview, chunk_payments.head(preview_lines - len(preview))],
+                                            ignore_index=True)
+                    row_offset += len(chunk)
+                    total_payments += len(payments_data)
+                    logger.info(f"Processadas {row_offset} linhas, {total_payments} pagamentos gravados")
+        
+        except Exception as e:
+            logger.error(f"Erro ao processar arquivo: {e}")
+            raise
+        
+        self.log_data['total_generated_payments'] = total_payments
+        logger.info(f"Salvos {total_payments} registros de pagamento em {output_file}")
+        return preview
     
-    def _create_payment_record(self, contract_id: str, amount: float, due_date: str, 
-                             paid_date: str, status: str, payment_type: str, 
-                             notes: str, payment_method: str = '') -> Dict[str, Any]:
+    def process_contratos_file_incremental(self, input_file: str, previous_output: str,
+                                           manifest_file: str) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[str, Any]]:
         """
-        Cria um registro de pagamento com todas as colunas necessárias
+        Regeneração incremental a partir do manifesto da execução anterior (ver payments_manifest).
+        Só as linhas novas ou alteradas são reprocessadas; os pagamentos das demais são
+        copiados de previous_output. Sem manifesto válido, todas as linhas são processadas.
+        Retorna (saída completa mesclada, delta, novo manifesto). O delta tem a coluna
+        'change': 'upsert' para pagamentos gerados agora e 'delete' para os que deixaram
+        de existir (linhas removidas ou alteradas)
         """
-        current_time = datetime.now(timezone.utc).isoformat()
+        df = self._read_contratos(input_file)
+        logger.info(f"Processando {len(df)} linhas do arquivo {input_file} (modo incremental)")
         
-        return {
-            'id': str(uuid.uuid4()),
-            'contract_id': contract_id,
-            'amount': amount,
-            'due_date': due_date,
-            'paid_date': paid_date,
-            'status': status,
-            'payment_method': payment_method,
-            'notes': notes,
-            'external_id': '',
-            'created_at': current_time,
-            'updated_at': current_time,
-            'payment_type': payment_type
+        layout = self._compile_layout(df.columns)
+        contract_keys = self._contract_keys(df, layout)
+        record_keys = self._record_keys(contract_keys)
+        hashes = row_hashes(df, contract_keys.map(self.contract_mapping).to_numpy(dtype=object))
+        
+        manifest = load_manifest(manifest_file, previous_output, layout.columns)
+        previous_rows = manifest['rows'] if manifest else []
+        with self.metrics.stage('previous_output_read') as stage:
+            previous_payments = (pd.read_csv(previous_output, dtype=str, keep_default_na=False)
+                                 if manifest else pd.DataFrame(columns=self.PAYMENT_COLUMNS))
+            stage['rows'] = len(previous_payments)
+        
+        # Posição de cada bloco de pagamentos na saída anterior (mesma ordem do manifesto)
+        previous_counts = np.array([count for _, _, count in previous_rows], dtype=int)
+        if previous_counts.sum() != len(previous_payments):
+            logger.warning("Manifesto não corresponde à saída anterior: regeneração completa")
+            previous_rows, previous_counts = [], np.array([], dtype=int)
+            previous_payments = pd.DataFrame(columns=self.PAYMENT_COLUMNS)
+        previous_starts = np.concatenate(([0], np.cumsum(previous_counts)[:-1])).astype(int)
+        previous_blocks = {key: (row_hash, int(start), int(count))
+                           for (key, row_hash, count), start in zip(previous_rows, previous_starts)}
+        
+        changed = np.array([previous_blocks.get(key, (None,))[0] != row_hash
+                            for key, row_hash in zip(record_keys, hashes)], dtype=bool)
+        removed = set(previous_blocks) - set(record_keys.tolist())
+        
+        # Reprocessar só as linhas novas/alteradas (o índice original preserva o número da linha)
+        positions = np.flatnonzero(changed)
+        melted, contract_ids = self._melt_payments(df.iloc[positions], layout, record_keys[positions])
+        new_payments = self._accumulate(melted, contract_ids, self._new_accumulator(len(melted)))
+        with self.metrics.stage('payments_assembly'):
+            new_payments = new_payments.to_frame()
+        new_counts = np.bincount(melted['row'].to_numpy(dtype=int), minlength=len(positions))
+        new_starts = np.concatenate(([0], np.cumsum(new_counts)[:-1])).astype(int)
+        
+        # Saída mesclada, na ordem das linhas atuais: blocos antigos + blocos regenerados
+        combined = pd.concat([previous_payments, new_payments], ignore_index=True)
+        counts = np.zeros(len(df), dtype=int)
+        take = []
+        changed_index = 0
+        for pos, key in enumerate(record_keys.tolist()):
+            if changed[pos]:
+                start, count = len(previous_payments) + new_starts[changed_index], new_counts[changed_index]
+                changed_index += 1
+            else:
+                _, start, count = previous_blocks[key]
+            counts[pos] = count
+            take.append(np.arange(start, start + count))
+        merged = combined.iloc[np.concatenate(take) if take else []].reset_index(drop=True)
+        
+        # Delta: pagamentos regenerados + pagamentos antigos que não existem mais
+        stale_keys = removed | {key for key in record_keys[positions].tolist() if key in previous_blocks}
+        stale = [np.arange(previous_blocks[key][1], previous_blocks[key][1] + previous_blocks[key][2])
+                 for key in stale_keys]
+        stale_payments = previous_payments.iloc[np.concatenate(stale) if stale else []]
+        deleted = stale_payments[~stale_payments['id'].isin(new_payments['id'])]
+        delta = pd.concat([new_payments.assign(change='upsert'), deleted.assign(change='delete')],
+                          ignore_index=True)
+        
+        # Estatísticas da saída completa (as linhas copiadas não passaram por _melt_payments)
+        statistics = self.log_data['statistics']
+        for group, column in (('by_status', 'status'), ('by_payment_type', 'payment_type')):
+            statistics[group] = {key: 0 for key in statistics[group]}
+            for value, count in merged[column].value_counts().items():
+                statistics[group][value] = int(count)
+        self.log_data['incremental'] = {
+            'full_rebuild': manifest is None,
+            'added': int(sum(1 for key in record_keys[positions].tolist() if key not in previous_blocks)),
+            'changed': int(sum(1 for key in record_keys[positions].tolist() if key in previous_blocks)),
+            'removed': len(removed),
+            'unchanged': int(len(df) - len(positions)),
+            'upserted_payments': len(new_payments),
+            'deleted_payments': len(deleted)
         }
+        logger.info(f"Incremental: {self.log_data['incremental']}")
+        
+        return merged, delta, build_manifest(layout.columns, record_keys, hashes, counts)
+    
+    def save_incremental(self, merged: pd.DataFrame, delta: pd.DataFrame, manifest: Dict[str, Any],
+                         output_file: str, delta_file: str, manifest_file: str):
+        """
+        Grava a saída completa, o delta e o manifesto (sempre depois da saída,
+        pois ele guarda o checksum dela). Sem nenhum pagamento (todas as linhas
+        removidas), a saída fica só com o cabeçalho, mas o delta com as exclusões
+        e o manifesto são gravados do mesmo jeito
+        """
+        if merged.empty:
+            logger.warning("Nenhum pagamento restante: saída completa gravada vazia")
+            with self.metrics.stage('csv_write', rows=0):
+                write_table(merged.reindex(columns=self.PAYMENT_COLUMNS), output_file, 'payments')
+            self.log_data['total_generated_payments'] = 0
+        else:
+            self.save_payments_csv(merged, output_file)
+        write_table(delta, delta_file, 'payments')
+        logger.info(f"Delta com {len(delta)} registros salvo em {delta_file}")
+        save_manifest(manifest, manifest_file, output_file)
+    
+    def _read_contratos(self, input_file: str) -> pd.DataFrame:
+        with self.metrics.stage('csv_read') as stage:
+            df = pd.read_csv(input_file)
+            stage['rows'] = len(df)
+        return df
+    
+    def _new_accumulator(self, capacity: int = 1024) -> PaymentAccumulator:
+        return PaymentAccumulator(self.PAYMENT_COLUMNS, capacity=capacity, batch_timestamp=self.batch_timestamp)
+    
+    def _build_payments_sharded(self, df: pd.DataFrame, workers: int) -> PaymentAccumulator:
+        """
+        Divide as linhas em faixas contíguas e gera cada faixa num processo separado.
+        O mapeamento de contratos é enviado uma vez por processo (não por faixa).
+        As faixas são concatenadas na ordem original e o log_data de cada uma é
+        somado ao deste gerador, então o resultado é o mesmo de uma execução única
+        """
+        layout = self._compile_layout(df.columns)  # valida o cabeçalho e avisa sobre lacunas uma só vez
+        
+        # Ocorrências de chaves repetidas dependem do arquivo inteiro: resolvidas antes de dividir
+        record_keys = self._record_keys(self._contract_keys(df, layout))
+        
+        bounds = np.linspace(0, len(df), min(workers, len(df)) + 1).astype(int)
+        shards = [(df.iloc[start:end], record_keys[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+        logger.info(f"Dividindo {len(df)} linhas em {len(shards)} faixas")
+        
+        payments_data = self._new_accumulator()
+        with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_shard_worker,
+                                 initargs=(self.contract_mapping, self.batch_timestamp, self.errors.sample_size,
+                                           self.errors.detail_file is not None)) as executor:
+            for shard_payments, shard_log in executor.map(_build_shard, shards):
+                payments_data.extend({column: shard_payments[column].to_numpy(dtype=object)
+                                      for column in payments_data.columns if column not in TIMESTAMP_COLUMNS})
+                self._merge_log(shard_log)
+                self.metrics.merge(shard_log['stages'])
+        
+        return payments_data
+    
+    def _merge_log(self, shard_log: Dict[str, Any]):
+        """
+        Acumula o log_data de uma faixa processada em outro processo
+        """
+        self.log_data['total_processed_contracts'] += shard_log['total_processed_contracts']
+        self.log_data['ignored_lines'].extend(shard_log['ignored_lines'])
+        self.errors.merge(shard_log['errors'], shard_log.get('error_details'))
+        for group, counts in shard_log['statistics'].items():
+            for key, count in counts.items():
+                self.log_data['statistics'][group][key] += count
+    
+    def _compile_layout(self, header: Any) -> SpreadsheetLayout:
+        """
+        Resolve os papéis das colunas a partir do cabeçalho
+        """
+        layout = compile_layout(header)
+        if layout.month_gaps:
+            logger.warning(f"Colunas ignoradas no bloco de parcelas: {', '.join(layout.month_gaps)}")
+        return layout
+    
+    def _build_payments(self, df: pd.DataFrame, layout: Optional[SpreadsheetLayout] = None,
+                        record_keys: Optional[np.ndarray] = None,
+                        payments: Optional[PaymentAccumulator] = None) -> PaymentAccumulator:
+        """
+        Converte o DataFrame de contratos em registros de pagamento, acrescentados
+        ao acumulador payments (um novo, se não informado)
+        """
+        melted, contract_ids = self._melt_payments(df, layout, record_keys)
+        return self._accumulate(melted, contract_ids, payments)
+    
+    def _accumulate(self, melted: pd.DataFrame, contract_ids: np.ndarray,
+                    payments: Optional[PaymentAccumulator] = None) -> PaymentAccumulator:
+        """
+        Acrescenta os pagamentos em formato longo ao acumulador (um novo, se não informado)
+        """
+        with self.metrics.stage('payments_assembly', rows=len(melted)):
+            if payments is None:
+                payments = self._new_accumulator(capacity=len(melted))
+            payments.extend({
+                'id': melted['payment_id'].to_numpy(dtype=object),
+                'contract_id': contract_ids[melted['row'].to_numpy(dtype=int)],
+                'amount': melted['amount'].to_numpy(dtype=float),
+                'due_date': melted['due_date'].to_numpy(dtype=object),
+                'paid_date': melted['paid_date'].to_numpy(dtype=object),
+                'status': melted['status'].to_numpy(dtype=object),
+                'payment_method': melted['payment_method'].to_numpy(dtype=object),
+                'notes': melted['notes'].to_numpy(dtype=object),
+                'external_id': '',
+                'payment_type': melted['payment_type'].to_numpy(dtype=object)
+            })
+        return payments
+    
+    def _melt_payments(self, df: pd.DataFrame, layout: Optional[SpreadsheetLayout] = None,
+                       record_keys: Optional[np.ndarray] = None) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Extrai os pagamentos do DataFrame em formato longo (coluna 'row' = posição da
+        linha no DataFrame), registrando erros e estatísticas no log_data.
+        Down payments e parcelas mensais são extraídos de forma colunar e
+        depois intercalados na ordem original (linha a linha, coluna a coluna).
+        O DataFrame pode ser um trecho do arquivo (bloco, faixa ou linhas alteradas):
+        o número da linha nos erros vem do índice original.
+        record_keys permite informar chaves já resolvidas para o arquivo inteiro.
+        Retorna também o contract_id de cada linha
+        """
+        self.log_data['total_processed_contracts'] += len(df)
+        line_numbers = df.index.to_numpy(dtype=int) + 2  # +2 porque o índice começa em 0 e temos header
+        
+        # Papéis das colunas resolvidos uma única vez a partir do cabeçalho
+        if layout is None:
+            layout = self._compile_layout(df.columns)
+        
+        # Obter contract_id via mapeamento (uma única passagem sobre as chaves)
+        contract_keys = self._contract_keys(df, layout)
+        contract_ids = contract_keys.map(self.contract_mapping)
+        has_contract = contract_ids.notna().to_numpy()
+        if record_keys is None:
+            record_keys = self._record_keys(contract_keys)
+        
+        # Cada erro leva (posição da linha, ordem dentro da linha) para manter a ordem do log
+        errors: List[Tuple[int, int, Dict[str, Any]]] = []
+        for pos in np.flatnonzero(~has_contract).tolist():
+            contract_key = self.get_contract_key(df.iloc[pos])
+            error_msg = f"Contrato não encontrado no mapeamento: {contract_key}"
+            errors.append((pos, -1, {
+                'line': int(line_numbers[pos]),
+                'contract_key': contract_key,
+                'error': error_msg
+            }))
+            logger.warning(f"Linha {line_numbers[pos]}: {error_msg}")
+        
+        with self.metrics.stage('down_payments', rows=len(df)) as stage:
+            down = self._melt_down_payments(df, layout, has_contract, record_keys, errors, line_numbers)
+            stage['payments'] = len(down)
+        with self.metrics.stage('monthly_payments', rows=len(df)) as stage:
+            monthly = self._melt_monthly_payments(df, layout, has_contract, record_keys, errors, line_numbers)
+            stage['payments'] = len(monthly)
+        
+        with self.metrics.stage('payments_assembly'):
+            melted = pd.concat([down, monthly], ignore_index=True)
+            melted = melted.iloc[np.lexsort((melted['seq'].to_numpy(), melted['row'].to_numpy()))]
+        
+        errors.sort(key=lambda item: (item[0], item[1]))
+        self.errors.extend(error for _, _, error in errors)
+        
+        # Estatísticas
+        by_type = melted['payment_type'].value_counts()
+        by_status = melted['status'].value_counts()
+        for payment_type, count in by_type.items():
+            self.log_data['statistics']['by_payment_type'][payment_type] += int(count)
+        for status, count in by_status.items():
+            self.log_data['statistics']['by_status'][status] += int(count)
+        
+        return melted, contract_ids.to_numpy(dtype=object)
     
-    def save_payments_csv(self, payments_data: List[Dict], output_file: str):
+    def _contract_keys(self, df: pd.DataFrame, layout: SpreadsheetLayout) -> pd.Series:
+        """
+        Chave de contrato (Nome_Contrato) de todas as linhas de uma vez
+        """
+        def key_part(field: str) -> pd.Series:
+            values = layout.field(df, field)
+            return values.astype(str).str.strip().where(values.notna(), '')
+        
+        return key_part('Nome') + '_' + key_part('Contrato')
+    
+    def _record_keys(self, contract_keys: pd.Series) -> np.ndarray:
+        """
+        Chave de negócio de cada linha, base dos IDs determinísticos dos pagamentos:
+        a chave do contrato, com sufixo _NNN a partir da 2ª ocorrência no arquivo.
+        As ocorrências continuam a contagem de chamadas anteriores (modo streaming)
+        """
+        record_keys = []
+        for key in contract_keys.tolist():
+            self.key_occurrences[key] += 1
+            record_keys.append(record_ids.occurrence_key(key, self.key_occurrences[key]))
+        return np.array(record_keys, dtype=object)
+    
+    def _parse_start_dates(self, df: pd.DataFrame, layout: SpreadsheetLayout, has_contract: np.ndarray,
+                           errors: List[Tuple[int, int, Dict[str, Any]]], line_numbers: np.ndarray) -> np.ndarray:
+        """
+        Converte a coluna 'Início' em datas ISO, registrando datas inválidas
+        """
+        start_dates = np.full(len(df), None, dtype=object)
+        start_column = layout.field(df, 'Início')
+        if start_column is None:
+            return start_dates
+        
+        raw = start_column.to_numpy(dtype=object)
+        parsed: Dict[Any, Optional[str]] = {}
+        for pos in np.flatnonzero(has_contract & start_column.notna().to_numpy()).tolist():
+            value = raw[pos]
+            if value not in parsed:
+                try:
+                    parsed[value] = pd.to_datetime(value).strftime('%Y-%m-%d')
+                except Exception:
+                    parsed[value] = None
+            start_dates[pos] = parsed[value]
+            if parsed[value] is None:
+                errors.append((pos, 0, {
+                    'line': int(line_numbers[pos]),
+                    'error': f"Data de início inválida: {value}"
+                }))
+        
+        return start_dates
+    
+    def _payment_methods(self, df: pd.DataFrame, layout: SpreadsheetLayout) -> np.ndarray:
+        """
+        Valores da coluna 'Método' por linha ('' se a coluna não existir)
+        """
+        methods = layout.field(df, 'Método')
+        if methods is None:
+            return np.full(len(df), '', dtype=object)
+        return methods.to_numpy(dtype=object)
+    
+    def _melt_down_payments(self, df: pd.DataFrame, layout: SpreadsheetLayout, has_contract: np.ndarray,
+                            record_keys: np.ndarray, errors: List[Tuple[int, int, Dict[str, Any]]],
+                            line_numbers: np.ndarray) -> pd.DataFrame:
+        """
+        Extrai os down payments (Entrada, Comp I e Comp II) em formato longo.
+        Down payments são sempre 'paid' e vencem na data de início do contrato
+        """
+        start_dates = self._parse_start_dates(df, layout, has_contract, errors, line_numbers)
+        methods = self._payment_methods(df, layout)
+        role_order = [role for role, _ in DOWN_PAYMENT_ROLES]
+        
+        frames = []
+        for column in layout.down_payments:
+            amounts = parse_monetary_series(df.iloc[:, column.position]).amounts
+            rows = np.flatnonzero(has_contract & (amounts > 0))
+            frames.append(pd.DataFrame({
+                'row': rows,
+                'seq': role_order.index(column.role) - len(role_order),  # antes das parcelas mensais
+                'payment_id': [record_ids.payment_id(key, 'downPayment', column.role) for key in record_keys[rows]],
+                'amount': amounts[rows],
+                'due_date': start_dates[rows],
+                'paid_date': start_dates[rows],
+                'status': 'paid',
+                'payment_type': 'downPayment',
+                'notes': '',
+                'payment_method': methods[rows]
+            }))
+        
+        if not frames:
+            return pd.DataFrame(columns=self.LONG_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+    
+    def _melt_monthly_payments(self, df: pd.DataFrame, layout: SpreadsheetLayout, has_contract: np.ndarray,
+                               record_keys: np.ndarray, errors: List[Tuple[int, int, Dict[str, Any]]],
+                               line_numbers: np.ndarray) -> pd.DataFrame:
+        """
+        Transforma o bloco de parcelas mensais (colunas classificadas como mês no
+        layout) em formato longo numa única passagem vetorizada: uma linha por célula válida
+        """
+        block = layout.month_block(df)
+        n_rows, n_cols = block.shape
+        if n_rows == 0 or n_cols == 0:
+            return pd.DataFrame(columns=self.LONG_COLUMNS)
+        
+        # Cabeçalhos e vencimentos já resolvidos pelo layout
+        column_names = np.array(layout.month_headers, dtype=object)
+        column_dates = np.array(layout.month_dates, dtype=object)
+        column_positions = np.array(layout.month_positions)
+        
+        # Achatar em ordem linha a linha, coluna a coluna
+        flat_values = block.to_numpy(dtype=object).ravel()
+        parsed = parse_monetary_series(flat_values)
+        row_pos = np.repeat(np.arange(n_rows), n_cols)
+        col_pos = np.tile(np.arange(n_cols), n_rows)
+        
+        candidates = parsed.filled & has_contract[row_pos]
+        invalid_amount = candidates & (np.isnan(parsed.amounts) | (parsed.amounts == 0))
+        valid = candidates & ~invalid_amount
+        
+        for idx in np.flatnonzero(invalid_amount).tolist():
+            errors.append((int(row_pos[idx]), int(column_positions[col_pos[idx]]), {
+                'line': int(line_numbers[row_pos[idx]]),
+                'column': column_names[col_pos[idx]],
+                'value': str(flat_values[idx]),
+                'error': 'Valor inválido ou zero'
+            }))
+        
+        # Numeração das parcelas: contagem acumulada das células válidas em cada linha
+        installment_numbers = np.cumsum(valid.reshape(n_rows, n_cols), axis=1).ravel()[valid]
+        
+        status = np.where(parsed.negative[valid], 'paid', 'pending')
+        due_dates = column_dates[col_pos[valid]]
+        
+        payment_ids = [
+            record_ids.payment_id(key, 'normalPayment', due_date)
+            for key, due_date in zip(record_keys[row_pos[valid]], due_dates)
+        ]
+        
+        return pd.DataFrame({
+            'row': row_pos[valid],
+            'seq': column_positions[col_pos[valid]],
+            'payment_id': payment_ids,
+            'amount': parsed.amounts[valid],
+            'due_date': due_dates,
+            'paid_date': np.where(status == 'paid', due_dates, ''),
+            'status': status,
+            'payment_type': 'normalPayment',
+            'notes': installment_numbers.astype(str),
+            'payment_method': self._payment_methods(df, layout)[row_pos[valid]]
+        })
+    
+    def save_payments_csv(self, payments_data: pd.DataFrame, output_file: str):
         """
         Salva os dados de pagamentos no arquivo CSV com o schema exato
         """
-        if not payments_data:
+        if payments_data.empty:
             logger.warning("Nenhum dado de pagamento para salvar")
             return
         
-        # Definir colunas na ordem exata especificada
-        columns = [
-            'id', 'contract_id', 'amount', 'due_date', 'paid_date', 'status',
-            'payment_method', 'notes', 'external_id', 'created_at', 'updated_at', 'payment_type'
-        ]
-        
-        df = pd.DataFrame(payments_data, columns=columns)
-        df.to_csv(output_file, index=False)
+        with self.metrics.stage('csv_write', rows=len(payments_data)):
+            df = payments_data.reindex(columns=self.PAYMENT_COLUMNS)
+            columnar_file = write_table(df, output_file, 'payments')
         
         self.log_data['total_generated_payments'] = len(payments_data)
         logger.info(f"Salvos {len(payments_data)} registros de pagamento em {output_file}")
+        if columnar_file:
+            logger.info(f"Versão colunar salva em {columnar_file}")
     
     def save_log(self, log_file: str):
         """
-        Salva o log detalhado em formato JSON
+        Salva o log detalhado em formato JSON.
+        A etapa log_write é medida durante a própria gravação, então só aparece
+        no log_data em memória (e no hook), não no arquivo
         """
-        with open(log_file, 'w', encoding='utf-8') as f:
-            json.dump(self.log_data, f, indent=2, ensure_ascii=False)
+        with self.metrics.stage('log_write'):
+            self.errors.close()  # conclui o arquivo de detalhes, se houver
+            self.log_data['errors'] = self.errors.summary()
+            with open(log_file, 'w', encoding='utf-8') as f:
+                json.dump(self.log_data, f, indent=2, ensure_ascii=False)
         
         logger.info(f"Log salvo em {log_file}")
     
-    def show_preview(self, payments_data: List[Dict], num_lines: int = 10):
+    def show_preview(self, payments_data: pd.DataFrame, num_lines: int = 10, total: Optional[int] = None):
         """
         Mostra preview dos primeiros registros
+        (no modo streaming, total informa quantos registros foram gravados)
         """
-        if not payments_data:
+        if payments_data.empty:
             print("Nenhum dado para preview")
             return
         
         print(f"\n=== PREVIEW - Primeiras {min(num_lines, len(payments_data))} linhas ===")
-        df_preview = pd.DataFrame(payments_data[:num_lines])
+        df_preview = payments_data.head(num_lines)
         print(df_preview.to_string(index=False))
         
         print(f"\n=== ESTATÍSTICAS ===")
-        print(f"Total de pagamentos gerados: {len(payments_data)}")
+        print(f"Total de pagamentos gerados: {len(payments_data) if total is None else total}")
         print(f"Por status: {self.log_data['statistics']['by_status']}")
         print(f"Por tipo: {self.log_data['statistics']['by_payment_type']}")
         print(f"Contratos processados: {self.log_data['total_processed_contracts']}")
-        print(f"Erros encontrados: {len(self.log_data['errors'])}")
+        print(f"Erros encontrados: {len(self.errors)}")
+
+# Gerador de cada processo do pool, com o mapeamento de contratos já carregado
+_shard_generator: Optional[PaymentsGenerator] = None
+
+_shard_error_options: Tuple[int, bool] = (DEFAULT_SAMPLE_SIZE, False)
+
+def _init_shard_worker(contract_mapping: Dict[str, str], batch_timestamp: str,
+                       error_sample_size: int, keep_error_details: bool):
+    global _shard_generator, _shard_error_options
+    _shard_generator = PaymentsGenerator()
+    _shard_generator.contract_mapping = contract_mapping
+    _shard_generator.batch_timestamp = batch_timestamp
+    _shard_error_options = (error_sample_size, keep_error_details)
+
+def _build_shard(shard: Tuple[pd.DataFrame, np.ndarray]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Gera os pagamentos de uma faixa de linhas e devolve o log_data só dessa faixa
+    """
+    df, record_keys = shard
+    generator = _shard_generator
+    fresh = PaymentsGenerator()
+    generator.log_data, generator.metrics = fresh.log_data, fresh.metrics
+    # Os detalhes dos erros (se pedidos) voltam para o processo principal, que grava o arquivo
+    sample_size, keep_details = _shard_error_options
+    generator.errors = ErrorCollector(sample_size, keep_details=keep_details)
+    payments_data = generator._build_payments(df, compile_layout(df.columns), record_keys)
+    generator.log_data['errors'] = generator.errors.summary()
+    generator.log_data['error_details'] = generator.errors.details
+    return payments_data.to_frame(), generator.log_data
 
 def main():
     """
     Função principal
     """
+    parser = argparse.ArgumentParser(description='Gera payments.csv a partir de contratosAtivosFinal.csv')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processos usados para gerar os pagamentos (padrão: 1)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='reprocessa só os contratos alterados desde a última execução (manifesto)')
+    parser.add_argument('--error-details', metavar='ARQUIVO',
+                        help='grava todos os erros, um por linha (JSON lines); o log guarda só contagens e amostras')
+    args = parser.parse_args()
+    
     # Arquivos de entrada e saída
     contratos_file = 'contratosAtivosFinal.csv'
     contracts_file = 'contracts.csv'
     output_file = 'payments.csv'
     log_file = 'payments_build_log.json'
+    delta_file = 'payments_delta.csv'
+    manifest_file = 'payments_manifest.json'
     
     try:
         # Inicializar gerador
-        generator = PaymentsGenerator()
+        generator = PaymentsGenerator(stage_hook=logging_hook(logger), error_detail_file=args.error_details)
         
         # Carregar mapeamento de contratos
         logger.info("Carregando mapeamento de contratos...")
@@ -414,9 +693,17 @@ def main():
             logger.error("Falha ao carregar mapeamento de contratos")
             return False
         
+        # Modo streaming: grava em arquivo temporário e só substitui após confirmação
+        chunksize = chunk_size_from_env()
+        if chunksize:
+            return stream_main(generator, contratos_file, output_file, log_file, chunksize)
+        
+        if args.incremental:
+            return incremental_main(generator, contratos_file, output_file, log_file, delta_file, manifest_file)
+        
         # Processar arquivo de contratos
         logger.info("Processando arquivo de contratos...")
-        payments_data = generator.process_contratos_file(contratos_file)
+        payments_data = generator.process_contratos_file(contratos_file, workers=args.workers)
         
         # Mostrar preview
         generator.show_preview(payments_data)
@@ -440,5 +727,54 @@ def main():
         logger.error(f"Erro durante o processamento: {e}")
         return False
 
+def incremental_main(generator: PaymentsGenerator, contratos_file: str, output_file: str,
+                     log_file: str, delta_file: str, manifest_file: str) -> bool:
+    """
+    Fluxo do main no modo incremental (--incremental)
+    """
+    logger.info("Processando arquivo de contratos (incremental)...")
+    merged, delta, manifest = generator.process_contratos_file_incremental(contratos_file, output_file, manifest_file)
+    
+    generator.show_preview(delta)
+    print(f"Saída completa: {len(merged)} pagamentos")
+    
+    response = input("\nDeseja salvar os arquivos? (s/n): ")
+    if response.lower() in ['s', 'sim', 'y', 'yes']:
+        generator.save_incremental(merged, delta, manifest, output_file, delta_file, manifest_file)
+        generator.save_log(log_file)
+        
+        logger.info("Processamento concluído com sucesso!")
+        return True
+    else:
+        logger.info("Operação cancelada pelo usuário")
+        return False
+
+def stream_main(generator: PaymentsGenerator, contratos_file: str, output_file: str,
+                log_file: str, chunksize: int) -> bool:
+    """
+    Fluxo do main no modo streaming (CONTRATOS_CHUNK_SIZE definido)
+    """
+    partial_file = f"{output_file}.partial"
+    
+    logger.info(f"Processando arquivo de contratos em blocos de {chunksize} linhas...")
+    preview = generator.stream_contratos_file(contratos_file, partial_file, chunksize)
+    
+    generator.show_preview(preview, total=generator.log_data['total_generated_payments'])
+    
+    response = input("\nDeseja salvar os arquivos? (s/n): ")
+    if response.lower() in ['s', 'sim', 'y', 'yes']:
+        os.replace(partial_file, output_file)
+        columnar_file = convert_csv(output_file, 'payments')
+        if columnar_file:
+            logger.info(f"Versão colunar salva em {columnar_file}")
+        generator.save_log(log_file)
+        
+        logger.info("Processamento concluído com sucesso!")
+        return True
+    else:
+        os.remove(partial_file)
+        logger.info("Operação cancelada pelo usuário")
+        return False
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
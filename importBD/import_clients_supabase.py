@@ -4,23 +4,30 @@
 Script para importar clients.csv para o Supabase
 """
 
+import argparse
 import csv
-import requests
-import json
-import time
-from datetime import datetime
+
+from batch_uploader import chunked, upload_batches, upload_concurrency
+from dead_letter import DeadLetterWriter
+from import_journal import ImportJournal
+from supabase_client import SupabaseHTTPError, get_client
+from table_stats import count_rows
+from upsert_sync import delete_missing_enabled, existing_keys, import_mode, sync_table
+
+# Colunas comparadas no modo upsert (created_at/updated_at não indicam mudança no conteúdo)
+CLIENT_SYNC_COLUMNS = ['id', 'first_name', 'last_name', 'email', 'phone', 'tax_id', 'address',
+                       'city', 'postal_code', 'country', 'notes', 'status']
 
 class ClientsImporter:
     def __init__(self, supabase_url, supabase_key):
         self.supabase_url = supabase_url.rstrip('/')
         self.supabase_key = supabase_key
-        self.headers = {
-            'apikey': supabase_key,
-            'Authorization': f'Bearer {supabase_key}',
-            'Content-Type': 'application/json',
-            'Prefer': 'return=minimal'
-        }
+        self.concurrency = upload_concurrency()
+        # Cliente compartilhado (conexões reutilizadas entre lotes e threads)
+        self.client = get_client(self.supabase_url, supabase_key, pool_size=self.concurrency)
         self.batch_size = 100
+        # Clientes recusados pelo Supabase (isolados por bisseção dos lotes)
+        self.dead_letter_file = 'clients_dead_letter.csv'
         self.imported_count = 0
         self.error_count = 0
         
@@ -30,33 +37,18 @@ class ClientsImporter:
         
         try:
             # Primeiro, conta quantos registros existem
-            count_response = requests.get(
-                f"{self.supabase_url}/rest/v1/clients",
-                headers={
-                    'apikey': self.supabase_key,
-                    'Authorization': f'Bearer {self.supabase_key}',
-                    'Prefer': 'count=exact'
-                }
-            )
-            
-            if count_response.status_code == 200:
-                count = count_response.headers.get('Content-Range', '0').split('/')[-1]
+            try:
+                count = count_rows(self.client, 'clients')
                 print(f"📊 Encontrados {count} clientes existentes")
+            except SupabaseHTTPError:
+                pass
             
             # Deleta todos os registros
-            delete_response = requests.delete(
-                f"{self.supabase_url}/rest/v1/clients",
-                headers={
-                    'apikey': self.supabase_key,
-                    'Authorization': f'Bearer {self.supabase_key}'
-                },
-                params={'id': 'not.is.null'}  # Deleta todos os registros
-            )
-            
-            if delete_response.status_code in [200, 204]:
+            try:
+                self.client.delete('clients', params={'id': 'not.is.null'})  # Deleta todos os registros
                 print("✅ Clientes existentes removidos com sucesso")
-            else:
-                print(f"⚠️  Aviso ao limpar clientes: {delete_response.status_code} - {delete_response.text}")
+            except SupabaseHTTPError as e:
+                print(f"⚠️  Aviso ao limpar clientes: {e.status} - {e.text}")
                 
         except Exception as e:
             print(f"⚠️  Erro ao limpar clientes: {e}")
@@ -92,72 +84,99 @@ class ClientsImporter:
         return clients
     
     def import_clients_batch(self, clients_batch):
-        """Importa um lote de clientes"""
-        try:
-            response = requests.post(
-                f"{self.supabase_url}/rest/v1/clients",
-                headers=self.headers,
-                json=clients_batch
-            )
-            
-            if response.status_code in [200, 201]:
-                self.imported_count += len(clients_batch)
-                return True
-            else:
-                print(f"❌ Erro no lote: {response.status_code} - {response.text}")
-                self.error_count += len(clients_batch)
-                return False
-                
-        except Exception as e:
-            print(f"❌ Exceção no lote: {e}")
-            self.error_count += len(clients_batch)
-            return False
+        """
+        Importa um lote de clientes (executado em paralelo por batch_uploader).
+        Levanta exceção se o lote falhar
+        """
+        self.client.post('clients', data=clients_batch, headers={'Prefer': 'return=minimal'})
     
-    def import_all_clients(self, clients):
-        """Importa todos os clientes em lotes"""
-        print(f"📤 Iniciando importação de {len(clients)} clientes...")
-        
+    def unsent_clients(self, clients_batch):
+        """Retomada: tira do lote os clientes que já chegaram ao banco (pelo id do CSV)"""
+        present = existing_keys(self.client, 'clients', [client['id'] for client in clients_batch], key='id')
+        return [client for client in clients_batch if client['id'] not in present]
+    
+    def import_all_clients(self, clients, journal=None):
+        """
+        Importa todos os clientes em lotes, com até self.concurrency lotes em andamento
+        (o limite substitui a pausa fixa entre lotes; 429 é repetido pelo cliente com backoff).
+        Com journal, cada lote confirmado é registrado e os já confirmados são pulados.
+        Lotes recusados são divididos até isolar os clientes inválidos (self.dead_letter_file)
+        """
         total_batches = (len(clients) + self.batch_size - 1) // self.batch_size
+        dead_letter = DeadLetterWriter(self.dead_letter_file, append=bool(journal and journal.resumed))
+        print(f"📤 Iniciando importação de {len(clients)} clientes "
+              f"({total_batches} lotes, até {self.concurrency} simultâneos)...")
         
-        for i in range(0, len(clients), self.batch_size):
-            batch_num = (i // self.batch_size) + 1
-            batch = clients[i:i + self.batch_size]
-            
-            print(f"📦 Processando lote {batch_num}/{total_batches} ({len(batch)} clientes)...")
-            
-            success = self.import_clients_batch(batch)
-            
-            if success:
-                print(f"✅ Lote {batch_num} importado com sucesso")
+        def report(result):
+            if journal:
+                journal.record(result)
+            if result.success:
+                print(f"✅ Lote {result.number}/{total_batches} importado com sucesso ({result.rows} clientes)")
+            elif result.rejected:
+                dead_letter.write(result)
+                print(f"⚠️  Lote {result.number}/{total_batches}: {result.committed_rows} clientes gravados, "
+                      f"{len(result.rejected)} recusados ({result.status} - {result.error})")
             else:
-                print(f"❌ Falha no lote {batch_num}")
-            
-            # Pequena pausa entre lotes para não sobrecarregar a API
-            if batch_num < total_batches:
-                time.sleep(0.5)
+                print(f"❌ Erro no lote: {result.status} - {result.error}")
+                print(f"❌ Falha no lote {result.number}")
+        
+        batches = chunked(clients, self.batch_size)
+        if journal:
+            batches = journal.pending(batches, reconcile=self.unsent_clients)
+        summary = upload_batches(batches, self.import_clients_batch, self.concurrency,
+                                 on_result=report, numbered=journal is not None, bisect=True)
+        # Com diário, contam também os lotes confirmados em execuções anteriores
+        self.imported_count += journal.done_rows if journal else summary.succeeded_rows
+        self.error_count += summary.failed_rows
+        print(f"⏱️  {len(summary.results)} lotes enviados em {summary.elapsed:.1f}s")
+        self.close_dead_letter(dead_letter)
+        if journal:
+            journal.finish()
+    
+    def sync_clients(self, clients, delete_missing=False):
+        """
+        Modo upsert: envia só os clientes novos ou alterados (por external_id) e,
+        com delete_missing, remove os que não estão mais no CSV
+        """
+        dead_letter = DeadLetterWriter(self.dead_letter_file)
+        print(f"🔄 Sincronizando {len(clients)} clientes (até {self.concurrency} lotes simultâneos)...")
+        
+        def report(result):
+            if result.success:
+                print(f"✅ Lote {result.number} sincronizado com sucesso ({result.rows} clientes)")
+            elif result.rejected:
+                dead_letter.write(result)
+                print(f"⚠️  Lote {result.number}: {result.committed_rows} clientes gravados, "
+                      f"{len(result.rejected)} recusados ({result.status} - {result.error})")
+            else:
+                print(f"❌ Erro no lote: {result.status} - {result.error}")
+                print(f"❌ Falha no lote {result.number}")
+        
+        result = sync_table(self.client, 'clients', clients, CLIENT_SYNC_COLUMNS,
+                            delete_missing=delete_missing, batch_size=self.batch_size,
+                            max_in_flight=self.concurrency, on_result=report, bisect=True)
+        self.imported_count += result.succeeded_rows
+        self.error_count += result.failed_rows
+        print(f"⏱️  {len(result.plan.rows)} clientes enviados em {result.upload.elapsed:.1f}s")
+        self.close_dead_letter(dead_letter)
+    
+    def close_dead_letter(self, dead_letter):
+        dead_letter.close()
+        if dead_letter.count:
+            print(f"📄 {dead_letter.count} clientes recusados gravados em {self.dead_letter_file}")
     
     def verify_import(self):
         """Verifica se a importação foi bem-sucedida"""
         print("🔍 Verificando importação...")
         
         try:
-            response = requests.get(
-                f"{self.supabase_url}/rest/v1/clients",
-                headers={
-                    'apikey': self.supabase_key,
-                    'Authorization': f'Bearer {self.supabase_key}',
-                    'Prefer': 'count=exact'
-                }
-            )
-            
-            if response.status_code == 200:
-                count = response.headers.get('Content-Range', '0').split('/')[-1]
-                print(f"📊 Total de clientes no banco: {count}")
-                return int(count)
-            else:
-                print(f"❌ Erro na verificação: {response.status_code}")
-                return 0
+            count = count_rows(self.client, 'clients') or 0
+            print(f"📊 Total de clientes no banco: {count}")
+            return int(count)
                 
+        except SupabaseHTTPError as e:
+            print(f"❌ Erro na verificação: {e.status}")
+            return 0
         except Exception as e:
             print(f"❌ Erro na verificação: {e}")
             return 0
@@ -170,6 +189,11 @@ class ClientsImporter:
         print(f"   Taxa de sucesso: {(self.imported_count / (self.imported_count + self.error_count) * 100):.1f}%" if (self.imported_count + self.error_count) > 0 else "   Taxa de sucesso: N/A")
 
 def main():
+    parser = argparse.ArgumentParser(description='Importa clients.csv para o Supabase')
+    parser.add_argument('--resume', action='store_true',
+                        help='retoma a última importação interrompida da mesma origem, pulando os lotes já confirmados')
+    args = parser.parse_args()
+    
     print("🚀 Iniciando importação de clientes para o Supabase...")
     
     # Configuração para importação de clientes
@@ -179,8 +203,19 @@ def main():
     # Inicializa o importador
     importer = ClientsImporter(SUPABASE_URL, SUPABASE_ANON_KEY)
     
-    # Limpa clientes existentes
-    importer.clear_existing_clients()
+    # Limpa clientes existentes (o modo upsert não apaga a tabela,
+    # e uma importação retomada continua de onde parou)
+    mode = import_mode()
+    journal = None
+    if mode == 'replace':
+        journal = ImportJournal('clients', 'clients.csv', importer.batch_size, resume=args.resume)
+        if journal.resumed:
+            print(f"♻️  Retomando importação: {len(journal.done)} lotes já confirmados "
+                  f"({journal.done_rows} clientes)")
+        else:
+            importer.clear_existing_clients()
+    elif args.resume:
+        print("♻️  Modo upsert: só o que falta ou mudou será enviado")
     
     # Carrega clientes do CSV
     clients = importer.load_clients_from_csv('clients.csv')
@@ -190,7 +225,10 @@ def main():
         return
     
     # Importa clientes
-    importer.import_all_clients(clients)
+    if mode == 'upsert':
+        importer.sync_clients(clients, delete_missing_enabled())
+    else:
+        importer.import_all_clients(clients, journal)
     
     # Verifica importação
     final_count = importer.verify_import()
@@ -1,9 +1,18 @@
 import os
 import csv
-import requests
+import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 
+from batch_uploader import chunked, upload_batches, upload_concurrency
+from columnar_io import read_table_records, table_format, table_path
+from dead_letter import DeadLetterWriter
+from import_journal import ImportJournal
+from monetary_parser import parse_decimal_columns
+from supabase_client import SupabaseHTTPError, get_client
+from table_stats import count_rows
+from upsert_sync import delete_missing_enabled, existing_keys, import_mode, sync_table
+
 # Carregar variáveis do arquivo .env do backend
 env_path = '/Users/insitutoareluna/Documents/finance/backend/.env'
 load_dotenv(env_path)
@@ -12,6 +21,15 @@ load_dotenv(env_path)
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 
+# Linhas por lote (o diário de retomada só vale para o mesmo tamanho de lote)
+BATCH_SIZE = 100
+# Contratos recusados pelo Supabase (isolados por bisseção dos lotes)
+DEAD_LETTER_FILE = 'contracts_dead_letter.csv'
+
+def get_supabase():
+    """Cliente compartilhado (conexões reutilizadas) com a service key"""
+    return get_client(SUPABASE_URL, SUPABASE_SERVICE_KEY, pool_size=upload_concurrency())
+
 def parse_date(date_str):
     """Converte string de data para formato ISO"""
     if not date_str or date_str.strip() == '':
@@ -27,15 +45,6 @@ def parse_date(date_str):
     except:
         return None
 
-def parse_decimal(value_str):
-    """Converte string para decimal"""
-    if not value_str or value_str.strip() == '':
-        return None
-    try:
-        return float(str(value_str).replace(',', '.'))
-    except:
-        return None
-
 def prepare_contract_data(contract_row):
     """Prepara os dados do contrato para inserção no Supabase"""
     # Usar o ID original do CSV nas notes para mapeamento posterior
@@ -54,131 +63,182 @@ def prepare_contract_data(contract_row):
         'client_id': contract_row.get('client_id', '').strip() or None,
         'contract_number': contract_row.get('contract_number', '').strip() or f"CONTRACT_{original_id[:8]}",
         'description': contract_row.get('description', '').strip() or None,
-        'value': parse_decimal(contract_row.get('total_amount')),
+        'value': contract_row.get('total_amount'),
         'start_date': parse_date(contract_row.get('start_date')),
         'end_date': parse_date(contract_row.get('end_date')),
         'status': contract_row.get('status', '').strip() or 'active',
         'payment_frequency': contract_row.get('payment_frequency', '').strip() or 'monthly',
         'notes': combined_notes,
-        'down_payment': parse_decimal(contract_row.get('installment_amount')),
-        'number_of_payments': None  # Não disponível no CSV
+        'down_payment': contract_row.get('installment_amount'),
+        'number_of_payments': None,  # Não disponível no CSV
+        'external_id': original_id or None  # Chave do modo upsert
     }
 
+# Colunas comparadas no modo upsert para decidir se o contrato mudou
+CONTRACT_SYNC_COLUMNS = ['client_id', 'contract_number', 'description', 'value', 'start_date', 'end_date',
+                         'status', 'payment_frequency', 'notes', 'down_payment', 'number_of_payments']
+
 def clear_existing_contracts():
     """Remove todos os contratos existentes"""
     print("🗑️  Limpando contratos existentes...")
+    client = get_supabase()
     
     # Primeiro, contar quantos existem
-    response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/contracts?select=count",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Prefer": "count=exact"
-        }
-    )
-    
-    if response.status_code == 200:
-        count = response.headers.get('Content-Range', '0').split('/')[-1]
+    try:
+        count = count_rows(client, 'contracts')
         print(f"📊 Encontrados {count} contratos existentes")
+    except SupabaseHTTPError:
+        pass
     
     # Remover todos
-    response = requests.delete(
-        f"{SUPABASE_URL}/rest/v1/contracts?id=neq.00000000-0000-0000-0000-000000000000",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}"
-        }
-    )
-    
-    if response.status_code == 204:
+    try:
+        client.delete('contracts', params={'id': 'neq.00000000-0000-0000-0000-000000000000'})
         print("✅ Contratos existentes removidos com sucesso")
-    else:
-        print(f"⚠️  Aviso ao limpar contratos: {response.status_code}")
+    except SupabaseHTTPError as e:
+        print(f"⚠️  Aviso ao limpar contratos: {e.status}")
+
+def contracts_source_path():
+    """Arquivo de onde os contratos são lidos (identifica o diário de retomada)"""
+    fmt = table_format()
+    return 'contracts.csv' if fmt == 'csv' else table_path('contracts.csv', fmt)
 
 def load_contracts_from_csv():
     """Carrega contratos do arquivo CSV"""
-    print("📋 Carregando contratos de contracts.csv...")
-    contracts = []
-    
-    with open('contracts.csv', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            contract_data = prepare_contract_data(row)
-            contracts.append(contract_data)
+    # Versão colunar (já tipada), se configurada em CONTRATOS_TABLE_FORMAT
+    fmt = table_format()
+    if fmt != 'csv':
+        print(f"📋 Carregando contratos de contracts.{fmt}...")
+        rows = read_table_records('contracts.csv', 'contracts', fmt)
+    else:
+        print("📋 Carregando contratos de contracts.csv...")
+        with open('contracts.csv', 'r', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        
+        parse_decimal_columns(rows, ['total_amount', 'installment_amount'])
+    contracts = [prepare_contract_data(row) for row in rows]
     
     print(f"✅ {len(contracts)} contratos carregados do CSV")
     return contracts
 
 def import_contracts_batch(contracts_batch):
-    """Importa um lote de contratos"""
-    response = requests.post(
-        f"{SUPABASE_URL}/rest/v1/contracts",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Content-Type": "application/json",
-            "Prefer": "return=minimal"
-        },
-        json=contracts_batch
-    )
-    
-    return response.status_code == 201, response
+    """
+    Importa um lote de contratos (executado em paralelo por batch_uploader).
+    Levanta exceção se o lote falhar
+    """
+    get_supabase().post('contracts', data=contracts_batch, headers={"Prefer": "return=minimal"})
 
-def import_all_contracts(contracts):
-    """Importa todos os contratos em lotes"""
-    print(f"📤 Iniciando importação de {len(contracts)} contratos...")
-    
-    batch_size = 100
+def unsent_contracts(contracts_batch):
+    """Retomada: tira do lote os contratos que já chegaram ao banco (pelo external_id)"""
+    present = existing_keys(get_supabase(), 'contracts', [contract['external_id'] for contract in contracts_batch])
+    return [contract for contract in contracts_batch if contract['external_id'] not in present]
+
+def import_all_contracts(contracts, batch_size=BATCH_SIZE, journal=None):
+    """
+    Importa todos os contratos em lotes, com vários lotes em andamento ao mesmo tempo.
+    Com journal, cada lote confirmado é registrado e os já confirmados são pulados.
+    Lotes recusados são divididos até isolar os contratos inválidos, que vão para DEAD_LETTER_FILE
+    """
     total_batches = (len(contracts) + batch_size - 1) // batch_size
-    successful_imports = 0
-    failed_imports = 0
+    concurrency = upload_concurrency()
+    dead_letter = DeadLetterWriter(DEAD_LETTER_FILE, append=bool(journal and journal.resumed))
+    print(f"📤 Iniciando importação de {len(contracts)} contratos "
+          f"({total_batches} lotes, até {concurrency} simultâneos)...")
     
-    for i in range(0, len(contracts), batch_size):
-        batch_num = (i // batch_size) + 1
-        batch = contracts[i:i + batch_size]
-        
-        print(f"📦 Processando lote {batch_num}/{total_batches} ({len(batch)} contratos)...")
-        
-        success, response = import_contracts_batch(batch)
-        
-        if success:
-            print(f"✅ Lote {batch_num} importado com sucesso")
-            successful_imports += len(batch)
+    def report(result):
+        if journal:
+            journal.record(result)
+        if result.success:
+            print(f"✅ Lote {result.number}/{total_batches} importado com sucesso ({result.rows} contratos)")
+        elif result.rejected:
+            dead_letter.write(result)
+            print(f"⚠️  Lote {result.number}/{total_batches}: {result.committed_rows} contratos gravados, "
+                  f"{len(result.rejected)} recusados ({result.status} - {result.error})")
+        else:
+            print(f"❌ Erro no lote: {result.status} - {result.error}")
+            print(f"❌ Falha no lote {result.number}")
+    
+    batches = chunked(contracts, batch_size)
+    if journal:
+        batches = journal.pending(batches, reconcile=unsent_contracts)
+    summary = upload_batches(batches, import_contracts_batch, concurrency,
+                             on_result=report, numbered=journal is not None, bisect=True)
+    print(f"⏱️  {len(summary.results)} lotes enviados em {summary.elapsed:.1f}s")
+    dead_letter.close()
+    if dead_letter.count:
+        print(f"📄 {dead_letter.count} contratos recusados gravados em {DEAD_LETTER_FILE}")
+    if journal:
+        journal.finish()
+    
+    # Com diário, contam também os lotes confirmados em execuções anteriores
+    succeeded = journal.done_rows if journal else summary.succeeded_rows
+    return succeeded, summary.failed_rows
+
+def sync_all_contracts(contracts, delete_missing=False, batch_size=100):
+    """
+    Modo upsert: envia só os contratos novos ou alterados (por external_id) e,
+    com delete_missing, remove os que não estão mais no CSV
+    """
+    concurrency = upload_concurrency()
+    dead_letter = DeadLetterWriter(DEAD_LETTER_FILE)
+    print(f"🔄 Sincronizando {len(contracts)} contratos (até {concurrency} lotes simultâneos)...")
+    
+    def report(result):
+        if result.success:
+            print(f"✅ Lote {result.number} sincronizado com sucesso ({result.rows} contratos)")
+        elif result.rejected:
+            dead_letter.write(result)
+            print(f"⚠️  Lote {result.number}: {result.committed_rows} contratos gravados, "
+                  f"{len(result.rejected)} recusados ({result.status} - {result.error})")
         else:
-            print(f"❌ Erro no lote: {response.status_code} - {response.text}")
-            print(f"❌ Falha no lote {batch_num}")
-            failed_imports += len(batch)
+            print(f"❌ Erro no lote: {result.status} - {result.error}")
+            print(f"❌ Falha no lote {result.number}")
+    
+    result = sync_table(get_supabase(), 'contracts', contracts, CONTRACT_SYNC_COLUMNS,
+                        delete_missing=delete_missing, batch_size=batch_size,
+                        max_in_flight=concurrency, on_result=report, bisect=True)
+    print(f"⏱️  {len(result.plan.rows)} contratos enviados em {result.upload.elapsed:.1f}s")
+    dead_letter.close()
+    if dead_letter.count:
+        print(f"📄 {dead_letter.count} contratos recusados gravados em {DEAD_LETTER_FILE}")
     
-    return successful_imports, failed_imports
+    return result.succeeded_rows, result.failed_rows
 
 def verify_import():
     """Verifica se a importação foi bem-sucedida"""
     print("🔍 Verificando importação...")
     
-    response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/contracts?select=count",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Prefer": "count=exact"
-        }
-    )
-    
-    if response.status_code == 200:
-        count = response.headers.get('Content-Range', '0').split('/')[-1]
-        print(f"📊 Total de contratos no banco: {count}")
-        return int(count)
-    else:
-        print(f"❌ Erro ao verificar: {response.status_code}")
+    try:
+        count = count_rows(get_supabase(), 'contracts') or 0
+    except SupabaseHTTPError as e:
+        print(f"❌ Erro ao verificar: {e.status}")
         return 0
+    
+    print(f"📊 Total de contratos no banco: {count}")
+    return int(count)
 
 def main():
+    parser = argparse.ArgumentParser(description='Importa contracts.csv para o Supabase')
+    parser.add_argument('--resume', action='store_true',
+                        help='retoma a última importação interrompida da mesma origem, pulando os lotes já confirmados')
+    args = parser.parse_args()
+    
     print("🚀 Iniciando importação de contratos para o Supabase...")
     
     try:
-        # Limpar contratos existentes
-        clear_existing_contracts()
+        mode = import_mode()
+        
+        # Limpar contratos existentes (o modo upsert não apaga a tabela,
+        # e uma importação retomada continua de onde parou)
+        journal = None
+        if mode == 'replace':
+            journal = ImportJournal('contracts', contracts_source_path(), BATCH_SIZE, resume=args.resume)
+            if journal.resumed:
+                print(f"♻️  Retomando importação: {len(journal.done)} lotes já confirmados "
+                      f"({journal.done_rows} contratos)")
+            else:
+                clear_existing_contracts()
+        elif args.resume:
+            print("♻️  Modo upsert: só o que falta ou mudou será enviado")
         
         # Carregar contratos do CSV
         contracts = load_contracts_from_csv()
@@ -188,7 +248,10 @@ def main():
             return
         
         # Importar contratos
-        successful, failed = import_all_contracts(contracts)
+        if mode == 'upsert':
+            successful, failed = sync_all_contracts(contracts, delete_missing_enabled())
+        else:
+            successful, failed = import_all_contracts(contracts, journal=journal)
         
         # Verificar importação
         total_in_db = verify_import()
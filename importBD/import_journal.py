@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Diário de lotes das importações, para retomar uma importação interrompida
+
+Cada importação grava em .import_journal/<tabela>-<hash>.jsonl (hash = SHA-256
+do arquivo de origem) uma linha por lote enviado e por lote confirmado pelo
+Supabase. Com --resume, a mesma origem retoma do ponto em que parou:
+- lotes confirmados são pulados
+- lotes enviados sem confirmação (em andamento quando o processo morreu) passam
+  por reconcile antes de serem reenviados, para tirar as linhas que já chegaram
+  ao banco (pelo external_id ou id determinístico) e não duplicar nada
+- a tabela não é limpa de novo
+
+Se a origem mudou (outro hash) ou o tamanho do lote é outro, o diário antigo não
+vale e a importação começa do zero. O diretório pode ser alterado com IMPORT_JOURNAL_DIR.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence, Set, Tuple
+
+from batch_uploader import BatchResult
+
+DEFAULT_JOURNAL_DIR = '.import_journal'
+
+Reconcile = Callable[[Sequence[Any]], Sequence[Any]]
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImportJournal:
+    """
+    Lotes enviados/confirmados de uma importação de table a partir de source_path
+    """
+
+    def __init__(self, table: str, source_path: str, batch_size: int, resume: bool = False,
+                 directory: Optional[str] = None):
+        self.table = table
+        self.batch_size = batch_size
+        self.source_hash = file_sha256(source_path)
+        directory = directory or os.getenv('IMPORT_JOURNAL_DIR') or DEFAULT_JOURNAL_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{table}-{self.source_hash[:16]}.jsonl")
+        self.header = {'table': table, 'source': source_path, 'sha256': self.source_hash,
+                       'batch_size': batch_size}
+
+        self.sent: Set[int] = set()
+        self.done: Set[int] = set()
+        self.done_rows = 0
+        self.complete = False
+        self.resumed = resume and self._load()
+        self._lock = threading.Lock()
+        if self.resumed:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._write(dict(self.header, started_at=datetime.now().isoformat()))
+
+    def _load(self) -> bool:
+        """Lê o diário existente; False se não houver um válido para esta origem"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return False
+        if not lines or any(lines[0].get(key) != value for key, value in self.header.items()):
+            return False
+        for entry in lines[1:]:
+            if 'sent' in entry:
+                self.sent.add(entry['sent'])
+            elif 'done' in entry:
+                self.done.add(entry['done'])
+                self.done_rows += entry.get('rows', 0)
+            elif entry.get('complete'):
+                self.complete = True
+        return True
+
+    def _write(self, entry: dict):
+        # Uma linha por evento, forçada para o disco: sobrevive à queda do processo
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    @property
+    def uncertain(self) -> Set[int]:
+        """Lotes enviados sem confirmação: podem ou não ter chegado ao banco"""
+        return self.sent - self.done
+
+    def pending(self, batches: Iterable[Sequence[Any]],
+                reconcile: Optional[Reconcile] = None) -> Iterator[Tuple[int, Sequence[Any]]]:
+        """
+        Pares (número, lote) que ainda precisam ser enviados (para upload_batches(..., numbered=True)).
+        Cada lote é registrado como enviado quando é entregue
+        """
+        for number, batch in enumerate(batches, 1):
+            if number in self.done:
+                continue
+            if reconcile is not None and number in self.uncertain:
+                remaining = reconcile(batch)
+                if not remaining:
+                    # Já estava todo no banco
+                    self.record(BatchResult(number, len(batch), True))
+                    continue
+                batch = remaining
+            with self._lock:
+                self.sent.add(number)
+                self._write({'sent': number})
+            yield number, batch
+
+    def record(self, result: BatchResult):
+        """
+        Registra um lote confirmado (serve como on_result de upload_batches). Um lote
+        com linhas recusadas pela bisseção também conta como resolvido: as boas foram
+        gravadas e as recusadas estão no dead letter
+        """
+        if not result.success and not result.rejected:
+            return
+        with self._lock:
+            self.done.add(result.number)
+            self.done_rows += result.committed_rows
+            self._write({'done': result.number, 'rows': result.committed_rows})
+
+    def finish(self):
+        """Marca a importação como concluída (sem falhas) e fecha o diário"""
+        with self._lock:
+            if not self.uncertain:
+                self.complete = True
+                self._write({'complete': True, 'finished_at': datetime.now().isoformat()})
+        self.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
@@ -1,9 +1,19 @@
 import os
 import csv
-import requests
+import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 
+from batch_uploader import chunked, upload_batches, upload_concurrency
+from columnar_io import read_table_records, table_format, table_path
+from dead_letter import DeadLetterWriter
+from import_journal import ImportJournal
+from monetary_parser import parse_decimal_columns
+from supabase_client import SupabaseHTTPError, get_client
+from table_reader import iter_rows
+from table_stats import count_rows
+from upsert_sync import delete_missing_enabled, existing_keys, import_mode, sync_table
+
 # Carregar variáveis do arquivo .env do backend
 env_path = '/Users/insitutoareluna/Documents/finance/backend/.env'
 load_dotenv(env_path)
@@ -12,6 +22,15 @@ load_dotenv(env_path)
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 
+# Linhas por lote (o diário de retomada só vale para o mesmo tamanho de lote)
+BATCH_SIZE = 100
+# Pagamentos recusados pelo Supabase (isolados por bisseção dos lotes)
+DEAD_LETTER_FILE = 'payments_dead_letter.csv'
+
+def get_supabase():
+    """Cliente compartilhado (conexões reutilizadas) com a service key"""
+    return get_client(SUPABASE_URL, SUPABASE_SERVICE_KEY, pool_size=upload_concurrency())
+
 def parse_date(date_str):
     """Converte string de data para formato ISO"""
     if not date_str or date_str.strip() == '':
@@ -27,47 +46,26 @@ def parse_date(date_str):
     except:
         return None
 
-def parse_decimal(value_str):
-    """Converte string para decimal"""
-    if not value_str or value_str.strip() == '':
-        return None
-    try:
-        return float(str(value_str).replace(',', '.'))
-    except:
-        return None
-
 def create_contract_mapping():
     """Cria mapeamento entre IDs do CSV e IDs do Supabase usando as notes"""
     print("🔗 Criando mapeamento de contratos...")
     
-    # Buscar todos os contratos do Supabase
-    response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/contracts",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Content-Type": "application/json"
-        },
-        params={"select": "id,notes"}
-    )
-    
-    if response.status_code not in [200, 206]:
-        print(f"❌ Erro ao buscar contratos: {response.status_code}")
-        return {}
-    
-    contracts = response.json()
     mapping = {}
     
-    # Extrair ID original das notes
+    # Buscar todos os contratos do Supabase (em páginas) e extrair o ID original das notes
     import re
-    for contract in contracts:
-        notes = contract.get('notes', '') or ''
-        # Procurar padrão [ID:xxxxx] nas notes
-        match = re.search(r'\[ID:([^\]]+)\]', notes)
-        if match:
-            csv_id = match.group(1)
-            supabase_id = contract['id']
-            mapping[csv_id] = supabase_id
+    try:
+        for contract in iter_rows(get_supabase(), 'contracts', select='id,notes'):
+            notes = contract.get('notes', '') or ''
+            # Procurar padrão [ID:xxxxx] nas notes
+            match = re.search(r'\[ID:([^\]]+)\]', notes)
+            if match:
+                csv_id = match.group(1)
+                supabase_id = contract['id']
+                mapping[csv_id] = supabase_id
+    except SupabaseHTTPError as e:
+        print(f"❌ Erro ao buscar contratos: {e.status}")
+        return {}
     
     print(f"✅ Mapeamento criado: {len(mapping)} contratos mapeados")
     return mapping
@@ -83,7 +81,7 @@ def prepare_payment_data(payment_row, contract_mapping):
     
     return {
         'contract_id': supabase_contract_id,
-        'amount': parse_decimal(payment_row.get('amount')),
+        'amount': payment_row.get('amount'),
         'due_date': parse_date(payment_row.get('due_date')),
         'paid_date': parse_date(payment_row.get('payment_date')),  # CSV usa 'payment_date', tabela usa 'paid_date'
         'status': payment_row.get('status', '').strip() or 'pending',
@@ -93,40 +91,44 @@ def prepare_payment_data(payment_row, contract_mapping):
         'payment_type': payment_row.get('payment_type', '').strip() or None
     }
 
+# Colunas comparadas no modo upsert para decidir se o pagamento mudou
+PAYMENT_SYNC_COLUMNS = ['contract_id', 'amount', 'due_date', 'paid_date', 'status',
+                        'payment_method', 'notes', 'payment_type']
+
 def clear_existing_payments():
     """Remove todos os pagamentos existentes"""
     print("🗑️  Limpando pagamentos existentes...")
+    client = get_supabase()
     
     # Primeiro, contar quantos existem
-    response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/payments?select=count",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Prefer": "count=exact"
-        }
-    )
-    
-    if response.status_code == 200:
-        count = response.headers.get('Content-Range', '0').split('/')[-1]
+    try:
+        count = count_rows(client, 'payments')
         print(f"📊 Encontrados {count} pagamentos existentes")
+    except SupabaseHTTPError:
+        pass
     
     # Remover todos
-    response = requests.delete(
-        f"{SUPABASE_URL}/rest/v1/payments?id=neq.00000000-0000-0000-0000-000000000000",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}"
-        }
-    )
-    
-    if response.status_code == 204:
+    try:
+        client.delete('payments', params={'id': 'neq.00000000-0000-0000-0000-000000000000'})
         print("✅ Pagamentos existentes removidos com sucesso")
-    else:
-        print(f"⚠️  Aviso ao limpar pagamentos: {response.status_code}")
+    except SupabaseHTTPError as e:
+        print(f"⚠️  Aviso ao limpar pagamentos: {e.status}")
+
+def payments_source_path():
+    """Arquivo de onde os pagamentos são lidos (identifica o diário de retomada)"""
+    fmt = table_format()
+    return 'payments.csv' if fmt == 'csv' else table_path('payments.csv', fmt)
 
 def load_payments_from_csv():
     """Carrega pagamentos do arquivo CSV"""
+    # Versão colunar (já tipada), se configurada em CONTRATOS_TABLE_FORMAT
+    fmt = table_format()
+    if fmt != 'csv':
+        print(f"📋 Carregando pagamentos de payments.{fmt}...")
+        payments = read_table_records('payments.csv', 'payments', fmt)
+        print(f"✅ {len(payments)} pagamentos carregados")
+        return payments
+    
     print("📋 Carregando pagamentos de payments.csv...")
     payments = []
     
@@ -135,11 +137,17 @@ def load_payments_from_csv():
         for row in reader:
             payments.append(row)
     
+    parse_decimal_columns(payments, ['amount'])
+    
     print(f"✅ {len(payments)} pagamentos carregados do CSV")
     return payments
 
 def import_payments_batch(payments_batch, contract_mapping):
-    """Importa um lote de pagamentos"""
+    """
+    Importa um lote de pagamentos (executado em paralelo por batch_uploader).
+    Levanta exceção se o lote falhar. Um lote (ou metade, na bisseção) só com
+    pagamentos sem contrato mapeado não tem o que enviar e termina sem erro
+    """
     # Preparar dados dos pagamentos
     payments_data = []
     for payment_row in payments_batch:
@@ -148,72 +156,120 @@ def import_payments_batch(payments_batch, contract_mapping):
             payments_data.append(payment_data)
     
     if not payments_data:
-        print("⚠️  Nenhum pagamento válido no lote")
-        return False, None
+        return
     
-    response = requests.post(
-        f"{SUPABASE_URL}/rest/v1/payments",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Content-Type": "application/json",
-            "Prefer": "return=minimal"
-        },
-        json=payments_data
-    )
+    get_supabase().post('payments', data=payments_data, headers={"Prefer": "return=minimal"})
+
+def unsent_payments(payments_batch):
+    """Retomada: tira do lote os pagamentos que já chegaram ao banco (pelo external_id)"""
+    ids = [payment_row.get('id', '').strip() for payment_row in payments_batch]
+    present = existing_keys(get_supabase(), 'payments', ids)
+    return [payment_row for payment_row, payment_id in zip(payments_batch, ids) if payment_id not in present]
+
+def import_all_payments(payments, contract_mapping, batch_size=BATCH_SIZE, journal=None):
+    """
+    Importa todos os pagamentos em lotes, com vários lotes em andamento ao mesmo tempo.
+    Com journal, cada lote confirmado é registrado e os já confirmados são pulados.
+    Lotes recusados são divididos até isolar os pagamentos inválidos, que vão para DEAD_LETTER_FILE
+    """
+    total_batches = (len(payments) + batch_size - 1) // batch_size
+    concurrency = upload_concurrency()
+    dead_letter = DeadLetterWriter(DEAD_LETTER_FILE, append=bool(journal and journal.resumed))
+    print(f"📤 Iniciando importação de {len(payments)} pagamentos "
+          f"({total_batches} lotes, até {concurrency} simultâneos)...")
+    
+    def report(result):
+        if journal:
+            journal.record(result)
+        if result.success:
+            print(f"✅ Lote {result.number}/{total_batches} importado com sucesso ({result.rows} pagamentos)")
+        elif result.rejected:
+            dead_letter.write(result)
+            print(f"⚠️  Lote {result.number}/{total_batches}: {result.committed_rows} pagamentos gravados, "
+                  f"{len(result.rejected)} recusados ({result.status} - {result.error})")
+        else:
+            print(f"❌ Erro no lote: {result.status} - {result.error}")
+            print(f"❌ Falha no lote {result.number}")
+    
+    batches = chunked(payments, batch_size)
+    if journal:
+        batches = journal.pending(batches, reconcile=unsent_payments)
+    summary = upload_batches(batches, lambda batch: import_payments_batch(batch, contract_mapping),
+                             concurrency, on_result=report, numbered=journal is not None, bisect=True)
+    print(f"⏱️  {len(summary.results)} lotes enviados em {summary.elapsed:.1f}s")
+    dead_letter.close()
+    if dead_letter.count:
+        print(f"📄 {dead_letter.count} pagamentos recusados gravados em {DEAD_LETTER_FILE}")
+    if journal:
+        journal.finish()
     
-    return response.status_code == 201, response
+    # Com diário, contam também os lotes confirmados em execuções anteriores
+    succeeded = journal.done_rows if journal else summary.succeeded_rows
+    return succeeded, summary.failed_rows
 
-def import_all_payments(payments, contract_mapping):
-    """Importa todos os pagamentos em lotes"""
-    print(f"📤 Iniciando importação de {len(payments)} pagamentos...")
+def sync_all_payments(payments, contract_mapping, delete_missing=False, batch_size=100):
+    """
+    Modo upsert: envia só os pagamentos novos ou alterados (por external_id) e,
+    com delete_missing, remove os que não estão mais no CSV
+    """
+    payments_data = []
+    invalid = 0
+    for payment_row in payments:
+        payment_data = prepare_payment_data(payment_row, contract_mapping)
+        if payment_data:
+            payments_data.append(payment_data)
+        else:
+            invalid += 1
     
-    batch_size = 100
-    total_batches = (len(payments) + batch_size - 1) // batch_size
-    successful_imports = 0
-    failed_imports = 0
+    concurrency = upload_concurrency()
+    dead_letter = DeadLetterWriter(DEAD_LETTER_FILE)
+    print(f"🔄 Sincronizando {len(payments_data)} pagamentos (até {concurrency} lotes simultâneos)...")
     
-    for i in range(0, len(payments), batch_size):
-        batch_num = (i // batch_size) + 1
-        batch = payments[i:i + batch_size]
-        
-        print(f"📦 Processando lote {batch_num}/{total_batches} ({len(batch)} pagamentos)...")
-        
-        success, response = import_payments_batch(batch, contract_mapping)
-        
-        if success:
-            print(f"✅ Lote {batch_num} importado com sucesso")
-            successful_imports += len(batch)
+    def report(result):
+        if result.success:
+            print(f"✅ Lote {result.number} sincronizado com sucesso ({result.rows} pagamentos)")
+        elif result.rejected:
+            dead_letter.write(result)
+            print(f"⚠️  Lote {result.number}: {result.committed_rows} pagamentos gravados, "
+                  f"{len(result.rejected)} recusados ({result.status} - {result.error})")
         else:
-            if response:
-                print(f"❌ Erro no lote: {response.status_code} - {response.text}")
-            print(f"❌ Falha no lote {batch_num}")
-            failed_imports += len(batch)
+            print(f"❌ Erro no lote: {result.status} - {result.error}")
+            print(f"❌ Falha no lote {result.number}")
+    
+    # Com pagamentos inválidos, a origem está incompleta: não remove os ausentes
+    if delete_missing and invalid:
+        print(f"⚠️  {invalid} pagamentos sem contrato: remoção de ausentes desativada")
+        delete_missing = False
+    
+    result = sync_table(get_supabase(), 'payments', payments_data, PAYMENT_SYNC_COLUMNS,
+                        delete_missing=delete_missing, batch_size=batch_size,
+                        max_in_flight=concurrency, on_result=report, bisect=True)
+    print(f"⏱️  {len(result.plan.rows)} pagamentos enviados em {result.upload.elapsed:.1f}s")
+    dead_letter.close()
+    if dead_letter.count:
+        print(f"📄 {dead_letter.count} pagamentos recusados gravados em {DEAD_LETTER_FILE}")
     
-    return successful_imports, failed_imports
+    return result.succeeded_rows, result.failed_rows + invalid
 
 def verify_import():
     """Verifica se a importação foi bem-sucedida"""
     print("🔍 Verificando importação...")
     
-    response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/payments?select=count",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Prefer": "count=exact"
-        }
-    )
-    
-    if response.status_code == 200:
-        count = response.headers.get('Content-Range', '0').split('/')[-1]
-        print(f"📊 Total de pagamentos no banco: {count}")
-        return int(count)
-    else:
-        print(f"❌ Erro ao verificar: {response.status_code}")
+    try:
+        count = count_rows(get_supabase(), 'payments') or 0
+    except SupabaseHTTPError as e:
+        print(f"❌ Erro ao verificar: {e.status}")
         return 0
+    
+    print(f"📊 Total de pagamentos no banco: {count}")
+    return int(count)
 
 def main():
+    parser = argparse.ArgumentParser(description='Importa payments.csv para o Supabase')
+    parser.add_argument('--resume', action='store_true',
+                        help='retoma a última importação interrompida da mesma origem, pulando os lotes já confirmados')
+    args = parser.parse_args()
+    
     print("🚀 Iniciando importação de pagamentos para o Supabase...")
     
     try:
@@ -224,8 +280,19 @@ def main():
             print("❌ Nenhum contrato encontrado para mapeamento")
             return
         
-        # Limpar pagamentos existentes
-        clear_existing_payments()
+        # Limpar pagamentos existentes (o modo upsert não apaga a tabela,
+        # e uma importação retomada continua de onde parou)
+        mode = import_mode()
+        journal = None
+        if mode == 'replace':
+            journal = ImportJournal('payments', payments_source_path(), BATCH_SIZE, resume=args.resume)
+            if journal.resumed:
+                print(f"♻️  Retomando importação: {len(journal.done)} lotes já confirmados "
+                      f"({journal.done_rows} pagamentos)")
+            else:
+                clear_existing_payments()
+        elif args.resume:
+            print("♻️  Modo upsert: só o que falta ou mudou será enviado")
         
         # Carregar pagamentos do CSV
         payments = load_payments_from_csv()
@@ -235,7 +302,10 @@ def main():
             return
         
         # Importar pagamentos
-        successful, failed = import_all_payments(payments, contract_mapping)
+        if mode == 'upsert':
+            successful, failed = sync_all_payments(payments, contract_mapping, delete_missing_enabled())
+        else:
+            successful, failed = import_all_payments(payments, contract_mapping, journal=journal)
         
         # Verificar importação
         total_in_db = verify_import()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backups incrementais por marca d'água (updated_at, id), com estado persistido
+
+Para cada tabela, o arquivo de estado guarda a maior (updated_at, id) já salva.
+Cada execução lê, em páginas, só as linhas com (updated_at, id) acima da marca,
+ou seja, criadas ou alteradas desde a execução anterior, e avança a marca
+depois de gravar o arquivo. O id desempata linhas com o mesmo updated_at, então
+nada é perdido ou repetido entre páginas nem entre execuções.
+
+Exclusões não alteram updated_at: de tempos em tempos (detect_deletes) o conjunto
+de ids da tabela é comparado com o da verificação anterior, e os ids que sumiram
+são gravados em <tabela>_deleted_<data>.csv (entrada <tabela>_deleted do manifesto).
+Cada backup completo grava o conjunto de ids do próprio snapshot (seed_ids), então
+exclusões feitas entre o completo e a verificação seguinte também são registradas.
+
+As alterações são gravadas pelo backup_writer (formato em BACKUP_FORMAT) e
+descritas no manifest.json do diretório do incremental.
+
+Restauração: último backup completo + incrementais posteriores, em ordem
+(linhas repetidas são a mesma linha, pelo id) - exclusões aplicadas no fim.
+Linhas com updated_at nulo só entram nos backups completos.
+
+Estado (JSON):
+    {"tables": {"payments": {"watermark": ["2024-05-01T10:00:00+00:00", "uuid"],
+                             "last_incremental": "...", "last_id_check": "..."}},
+     "last_full": "..."}
+Os conjuntos de ids ficam ao lado, em <arquivo de estado>.ids/<tabela>.txt.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from backup_writer import TableBackupWriter
+from supabase_client import SupabaseClient
+from table_reader import iter_pages, iter_rows, row_cursor
+
+WATERMARK_KEY = ('updated_at', 'id')
+
+
+class BackupState:
+    """Marcas d'água e datas das últimas execuções, salvas em path"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict[str, Any] = {'tables': {}}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+            self.data.setdefault('tables', {})
+
+    def table(self, name: str) -> Dict[str, Any]:
+        return self.data['tables'].setdefault(name, {})
+
+    def save(self):
+        # Grava em arquivo temporário e troca: uma queda no meio não corrompe o estado
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(temporary, self.path)
+
+    @staticmethod
+    def _due(timestamp: Optional[str], hours: float) -> bool:
+        return not timestamp or datetime.now() - datetime.fromisoformat(timestamp) >= timedelta(hours=hours)
+
+    def full_due(self, hours: float) -> bool:
+        """Se já passou o intervalo entre backups completos (ou nunca houve um)"""
+        return self._due(self.data.get('last_full'), hours)
+
+    def mark_full(self):
+        self.data['last_full'] = datetime.now().isoformat()
+
+    def id_check_due(self, table: str, hours: float) -> bool:
+        return self._due(self.table(table).get('last_id_check'), hours)
+
+    def ids_path(self, table: str) -> str:
+        return os.path.join(f"{self.path}.ids", f"{table}.txt")
+
+
+def backup_changes(client: SupabaseClient, table: str, backup_dir: str, state: BackupState,
+                   files: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Grava em backup_dir as linhas de table alteradas desde a marca d'água e avança
+    a marca (só em memória: state.save() confirma). A entrada do arquivo gravado
+    vai para files (manifesto). Devolve o número de linhas
+    """
+    table_state = state.table(table)
+    watermark = table_state.get('watermark')
+    writer = TableBackupWriter(backup_dir, f"{table}_incremental_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+    last_row = None
+    try:
+        for page in iter_pages(client, table, key=WATERMARK_KEY, after=watermark):
+            writer.write_rows(page)
+            last_row = page[-1]
+        entry = writer.close()
+    except Exception:
+        # Arquivo incompleto não serve para restaurar; a marca não avança
+        writer.abort()
+        raise
+
+    if entry is None:
+        print(f"ℹ️  Nenhum registro novo ou alterado em '{table}'")
+    else:
+        table_state['watermark'] = list(row_cursor(last_row, WATERMARK_KEY))
+        print(f"✅ {entry['rows']} registros novos/alterados salvos em {entry['file']}")
+    if files is not None:
+        files[table] = entry
+    table_state['last_incremental'] = datetime.now().isoformat()
+    return writer.rows
+
+
+def init_watermark(client: SupabaseClient, table: str, state: BackupState):
+    """
+    Marca d'água inicial = maior (updated_at, id) atual. Chamada antes de um backup
+    completo, evita que o primeiro incremental copie a tabela inteira de novo
+    """
+    table_state = state.table(table)
+    if table_state.get('watermark'):
+        return
+    rows = client.request_json('GET', table, params=[
+        ('select', ','.join(WATERMARK_KEY)), ('updated_at', 'not.is.null'),
+        ('order', ','.join(f'{column}.desc' for column in WATERMARK_KEY)), ('limit', '1')], empty=[])
+    if rows:
+        table_state['watermark'] = list(row_cursor(rows[0], WATERMARK_KEY))
+
+
+def _read_ids(path: str) -> Optional[Set[str]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def seed_ids(state: BackupState, table: str, ids: Iterable[str], checked_at: Optional[str] = None):
+    """
+    Grava o conjunto de ids de referência da próxima verificação de exclusões
+    (ex.: os ids de um snapshot completo, com checked_at = data do snapshot)
+    """
+    ids_path = state.ids_path(table)
+    os.makedirs(os.path.dirname(ids_path), exist_ok=True)
+    temporary = f"{ids_path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.writelines(f"{current_id}\n" for current_id in ids)
+    os.replace(temporary, ids_path)
+    state.table(table)['last_id_check'] = checked_at or datetime.now().isoformat()
+
+
+def detect_deletes(client: SupabaseClient, table: str, backup_dir: str, state: BackupState,
+                   files: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Compara os ids atuais da tabela com os da verificação anterior (ou do último
+    backup completo) e grava os que sumiram; a entrada do arquivo vai para files
+    como <tabela>_deleted. Sem conjunto anterior, só guarda o atual. Devolve o número de exclusões
+    """
+    previous = _read_ids(state.ids_path(table))
+    current: List[str] = [str(row['id']) for row in iter_rows(client, table, select='id')]
+
+    deleted = sorted(previous - set(current)) if previous is not None else []
+    if deleted:
+        writer = TableBackupWriter(backup_dir, f"{table}_deleted_{datetime.now().strftime('%Y%m%d_%H%M%S')}", 'csv')
+        writer.write_rows({'id': deleted_id} for deleted_id in deleted)
+        entry = writer.close()
+        if files is not None:
+            files[f"{table}_deleted"] = entry
+        print(f"🗑️  {len(deleted)} registros excluídos de '{table}' registrados em {entry['file']}")
+
+    seed_ids(state, table, current)
+    return len(deleted)
@@ -1,9 +1,6 @@
 #!/usr/bin/env python3
 
-import json
-import urllib.request
-import urllib.parse
-import urllib.error
+from supabase_client import get_client
 
 # Configuração do Supabase
 SUPABASE_URL = "https://sxbslulfitfsijqrzljd.supabase.co"
@@ -11,30 +8,8 @@ SUPABASE_ANON_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZS
 
 def make_supabase_request(method, endpoint, params=None, data=None):
     """Faz uma requisição HTTP para o Supabase"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    
-    if params:
-        url += "?" + urllib.parse.urlencode(params)
-    
-    headers = {
-        'apikey': SUPABASE_ANON_KEY,
-        'Authorization': f'Bearer {SUPABASE_ANON_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    if data:
-        data = json.dumps(data).encode('utf-8')
-    
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    
     try:
-        with urllib.request.urlopen(req) as response:
-            if response.status in [200, 201, 204]:
-                content = response.read().decode('utf-8')
-                return json.loads(content) if content else []
-            else:
-                print(f"Erro HTTP {response.status}: {response.read().decode('utf-8')}")
-                return None
+        return get_client(SUPABASE_URL, SUPABASE_ANON_KEY).request_json(method, endpoint, params=params, data=data, empty=[])
     except Exception as e:
         print(f"Erro na requisição: {str(e)}")
         return None
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parser vetorizado de valores monetários das planilhas de contratos
+
+Substitui os parsers escalares espalhados pelos scripts (normalize_monetary_value,
+clean_currency_value, parse_decimal). Converte uma coluna ou bloco inteiro de uma vez
+e entende o formato europeu usado nas planilhas:
+- " €  5.100,00 " → 5100.00 (ponto como separador de milhares)
+- "-1.534,37" e "(1.534,37)" → 1534.37 com sinal negativo
+- "ß", "#NAME?", "#REF!", "-" etc. → erro (célula preenchida sem valor utilizável)
+"""
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Marcadores do Excel que nunca representam um valor
+SENTINEL_VALUES = frozenset({
+    'ß', '-', '#NAME?', '#REF!', '#ERROR!', '#VALUE!', '#N/A', '#DIV/0!', '#NUM!', '#NULL!'
+})
+
+# Símbolo de moeda e qualquer espaço (inclusive o não separável do Excel)
+_NOISE_PATTERN = r'[€\s]'
+
+# Número já normalizado: dígitos com no máximo um ponto decimal
+_NUMBER_PATTERN = r'\d+(?:\.\d*)?|\.\d+'
+
+
+class MonetaryParseResult(NamedTuple):
+    """
+    Resultado do parse de um bloco de células, com o mesmo formato da entrada
+    - amounts: valor absoluto (NaN para células vazias ou inválidas)
+    - negative: True quando o valor tinha sinal '-' ou estava entre parênteses
+    - errors: True quando a célula estava preenchida mas não pôde ser convertida
+    """
+    amounts: np.ndarray
+    negative: np.ndarray
+    errors: np.ndarray
+
+    @property
+    def filled(self) -> np.ndarray:
+        """Células com algum conteúdo (válido ou não)"""
+        return ~np.isnan(self.amounts) | self.errors
+
+    def signed(self) -> np.ndarray:
+        """Valores com o sinal original aplicado"""
+        return np.where(self.negative, -self.amounts, self.amounts)
+
+
+def _parse_unique_texts(texts: pd.Series) -> MonetaryParseResult:
+    """
+    Aplica as regras de normalização a uma série de textos distintos
+    """
+    text = texts.astype(str).str.replace(_NOISE_PATTERN, '', regex=True)
+    blank = (text == '').to_numpy()
+    sentinel = text.isin(SENTINEL_VALUES).to_numpy()
+
+    # Parênteses e sinal de menos indicam valor negativo
+    parens = text.str.startswith('(') & text.str.endswith(')')
+    body = text.where(~parens, text.str.slice(1, -1))
+    minus = body.str.startswith('-')
+    body = body.str.replace(r'^[+-]', '', regex=True)
+
+    # Separador decimal: vírgula única depois do último ponto ("1.534,37"),
+    # ou vários pontos sem vírgula ("1.534.000"); caso contrário o ponto é decimal
+    n_commas = body.str.count(',')
+    n_dots = body.str.count(r'\.')
+    comma_decimal = ((n_commas == 1) & (body.str.rfind(',') > body.str.rfind('.'))) | \
+                    ((n_dots > 1) & (n_commas == 0))
+    normalized = body.str.replace('.', '', regex=False).str.replace(',', '.', regex=False).where(
+        comma_decimal, body.str.replace(',', '', regex=False)
+    )
+
+    well_formed = normalized.str.fullmatch(_NUMBER_PATTERN).to_numpy(dtype=bool) & ~sentinel
+    numbers = pd.to_numeric(normalized.where(well_formed), errors='coerce').to_numpy(dtype=float)
+
+    return MonetaryParseResult(
+        amounts=np.abs(numbers),
+        negative=(parens | minus).to_numpy(dtype=bool) & well_formed,
+        errors=~blank & ~well_formed
+    )
+
+
+def parse_monetary_series(values: Any) -> MonetaryParseResult:
+    """
+    Converte uma coluna (Series, array ou lista) ou um bloco 2D de células monetárias.
+    Cada texto distinto é normalizado uma única vez; os resultados são espalhados
+    de volta para todas as células com o mesmo conteúdo
+    """
+    if isinstance(values, (pd.Series, pd.DataFrame)):
+        values = values.to_numpy()
+    elif not isinstance(values, np.ndarray):
+        # dtype=object evita que listas mistas virem texto ('nan', '1.5')
+        values = np.array(values, dtype=object)
+    shape = values.shape
+
+    # Colunas que o pandas já leu como numéricas dispensam o parse de texto
+    if values.dtype.kind in 'iuf':
+        numbers = values.astype(float)
+        return MonetaryParseResult(np.abs(numbers), numbers < 0, np.zeros(shape, dtype=bool))
+
+    flat = values.astype(object).ravel()
+    codes, uniques = pd.factorize(flat, use_na_sentinel=True)
+    parsed = _parse_unique_texts(pd.Series(uniques, dtype=object))
+
+    # Código -1 = célula nula (NaN/None): vazia, sem erro
+    present = codes >= 0
+    amounts = np.full(flat.shape, np.nan)
+    negative = np.zeros(flat.shape, dtype=bool)
+    errors = np.zeros(flat.shape, dtype=bool)
+    amounts[present] = parsed.amounts[codes[present]]
+    negative[present] = parsed.negative[codes[present]]
+    errors[present] = parsed.errors[codes[present]]
+
+    return MonetaryParseResult(amounts.reshape(shape), negative.reshape(shape), errors.reshape(shape))
+
+
+def parse_monetary_value(value: Any) -> Optional[float]:
+    """
+    Conveniência para um único valor: retorna o valor com sinal ou None se vazio/inválido.
+    Em laços sobre muitas células prefira parse_monetary_series
+    """
+    result = parse_monetary_series([value])
+    if np.isnan(result.amounts[0]):
+        return None
+    return float(result.signed()[0])
+
+
+def monetary_column(df: pd.DataFrame, column: str, fill_value: float = 0.0) -> pd.Series:
+    """
+    Valores com sinal de uma coluna, alinhados ao índice do DataFrame.
+    Células vazias/inválidas (ou coluna ausente) recebem fill_value
+    """
+    if column not in df.columns:
+        return pd.Series(fill_value, index=df.index, dtype=float)
+    signed = parse_monetary_series(df[column]).signed()
+    return pd.Series(np.where(np.isnan(signed), fill_value, signed), index=df.index)
+
+
+def parse_decimal_column(values: Any) -> List[Optional[float]]:
+    """
+    Valores com sinal como floats Python (None para vazios/inválidos), prontos para JSON
+    """
+    signed = parse_monetary_series(values).signed()
+    return [None if np.isnan(value) else value for value in signed.tolist()]
+
+
+def parse_decimal_columns(rows: List[Dict[str, Any]], columns: Iterable[str]) -> None:
+    """
+    Converte in-place colunas monetárias de linhas lidas com csv.DictReader,
+    uma coluna inteira por vez
+    """
+    for column in columns:
+        values = parse_decimal_column([row.get(column) for row in rows])
+        for row, value in zip(rows, values):
+            row[column] = value
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backup de várias tabelas em paralelo, com as tabelas grandes divididas em faixas
+
+As tabelas eram exportadas uma depois da outra, cada uma em uma leitura só. Aqui:
+- todas as tabelas entram em uma fila única de tarefas, executadas por até
+  BACKUP_CONCURRENCY workers (padrão: 4) - o limite vale para o backup inteiro,
+  então o banco nunca recebe mais que isso em leituras simultâneas
+- tabelas com mais de BACKUP_PARTITION_ROWS linhas (padrão: 100000) são divididas
+  em faixas de tamanho parecido da coluna de partição (id por padrão, ou uma data
+  como created_at), e cada faixa vira uma tarefa com seu próprio arquivo
+- os limites das faixas saem da contagem (HEAD) e de consultas de uma linha com
+  offset na coluna ordenada: não é preciso conhecer a distribuição dos valores
+
+Dentro de cada faixa a leitura continua por id (keyset, sem busca antecipada: o
+paralelismo já vem dos workers). Linhas com a coluna de partição nula ficam em
+uma faixa própria. No manifesto, uma tabela dividida tem a lista das faixas em
+"parts" (arquivo, linhas, bytes, SHA-256 e filtros PostgREST de cada uma).
+"""
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from backup_writer import TableBackupWriter, backup_format
+from supabase_client import SupabaseClient
+from table_reader import iter_pages
+from table_stats import count_rows
+
+CONCURRENCY_ENV = 'BACKUP_CONCURRENCY'
+DEFAULT_CONCURRENCY = 4
+PARTITION_ROWS_ENV = 'BACKUP_PARTITION_ROWS'
+DEFAULT_PARTITION_ROWS = 100000
+
+Range = Tuple[Any, Any]  # (início inclusive, fim exclusive); None = sem limite
+Filters = List[Tuple[str, str]]
+
+
+def _positive_env(name: str, default: int) -> int:
+    value = os.getenv(name, '').strip()
+    if not value:
+        return default
+    number = int(value)
+    if number <= 0:
+        raise ValueError(f"{name} deve ser positivo: {value}")
+    return number
+
+
+def backup_concurrency() -> int:
+    """Leituras simultâneas configuradas em BACKUP_CONCURRENCY"""
+    return _positive_env(CONCURRENCY_ENV, DEFAULT_CONCURRENCY)
+
+
+def partition_rows() -> int:
+    """Linhas por faixa configuradas em BACKUP_PARTITION_ROWS"""
+    return _positive_env(PARTITION_ROWS_ENV, DEFAULT_PARTITION_ROWS)
+
+
+def _value_at(client: SupabaseClient, table: str, column: str, offset: int) -> Any:
+    rows = client.request_json('GET', table, params=[
+        ('select', column), (column, 'not.is.null'), ('order', f'{column}.asc'),
+        ('offset', str(offset)), ('limit', '1')], empty=[])
+    return rows[0][column] if rows else None
+
+
+def split_ranges(client: SupabaseClient, table: str, column: str, count: int, parts: int) -> List[Range]:
+    """
+    Divide os valores não nulos de column em até parts faixas com ~count/parts linhas.
+    Valores repetidos no limite (datas) deixam a faixa maior, nunca perdem linhas
+    """
+    boundaries = []
+    for part in range(1, parts):
+        value = _value_at(client, table, column, part * count // parts)
+        if value is not None and (not boundaries or value > boundaries[-1]):
+            boundaries.append(value)
+    return list(zip([None, *boundaries], [*boundaries, None]))
+
+
+def range_filters(column: str, value_range: Range) -> Filters:
+    start, end = value_range
+    filters = []
+    if start is not None:
+        filters.append((column, f'gte.{start}'))
+    if end is not None:
+        filters.append((column, f'lt.{end}'))
+    return filters
+
+
+def _backup_part(client: SupabaseClient, table: str, backup_dir: str, name: str,
+                 filters: Filters, fmt: str) -> Optional[Dict[str, Any]]:
+    writer = TableBackupWriter(backup_dir, name, fmt)
+    try:
+        for page in iter_pages(client, table, filters=filters, prefetch=False):
+            writer.write_rows(page)
+        return writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+
+def _plan_table(client: SupabaseClient, table: str, column: str, count: Optional[int],
+                rows_per_part: int) -> List[Filters]:
+    """Filtros de cada faixa da tabela; [[]] = tabela inteira em um arquivo"""
+    if count is None:
+        count = count_rows(client, table)
+    if not count or count <= rows_per_part:
+        return [[]]
+
+    ranges = split_ranges(client, table, column, count, math.ceil(count / rows_per_part))
+    plan = [range_filters(column, value_range) for value_range in ranges]
+    if column != 'id':
+        plan.append([(column, 'is.null')])
+    return plan
+
+
+def _combine(parts: List[Tuple[Filters, Optional[Dict[str, Any]]]],
+             column: str) -> Optional[Dict[str, Any]]:
+    """Entrada do manifesto de uma tabela a partir das entradas das faixas"""
+    if len(parts) == 1 and not parts[0][0]:
+        return parts[0][1]
+    written = [dict(entry, filters=[list(item) for item in filters]) for filters, entry in parts if entry]
+    if not written:
+        return None
+    return {
+        'file': None,
+        'format': written[0]['format'],
+        'rows': sum(entry['rows'] for entry in written),
+        'bytes': sum(entry['bytes'] for entry in written),
+        'columns': written[0]['columns'],
+        'partition_column': column,
+        'parts': written,
+    }
+
+
+def backup_tables(client: SupabaseClient, tables: Sequence[str], backup_dir: str, timestamp: str,
+                  fmt: Optional[str] = None, concurrency: Optional[int] = None,
+                  counts: Optional[Mapping[str, Optional[int]]] = None,
+                  partition_columns: Optional[Mapping[str, str]] = None,
+                  rows_per_part: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Exporta tables para backup_dir em paralelo. counts (ex.: de table_stats) evita
+    contar de novo; partition_columns escolhe a coluna de partição por tabela (padrão: id).
+    Devolve {tabela: entrada do manifesto (rows=0 se vazia) ou a exceção que a derrubou}.
+    Se uma faixa falhar, os arquivos das outras faixas da tabela são removidos
+    """
+    fmt = backup_format(fmt)
+    concurrency = min(concurrency or backup_concurrency(), client.pool_size)
+    rows_per_part = rows_per_part or partition_rows()
+    counts = counts or {}
+    partition_columns = partition_columns or {}
+
+    results: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Planejamento também em paralelo: contagem e limites das faixas de cada tabela
+        plans = {table: executor.submit(_plan_table, client, table, partition_columns.get(table, 'id'),
+                                        counts.get(table), rows_per_part) for table in tables}
+        futures = {}
+        for table in tables:
+            try:
+                plan = plans[table].result()
+            except Exception as e:
+                results[table] = e
+                continue
+            base = f"{table}_backup_{timestamp}"
+            futures[table] = [
+                (filters, executor.submit(_backup_part, client, table, backup_dir,
+                                          base if len(plan) == 1 else f"{base}.part{number:03d}",
+                                          filters, fmt))
+                for number, filters in enumerate(plan)]
+
+        for table, tasks in futures.items():
+            parts = []
+            error = None
+            for filters, future in tasks:
+                try:
+                    parts.append((filters, future.result()))
+                except Exception as e:
+                    error = error or e
+            if error is not None:
+                for _, entry in parts:
+                    if entry:
+                        os.remove(os.path.join(backup_dir, entry['file']))
+                results[table] = error
+                continue
+            entry = _combine(parts, partition_columns.get(table, 'id'))
+            results[table] = entry or {'file': None, 'rows': 0}
+    return results
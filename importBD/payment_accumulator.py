@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Acumulador colunar de registros de pagamento
+
+Em vez de montar um dict de 12 chaves por pagamento (com uuid4 e datetime.now()
+a cada registro), os valores são gravados em arrays pré-alocados, uma coluna por
+campo, que crescem em blocos. Todos os registros de uma execução recebem o mesmo
+timestamp de lote em created_at/updated_at. O DataFrame (ou CSV) só é
+materializado no final.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Colunas preenchidas com o timestamp do lote quando não informadas
+TIMESTAMP_COLUMNS = ('created_at', 'updated_at')
+
+
+class PaymentAccumulator:
+    """
+    Colunas de pagamento em arrays tipados: float64 para as colunas numéricas,
+    object para as demais
+    """
+
+    def __init__(self, columns: Sequence[str], numeric: Sequence[str] = ('amount',),
+                 capacity: int = 1024, batch_timestamp: Optional[str] = None):
+        self.columns = list(columns)
+        self.numeric = frozenset(numeric)
+        self.batch_timestamp = batch_timestamp or datetime.now(timezone.utc).isoformat()
+        self._size = 0
+        self._arrays = {column: self._allocate(column, max(capacity, 1)) for column in self._stored_columns}
+
+    @property
+    def _stored_columns(self) -> List[str]:
+        return [column for column in self.columns if column not in TIMESTAMP_COLUMNS]
+
+    def _allocate(self, column: str, capacity: int) -> np.ndarray:
+        if column in self.numeric:
+            return np.full(capacity, np.nan, dtype=np.float64)
+        return np.full(capacity, '', dtype=object)
+
+    def _reserve(self, extra: int):
+        """Garante espaço para mais `extra` registros (crescimento geométrico)"""
+        needed = self._size + extra
+        capacity = len(next(iter(self._arrays.values()))) if self._arrays else needed
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for column, array in self._arrays.items():
+            grown = self._allocate(column, new_capacity)
+            grown[:self._size] = array[:self._size]
+            self._arrays[column] = grown
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, **values: Any):
+        """Adiciona um registro; colunas não informadas ficam vazias"""
+        self._reserve(1)
+        for column, value in values.items():
+            self._arrays[column][self._size] = value
+        self._size += 1
+
+    def extend(self, values: Mapping[str, Any]):
+        """
+        Adiciona vários registros de uma vez. Cada valor é um array com um elemento
+        por registro ou um escalar repetido em todos
+        """
+        lengths = {len(value) for value in values.values() if np.ndim(value) == 1}
+        if len(lengths) > 1:
+            raise ValueError(f"Colunas com tamanhos diferentes: {sorted(lengths)}")
+        count = lengths.pop() if lengths else 0
+        if count == 0:
+            return
+
+        self._reserve(count)
+        end = self._size + count
+        for column, value in values.items():
+            self._arrays[column][self._size:end] = value
+        self._size = end
+
+    def clear(self):
+        """Esvazia o acumulador mantendo a memória alocada (reuso entre blocos)"""
+        for column, array in self._arrays.items():
+            array[:self._size] = np.nan if column in self.numeric else ''
+        self._size = 0
+
+    def to_frame(self) -> pd.DataFrame:
+        """Materializa os registros acumulados, na ordem de colunas definida"""
+        data: Dict[str, Any] = {}
+        for column in self.columns:
+            if column in TIMESTAMP_COLUMNS:
+                data[column] = np.full(self._size, self.batch_timestamp, dtype=object)
+            else:
+                data[column] = self._arrays[column][:self._size].copy()
+        return pd.DataFrame(data, columns=self.columns)
+
+    def to_csv(self, path_or_buf: Any, header: bool = True):
+        self.to_frame().to_csv(path_or_buf, index=False, header=header)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Manifesto da última geração de payments.csv, para regeneração incremental
+
+Guarda, na ordem do arquivo de origem, a chave de cada linha de contrato, o hash
+do seu conteúdo e quantos pagamentos ela gerou. Na execução seguinte só as linhas
+cujo hash mudou (ou que surgiram/sumiram) são reprocessadas; os pagamentos das
+demais são copiados da saída anterior, localizados pelas contagens do manifesto.
+
+O manifesto só é aceito se o cabeçalho da planilha for o mesmo e se a saída
+anterior não tiver sido alterada desde então (checksum SHA-256 do arquivo).
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def row_hashes(df: pd.DataFrame, contract_ids: Sequence[Any]) -> np.ndarray:
+    """
+    Hash do conteúdo de cada linha (todas as células como texto) e do contract_id
+    resolvido, já que uma mudança no mapeamento também muda os pagamentos gerados
+    """
+    frame = df.astype(object).where(df.notna(), '').astype(str)
+    frame['__contract_id__'] = pd.Series(contract_ids, index=df.index).astype(object).where(
+        pd.notna(contract_ids), '').astype(str)
+    hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    return np.array([format(value, '016x') for value in hashes.tolist()], dtype=object)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_manifest(header: Sequence[str], record_keys: Sequence[str], hashes: Sequence[str],
+                   payment_counts: Sequence[int]) -> Dict[str, Any]:
+    return {
+        'version': MANIFEST_VERSION,
+        'header': list(header),
+        'rows': [[key, row_hash, int(count)] for key, row_hash, count in zip(record_keys, hashes, payment_counts)]
+    }
+
+
+def load_manifest(manifest_file: str, output_file: str, header: Sequence[str]) -> Optional[Dict[str, Any]]:
+    """
+    Manifesto anterior, ou None se ele não existir ou não corresponder mais à
+    planilha / à saída gravada (nesses casos a regeneração deve ser completa)
+    """
+    if not os.path.exists(manifest_file) or not os.path.exists(output_file):
+        return None
+
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Manifesto {manifest_file} ilegível: {e}")
+        return None
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        logger.info("Manifesto de outra versão: regeneração completa")
+        return None
+    if manifest.get('header') != list(header):
+        logger.info("Cabeçalho da planilha mudou: regeneração completa")
+        return None
+    if manifest.get('output_sha256') != file_sha256(output_file):
+        logger.info(f"{output_file} foi alterado desde o último manifesto: regeneração completa")
+        return None
+
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Any], manifest_file: str, output_file: str):
+    """Grava o manifesto amarrado ao checksum da saída já gravada"""
+    manifest = dict(manifest, output_sha256=file_sha256(output_file))
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    logger.info(f"Manifesto salvo em {manifest_file}")
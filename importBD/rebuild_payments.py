@@ -5,12 +5,19 @@ Script para recalcular e converter todos os payments do CSV original de contrato
 Gera payments_rebuilt.csv no formato correto para importação futura
 """
 
+import numpy as np
 import pandas as pd
-import uuid
-import re
+from collections import defaultdict
 from datetime import datetime
 import logging
 
+from columnar_io import convert_csv, read_table, write_table
+from monetary_parser import parse_monetary_series, parse_monetary_value
+from payment_accumulator import PaymentAccumulator
+import record_ids
+from spreadsheet_layout import (LayoutError, chunk_size_from_env, compile_layout, parse_month_header,
+                                read_spreadsheet_chunks)
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -22,246 +29,243 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Colunas de payments_rebuilt.csv, na ordem de gravação
+PAYMENT_COLUMNS = [
+    'id', 'contract_id', 'amount', 'due_date', 'paid_date', 'status', 'payment_method',
+    'notes', 'external_id', 'created_at', 'updated_at', 'payment_type'
+]
+
 def normalize_monetary_value(value_str):
     """
-    Normaliza valores monetários removendo € e espaços, trocando vírgula por ponto
-    Retorna valor absoluto como float
+    Normaliza valores monetários (€, espaços, formato europeu 1.000,00) via monetary_parser
+    Retorna valor absoluto como float (0.0 para vazios e inválidos)
     """
-    if pd.isna(value_str) or value_str == '' or str(value_str).strip() in ['#NAME?', '#ERROR!', '#REF!', 'ß', '-']:
-        return 0.0
-    
-    # Converter para string se não for
-    value_str = str(value_str).strip()
-    
-    # Remover € e espaços
-    value_str = value_str.replace('€', '').replace(' ', '')
-    
-    # Lidar com formato brasileiro/europeu: 1.000,00 -> 1000.00
-    if ',' in value_str and '.' in value_str:
-        # Se tem tanto vírgula quanto ponto, assumir que ponto é separador de milhares
-        parts = value_str.split(',')
-        if len(parts) == 2 and len(parts[1]) <= 2:  # Vírgula como separador decimal
-            value_str = parts[0].replace('.', '') + '.' + parts[1]
-    elif ',' in value_str:
-        # Se só tem vírgula, trocar por ponto (separador decimal)
-        value_str = value_str.replace(',', '.')
-    
-    try:
-        # Converter para float e retornar valor absoluto
-        return abs(float(value_str))
-    except ValueError:
-        logger.warning(f"Valor monetário inválido: {value_str}")
+    amount = parse_monetary_value(value_str)
+    if amount is None:
+        if pd.notna(value_str) and str(value_str).strip() != '':
+            logger.warning(f"Valor monetário inválido: {value_str}")
         return 0.0
+    return abs(amount)
 
 def parse_date_header(date_header):
     """
     Converte cabeçalhos de data como 'mar./23' para '2023-03-01'
-    Suporta meses abreviados e completos em PT
+    (ver spreadsheet_layout.parse_month_header)
     """
-    if pd.isna(date_header) or date_header == '':
-        return None
-    
-    date_header = str(date_header).strip()
-    
-    # Mapeamento de meses em português
-    months_pt = {
-        'jan': '01', 'janeiro': '01',
-        'fev': '02', 'fevereiro': '02',
-        'mar': '03', 'março': '03', 'marco': '03',
-        'abr': '04', 'abril': '04',
-        'mai': '05', 'maio': '05',
-        'jun': '06', 'junho': '06',
-        'jul': '07', 'julho': '07',
-        'ago': '08', 'agosto': '08',
-        'set': '09', 'setembro': '09',
-        'out': '10', 'outubro': '10',
-        'nov': '11', 'novembro': '11',
-        'dez': '12', 'dezembro': '12'
-    }
-    
-    # Padrões para parsing
-    patterns = [
-        r'([a-z]+)\.?/([0-9]{2})$',  # mar./23, jan/24
-        r'([a-z]+)/([0-9]{2})$',     # Nov/31
-        r'([a-z]+)\.?([0-9]{2})$'   # Nov31
-    ]
-    
-    for pattern in patterns:
-        match = re.match(pattern, date_header.lower())
-        if match:
-            month_str = match.group(1)
-            year_str = match.group(2)
-            
-            # Encontrar mês
-            month_num = None
-            for pt_month, num in months_pt.items():
-                if month_str.startswith(pt_month[:3]):
-                    month_num = num
-                    break
-            
-            if month_num:
-                # Determinar ano completo
-                year_int = int(year_str)
-                if year_int <= 30:  # Assumir 2030 como limite
-                    full_year = 2000 + year_int
-                else:
-                    full_year = 1900 + year_int
-                
-                return f"{full_year}-{month_num}-01"
-    
-    logger.warning(f"Não foi possível parsear a data: {date_header}")
-    return None
+    due_date = parse_month_header(date_header)
+    if not due_date:
+        logger.warning(f"Não foi possível parsear a data: {date_header}")
+    return due_date
 
 def load_contract_mapping():
     """
     Carrega mapeamento de contratos para obter contract_ids corretos
     """
     try:
-        contracts_df = pd.read_csv('contracts.csv')
+        # CSV ou, se configurado, a versão colunar gerada junto dele
+        contracts_df = read_table('contracts.csv', 'contracts', columns=['external_id', 'id'])
         # Criar mapeamento baseado no external_id
         mapping = {}
-        for _, row in contracts_df.iterrows():
-            if pd.notna(row['external_id']):
-                mapping[row['external_id']] = row['id']
+        for external_id, contract_id in zip(contracts_df['external_id'], contracts_df['id']):
+            if pd.notna(external_id) and external_id != '':
+                mapping[external_id] = contract_id
         return mapping
     except Exception as e:
         logger.error(f"Erro ao carregar mapeamento de contratos: {e}")
         return {}
 
-def process_payments():
+def compile_payments_layout(header):
     """
-    Processa o CSV original e gera payments_rebuilt.csv
+    Papéis das colunas (identificação, entradas, meses) resolvidos pelo cabeçalho.
+    Retorna None se a planilha não tiver o layout esperado
     """
-    logger.info("Iniciando processamento de payments...")
-    
-    # Carregar CSV original
     try:
-        df = pd.read_csv('contratosAtivosFinal.csv')
-        logger.info(f"Carregado CSV com {len(df)} contratos")
-    except Exception as e:
-        logger.error(f"Erro ao carregar CSV: {e}")
-        return
-    
-    # Carregar mapeamento de contratos
-    contract_mapping = load_contract_mapping()
-    
-    payments_data = []
+        layout = compile_layout(header, required=('Nome', 'Contrato', 'Início'))
+    except LayoutError as e:
+        logger.error(f"Layout da planilha inválido: {e}")
+        return None
+    if layout.month_gaps:
+        logger.warning(f"Colunas ignoradas no bloco de parcelas: {', '.join(layout.month_gaps)}")
+    return layout
+
+def new_payments_accumulator():
+    """Acumulador colunar com um único timestamp (created_at/updated_at) para o lote"""
+    return PaymentAccumulator(PAYMENT_COLUMNS, batch_timestamp=datetime.now().isoformat())
+
+def build_payments(df, layout, contract_mapping, key_occurrences, payments_data):
+    """
+    Gera os payments de um DataFrame da planilha (arquivo inteiro ou um bloco)
+    e os acrescenta ao acumulador payments_data.
+    key_occurrences conta as chaves de contrato já vistas, para que linhas repetidas
+    recebam IDs distintos (e estáveis) mesmo entre blocos
+    """    
+    # Converter os valores monetários de uma vez (entradas e bloco de parcelas)
+    down_payment_amounts = {}
+    for role in ('comp_i', 'comp_ii'):
+        column = layout.down_payment(role)
+        down_payment_amounts[role] = (
+            parse_monetary_series(df.iloc[:, column.position]).amounts if column else np.full(len(df), np.nan)
+        )
+    monthly_values = parse_monetary_series(layout.month_block(df))
     
-    for idx, row in df.iterrows():
+    for pos, (idx, row) in enumerate(df.iterrows()):
         try:
             # Identificar contrato
-            nome = row['Nome']
-            contrato = row['Contrato']
+            nome = row.iloc[layout.position('Nome')]
+            contrato = row.iloc[layout.position('Contrato')]
             external_id = f"{nome}_{contrato}"
+            key_occurrences[external_id] += 1
+            record_key = record_ids.occurrence_key(external_id, key_occurrences[external_id])
             
             contract_id = contract_mapping.get(external_id)
             if not contract_id:
                 logger.warning(f"Contract_id não encontrado para: {external_id}")
-                contract_id = str(uuid.uuid4())  # Gerar UUID temporário
-            
-            inicio_date = row['Início']
+                contract_id = record_ids.contract_id(record_key)  # UUID temporário, estável entre execuções
             
-            # Processar Down Payments (colunas 13 e 14 - Comp I e Comp II)
-            comp_i = row.get(' Comp I ', '')
-            comp_ii = row.get(' Comp II ', '')
+            inicio_date = row.iloc[layout.position('Início')]
             
+            # Processar Down Payments (Comp I e Comp II)
             # Down Payment 1 (Comp I)
-            if comp_i and str(comp_i).strip() != '':
-                amount = normalize_monetary_value(comp_i)
-                if amount > 0:
-                    payment = {
-                        'id': str(uuid.uuid4()),
-                        'contract_id': contract_id,
-                        'amount': amount,
-                        'due_date': inicio_date,
-                        'paid_date': inicio_date,
-                        'status': 'paid',
-                        'payment_method': '',
-                        'notes': '',
-                        'external_id': f"{external_id}_comp1",
-                        'created_at': datetime.now().isoformat(),
-                        'updated_at': datetime.now().isoformat(),
-                        'payment_type': 'downPayment'
-                    }
-                    payments_data.append(payment)
+            amount = down_payment_amounts['comp_i'][pos]
+            if amount > 0:
+                payments_data.append(
+                    id=record_ids.payment_id(record_key, 'downPayment', 'comp_i'),
+                    contract_id=contract_id,
+                    amount=amount,
+                    due_date=inicio_date,
+                    paid_date=inicio_date,
+                    status='paid',
+                    external_id=f"{external_id}_comp1",
+                    payment_type='downPayment'
+                )
             
             # Down Payment 2 (Comp II)
-            if comp_ii and str(comp_ii).strip() != '':
-                amount = normalize_monetary_value(comp_ii)
-                if amount > 0:
-                    payment = {
-                        'id': str(uuid.uuid4()),
-                        'contract_id': contract_id,
-                        'amount': amount,
-                        'due_date': inicio_date,
-                        'paid_date': inicio_date,
-                        'status': 'paid',
-                        'payment_method': '',
-                        'notes': '',
-                        'external_id': f"{external_id}_comp2",
-                        'created_at': datetime.now().isoformat(),
-                        'updated_at': datetime.now().isoformat(),
-                        'payment_type': 'downPayment'
-                    }
-                    payments_data.append(payment)
+            amount = down_payment_amounts['comp_ii'][pos]
+            if amount > 0:
+                payments_data.append(
+                    id=record_ids.payment_id(record_key, 'downPayment', 'comp_ii'),
+                    contract_id=contract_id,
+                    amount=amount,
+                    due_date=inicio_date,
+                    paid_date=inicio_date,
+                    status='paid',
+                    external_id=f"{external_id}_comp2",
+                    payment_type='downPayment'
+                )
             
-            # Processar parcelas mensais (colunas a partir da 30)
+            # Processar parcelas mensais (colunas de mês do layout)
             installment_number = 1
             
-            # Obter todas as colunas de data (a partir da coluna 30)
-            date_columns = df.columns[29:]  # Índice 29 = coluna 30
-            
-            for col in date_columns:
-                value = row.get(col, '')
-                if pd.isna(value) or str(value).strip() == '':
-                    continue
-                
-                # Normalizar valor
-                original_value = str(value).strip()
-                amount = normalize_monetary_value(original_value)
-                
-                if amount == 0:
+            for col_pos, month in enumerate(layout.months):
+                # Valor já normalizado (NaN = vazio ou inválido)
+                amount = monthly_values.amounts[pos, col_pos]
+                if np.isnan(amount) or amount == 0:
                     continue
                 
                 # Determinar status baseado no sinal original
-                is_negative = '-' in original_value
+                is_negative = monthly_values.negative[pos, col_pos]
                 status = 'paid' if is_negative else 'pending'
                 
-                # Parsear data do cabeçalho
-                due_date = parse_date_header(col)
-                if not due_date:
-                    logger.warning(f"Data inválida na coluna: {col}")
-                    continue
+                # Vencimento já parseado a partir do cabeçalho
+                due_date = month.due_date
                 
                 # Paid date
                 paid_date = due_date if status == 'paid' else ''
                 
-                payment = {
-                    'id': str(uuid.uuid4()),
-                    'contract_id': contract_id,
-                    'amount': amount,
-                    'due_date': due_date,
-                    'paid_date': paid_date,
-                    'status': status,
-                    'payment_method': '',
-                    'notes': str(installment_number),
-                    'external_id': f"{external_id}_installment_{installment_number}",
-                    'created_at': datetime.now().isoformat(),
-                    'updated_at': datetime.now().isoformat(),
-                    'payment_type': 'normalPayment'
-                }
-                payments_data.append(payment)
+                payments_data.append(
+                    id=record_ids.payment_id(record_key, 'normalPayment', due_date),
+                    contract_id=contract_id,
+                    amount=amount,
+                    due_date=due_date,
+                    paid_date=paid_date,
+                    status=status,
+                    notes=str(installment_number),
+                    external_id=f"{external_id}_installment_{installment_number}",
+                    payment_type='normalPayment'
+                )
                 installment_number += 1
         
         except Exception as e:
             logger.error(f"Erro ao processar linha {idx}: {e}")
             continue
     
-    # Gerar CSV de saída
-    if payments_data:
-        payments_df = pd.DataFrame(payments_data)
-        payments_df.to_csv('payments_rebuilt.csv', index=False)
+    return payments_data
+
+def process_payments(chunksize=None):
+    """
+    Processa o CSV original e gera payments_rebuilt.csv.
+    Com chunksize (ou CONTRATOS_CHUNK_SIZE), lê a planilha em blocos e grava os
+    payments de cada bloco à medida que são gerados
+    """
+    logger.info("Iniciando processamento de payments...")
+    
+    chunksize = chunksize or chunk_size_from_env()
+    if chunksize:
+        return stream_payments(chunksize)
+    
+    # Carregar CSV original
+    try:
+        df = pd.read_csv('contratosAtivosFinal.csv')
+        logger.info(f"Carregado CSV com {len(df)} contratos")
+    except Exception as e:
+        logger.error(f"Erro ao carregar CSV: {e}")
+        return
+    
+    # Carregar mapeamento de contratos
+    contract_mapping = load_contract_mapping()
+    
+    layout = compile_payments_layout(df.columns)
+    if layout is None:
+        return
+    
+    payments_data = build_payments(df, layout, contract_mapping, defaultdict(int), new_payments_accumulator())
+    
+    # Gerar CSV de saída (o DataFrame só é materializado aqui)
+    if len(payments_data):
+        payments_df = payments_data.to_frame()
+        columnar_file = write_table(payments_df, 'payments_rebuilt.csv', 'payments')
         logger.info(f"Gerado payments_rebuilt.csv com {len(payments_data)} payments")
+        if columnar_file:
+            logger.info(f"Versão colunar gerada em {columnar_file}")
+    else:
+        logger.error("Nenhum payment foi processado")
+
+def stream_payments(chunksize):
+    """
+    Modo streaming: memória limitada ao tamanho do bloco, não ao tamanho do arquivo
+    """
+    contract_mapping = load_contract_mapping()
+    key_occurrences = defaultdict(int)
+    payments_data = new_payments_accumulator()  # reaproveitado entre blocos
+    layout = None
+    total_rows = 0
+    total_payments = 0
+    
+    try:
+        with open('payments_rebuilt.csv', 'w', newline='', encoding='utf-8') as f:
+            for chunk in read_spreadsheet_chunks('contratosAtivosFinal.csv', chunksize):
+                if layout is None:
+                    layout = compile_payments_layout(chunk.columns)
+                    if layout is None:
+                        return
+                
+                payments_data.clear()
+                build_payments(chunk, layout, contract_mapping, key_occurrences, payments_data)
+                if len(payments_data):
+                    payments_data.to_csv(f, header=(total_payments == 0))
+                
+                total_rows += len(chunk)
+                total_payments += len(payments_data)
+                logger.info(f"Processados {total_rows} contratos, {total_payments} payments gravados")
+    except Exception as e:
+        logger.error(f"Erro ao carregar CSV: {e}")
+        return
+    
+    if total_payments:
+        logger.info(f"Gerado payments_rebuilt.csv com {total_payments} payments")
+        columnar_file = convert_csv('payments_rebuilt.csv', 'payments')
+        if columnar_file:
+            logger.info(f"Versão colunar gerada em {columnar_file}")
     else:
         logger.error("Nenhum payment foi processado")
 
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Identificadores determinísticos (UUIDv5) para clients, contracts e payments
+
+Os conversores geravam str(uuid.uuid4()) para cada registro, então toda regeneração
+produzia IDs novos e os importadores precisavam apagar e reinserir tudo. Aqui o ID é
+derivado de chaves de negócio estáveis, de modo que a mesma linha da planilha gera
+sempre o mesmo ID:
+- client:   external_id do cliente (nome, ou nome_NNN)
+- contract: chave do contrato (Nome_Contrato, com sufixo _NNN a partir da 2ª ocorrência)
+- payment:  chave do contrato + tipo do pagamento + vencimento (parcelas mensais)
+            ou papel da coluna de entrada (down payments)
+"""
+
+import uuid
+
+# Namespace fixo do projeto: alterar este valor muda todos os IDs gerados
+NAMESPACE = uuid.UUID('6f1c2b5e-4a7d-5c1e-9b8a-3d2f0e6a9c41')
+
+
+def record_id(kind: str, *parts: object) -> str:
+    """
+    UUIDv5 de um registro a partir do tipo e das partes da chave de negócio
+    """
+    name = '|'.join([kind, *(str(part) for part in parts)])
+    return str(uuid.uuid5(NAMESPACE, name))
+
+
+def client_id(client_key: str) -> str:
+    return record_id('client', client_key)
+
+
+def contract_id(contract_key: str) -> str:
+    return record_id('contract', contract_key)
+
+
+def payment_id(contract_key: str, payment_type: str, slot: str) -> str:
+    """
+    slot identifica o pagamento dentro do contrato: o vencimento (YYYY-MM-DD) das
+    parcelas mensais ou o papel da coluna de entrada ('entrada', 'comp_i', 'comp_ii')
+    """
+    return record_id('payment', contract_key, payment_type, slot)
+
+
+def occurrence_key(key: str, occurrence: int) -> str:
+    """
+    Chave da n-ésima ocorrência de uma chave repetida na planilha, seguindo a
+    convenção dos external_id (a primeira sem sufixo, depois _002, _003, ...)
+    """
+    return key if occurrence <= 1 else f"{key}_{occurrence:03d}"
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Layout compilado da planilha "Contratos Ativos"
+
+Em vez de cada script assumir índices fixos (coluna 14 = Comp I, parcelas a partir
+da coluna 20/30/31...), o cabeçalho é lido uma única vez e cada coluna é classificada:
+- campos de identificação (Nome, Contrato, Início, Método, Total, ...)
+- entradas / down payments (Entrada, Comp I, Comp II)
+- parcelas mensais, com o vencimento já convertido a partir do cabeçalho (ex.: 'mar./23')
+
+O resultado é imutável e oferece acesso posicional direto. Se a planilha mudar de
+forma incompatível (campo obrigatório ausente, mês repetido, nenhuma parcela),
+compile_layout falha em vez de gerar dados errados silenciosamente.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Iterable, Iterator, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Mapeamento de meses PT/BR
+MONTHS = {
+    'jan': 1, 'janeiro': 1,
+    'fev': 2, 'fevereiro': 2,
+    'mar': 3, 'março': 3, 'marco': 3,
+    'abr': 4, 'abril': 4,
+    'mai': 5, 'maio': 5,
+    'jun': 6, 'junho': 6,
+    'jul': 7, 'julho': 7,
+    'ago': 8, 'agosto': 8,
+    'set': 9, 'setembro': 9,
+    'out': 10, 'outubro': 10,
+    'nov': 11, 'novembro': 11,
+    'dez': 12, 'dezembro': 12
+}
+
+# mar./23, jan./24, maio/27, Nov/31, Nov/2031, Nov31, 03/2025, 03/25
+_MONTH_HEADER_PATTERN = re.compile(r'^([a-zç]+)\.?/?([0-9]{2}|[0-9]{4})$|^([0-9]{1,2})/([0-9]{2}|[0-9]{4})$')
+
+# Colunas de entrada, na ordem em que os down payments são emitidos
+DOWN_PAYMENT_ROLES = (
+    ('entrada', 'Entrada'),
+    ('comp_i', 'Comp I'),
+    ('comp_ii', 'Comp II')
+)
+
+# Variável de ambiente que ativa o modo streaming (linhas por bloco)
+CHUNK_SIZE_ENV = 'CONTRATOS_CHUNK_SIZE'
+
+
+class LayoutError(ValueError):
+    """Cabeçalho da planilha incompatível com o layout esperado"""
+
+
+class DownPaymentColumn(NamedTuple):
+    role: str       # 'entrada', 'comp_i' ou 'comp_ii'
+    position: int
+    header: str
+
+
+class MonthColumn(NamedTuple):
+    position: int
+    header: str
+    due_date: str   # ISO YYYY-MM-01
+
+
+def parse_month_header(header: Any) -> Optional[str]:
+    """
+    Converte cabeçalhos de parcela em PT/BR para data ISO YYYY-MM-01.
+    Anos com 2 dígitos são sempre 20XX. Retorna None se não for um mês
+    """
+    if header is None or not isinstance(header, str):
+        return None
+
+    match = _MONTH_HEADER_PATTERN.match(header.strip().lower())
+    if not match:
+        return None
+
+    month_text, year_text, month_digits, year_digits = match.groups()
+    if month_text is not None:
+        month = MONTHS.get(month_text)
+    else:
+        month = int(month_digits)
+        year_text = year_digits
+
+    if month is None or not 1 <= month <= 12:
+        return None
+
+    year = int(year_text)
+    if year < 100:
+        year += 2000
+    return f"{year:04d}-{month:02d}-01"
+
+
+def _normalize_header(header: Any) -> str:
+    return str(header).strip().casefold()
+
+
+@dataclass(frozen=True)
+class SpreadsheetLayout:
+    """
+    Papel de cada coluna da planilha, resolvido a partir do cabeçalho
+    """
+    columns: Tuple[str, ...]
+    fields: Mapping[str, int]
+    down_payments: Tuple[DownPaymentColumn, ...]
+    months: Tuple[MonthColumn, ...]
+
+    def position(self, field: str) -> Optional[int]:
+        """Posição de um campo de identificação (busca sem espaços/maiúsculas)"""
+        return self.fields.get(_normalize_header(field))
+
+    def require(self, *fields: str) -> None:
+        """Garante que os campos existem no cabeçalho"""
+        missing = [field for field in fields if self.position(field) is None]
+        if missing:
+            raise LayoutError(f"Colunas obrigatórias ausentes na planilha: {', '.join(missing)}")
+
+    def down_payment(self, role: str) -> Optional[DownPaymentColumn]:
+        for column in self.down_payments:
+            if column.role == role:
+                return column
+        return None
+
+    @property
+    def month_positions(self) -> Tuple[int, ...]:
+        return tuple(column.position for column in self.months)
+
+    @property
+    def month_headers(self) -> Tuple[str, ...]:
+        return tuple(column.header for column in self.months)
+
+    @property
+    def month_dates(self) -> Tuple[str, ...]:
+        return tuple(column.due_date for column in self.months)
+
+    @property
+    def month_gaps(self) -> Tuple[str, ...]:
+        """Cabeçalhos que não são meses, mas estão no meio do bloco de parcelas"""
+        if not self.months:
+            return ()
+        month_positions = set(self.month_positions)
+        first, last = self.months[0].position, self.months[-1].position
+        return tuple(self.columns[pos] for pos in range(first, last + 1) if pos not in month_positions)
+
+    def field(self, df: Any, field: str) -> Any:
+        """Coluna de um DataFrame pelo papel (None se o campo não existir)"""
+        pos = self.position(field)
+        return None if pos is None else df.iloc[:, pos]
+
+    def month_block(self, df: Any) -> Any:
+        """Bloco de parcelas mensais de um DataFrame, na ordem das colunas"""
+        return df.iloc[:, list(self.month_positions)]
+
+
+def compile_layout(header: Iterable[Any], required: Sequence[str] = ('Nome', 'Contrato')) -> SpreadsheetLayout:
+    """
+    Classifica uma única vez todas as colunas do cabeçalho
+    """
+    columns = tuple('' if column is None else str(column) for column in header)
+    down_payment_roles = {_normalize_header(label): role for role, label in DOWN_PAYMENT_ROLES}
+
+    fields = {}
+    down_payments = {}
+    months = []
+    seen_dates = {}
+
+    for pos, column in enumerate(columns):
+        key = _normalize_header(column)
+
+        due_date = parse_month_header(column)
+        if due_date:
+            if due_date in seen_dates:
+                raise LayoutError(
+                    f"Mês repetido no cabeçalho: '{seen_dates[due_date]}' e '{column}' ({due_date})"
+                )
+            seen_dates[due_date] = column
+            months.append(MonthColumn(pos, column, due_date))
+        elif key in down_payment_roles:
+            role = down_payment_roles[key]
+            if role in down_payments:
+                raise LayoutError(f"Coluna de entrada repetida no cabeçalho: '{column}'")
+            down_payments[role] = DownPaymentColumn(role, pos, column)
+        elif key:
+            if key in fields:
+                raise LayoutError(f"Coluna repetida no cabeçalho: '{column}'")
+            fields[key] = pos
+
+    layout = SpreadsheetLayout(
+        columns=columns,
+        fields=MappingProxyType(fields),
+        down_payments=tuple(down_payments[role] for role, _ in DOWN_PAYMENT_ROLES if role in down_payments),
+        months=tuple(months)
+    )
+
+    layout.require(*required)
+    if not layout.months:
+        raise LayoutError("Nenhuma coluna de parcela mensal (ex.: 'mar./23') encontrada no cabeçalho")
+
+    return layout
+
+
+def chunk_size_from_env() -> Optional[int]:
+    """
+    Tamanho de bloco configurado em CONTRATOS_CHUNK_SIZE (None = ler a planilha inteira)
+    """
+    value = os.getenv(CHUNK_SIZE_ENV, '').strip()
+    if not value:
+        return None
+    chunksize = int(value)
+    if chunksize <= 0:
+        raise ValueError(f"{CHUNK_SIZE_ENV} deve ser um inteiro positivo: {value}")
+    return chunksize
+
+
+def read_spreadsheet_chunks(path: str, chunksize: int, **read_csv_kwargs: Any) -> Iterator[pd.DataFrame]:
+    """
+    Lê a planilha em blocos de até chunksize linhas, mantendo o índice contínuo
+    entre blocos. As células são lidas como texto para que a inferência de tipos
+    do pandas não mude de um bloco para outro
+    """
+    read_csv_kwargs.setdefault('dtype', str)
+    with pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs) as reader:
+        for chunk in reader:
+            yield chunk
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Medição por etapa (tempo de relógio, tempo de CPU, linhas/s e pico de memória)
+
+Uso:
+    metrics = StageMetrics()
+    with metrics.stage('csv_read') as stage:
+        df = pd.read_csv(...)
+        stage['rows'] = len(df)
+
+Cada etapa pode ser executada várias vezes (blocos do modo streaming, faixas do
+modo paralelo): os tempos, as linhas e a variação de memória são somados e os
+valores máximos de memória ficam com o maior valor. metrics.stages é um dict
+simples, pronto para ir para um log JSON.
+
+Memória (sempre medida, lendo /proc/self/statm no Linux, ou com psutil se
+estiver instalado; sem nenhum dos dois os campos ficam de fora):
+- rss_delta_mb: variação da memória residente do processo durante a etapa
+  (fim - início); negativa quando a etapa libera mais do que aloca
+- rss_end_mb: memória residente do processo ao fim da etapa (o maior valor
+  entre as execuções)
+- peak_traced_mb: pico de memória alocada pelo Python/numpy durante a etapa,
+  via tracemalloc. Só é medido com STAGE_METRICS_TRACEMALLOC=1 (ou se o
+  tracemalloc já estiver ativo), porque o rastreamento deixa tudo mais lento
+
+hook: função opcional chamada ao fim de cada execução de etapa com
+(nome, medição dessa execução), para outros scripts registrarem/exportarem os números.
+"""
+
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+try:
+    import psutil
+except ImportError:  # dependência opcional
+    psutil = None
+
+TRACEMALLOC_ENV = 'STAGE_METRICS_TRACEMALLOC'
+
+StageHook = Callable[[str, Dict[str, Any]], None]
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Memória residente atual do processo (None se não houver como medir)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+def _mb(value: int) -> float:
+    return round(value / (1024 * 1024), 1)
+
+
+def logging_hook(logger: logging.Logger) -> StageHook:
+    """Hook que registra cada etapa no logger informado"""
+    def hook(name: str, measurement: Dict[str, Any]):
+        rows = measurement.get('rows')
+        rate = f", {measurement['rows_per_s']:,.0f} linhas/s" if measurement.get('rows_per_s') else ''
+        logger.info(f"Etapa {name}: {measurement['wall_s']:.3f}s "
+                    f"(CPU {measurement['cpu_s']:.3f}s){f', {rows} linhas' if rows is not None else ''}{rate}")
+    return hook
+
+
+class StageMetrics:
+    """
+    Acumula as medições de cada etapa em self.stages (nome -> medição)
+    """
+
+    def __init__(self, hook: Optional[StageHook] = None, trace_memory: Optional[bool] = None):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.hook = hook
+        if trace_memory is None:
+            trace_memory = os.getenv(TRACEMALLOC_ENV, '').strip() in ('1', 'true', 'sim') or tracemalloc.is_tracing()
+        self.trace_memory = trace_memory
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Mede o bloco como uma execução da etapa name. O dict devolvido aceita
+        'rows' (e outros contadores) preenchidos dentro do bloco
+        """
+        measurement: Dict[str, Any] = {'rows': rows}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        rss_start = current_rss_bytes()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield measurement
+        finally:
+            measurement['wall_s'] = time.perf_counter() - wall_start
+            measurement['cpu_s'] = time.process_time() - cpu_start
+            rss_end = current_rss_bytes()
+            if rss_start is not None and rss_end is not None:
+                measurement['rss_end_mb'] = _mb(rss_end)
+                measurement['rss_delta_mb'] = _mb(rss_end - rss_start)
+            if self.trace_memory:
+                measurement['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            self.record(name, measurement)
+
+    def timed_iter(self, name: str, iterable: Iterable[Any],
+                   rows: Optional[Callable[[Any], int]] = len) -> Iterator[Any]:
+        """
+        Itera medindo só o tempo de produzir cada item (ex.: leitura de cada bloco do CSV)
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as measurement:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    measurement['skip'] = True
+                    return
+                if rows is not None:
+                    measurement['rows'] = rows(item)
+            yield item
+
+    def record(self, name: str, measurement: Dict[str, Any]):
+        """Soma uma execução (ou as medições de outro processo) à etapa name"""
+        if measurement.pop('skip', False):
+            return
+        total = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows': None})
+        total['calls'] += measurement.get('calls', 1)
+        total['wall_s'] = round(total['wall_s'] + measurement['wall_s'], 4)
+        total['cpu_s'] = round(total['cpu_s'] + measurement['cpu_s'], 4)
+        for key, value in measurement.items():
+            if key in ('calls', 'wall_s', 'cpu_s', 'rows_per_s') or value is None:
+                continue
+            if key.startswith('peak_') or key == 'rss_end_mb':
+                total[key] = max(total.get(key) or 0, value)
+            elif isinstance(value, float):
+                total[key] = round((total.get(key) or 0) + value, 4)
+            elif isinstance(value, int):
+                total[key] = (total.get(key) or 0) + value
+        total['rows_per_s'] = round(total['rows'] / total['wall_s'], 1) if total['rows'] and total['wall_s'] else None
+
+        if self.hook is not None:
+            measurement = dict(measurement, wall_s=round(measurement['wall_s'], 4),
+                               cpu_s=round(measurement['cpu_s'], 4))
+            if measurement.get('rows') and measurement['wall_s']:
+                measurement['rows_per_s'] = round(measurement['rows'] / measurement['wall_s'], 1)
+            self.hook(name, measurement)
+
+    def merge(self, stages: Dict[str, Dict[str, Any]]):
+        """Acumula as etapas medidas em outro processo (sem chamar o hook de novo)"""
+        hook, self.hook = self.hook, None
+        try:
+            for name, measurement in stages.items():
+                self.record(name, dict(measurement))
+        finally:
+            self.hook = hook
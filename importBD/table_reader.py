@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Leitura de tabelas inteiras do Supabase em páginas, com memória constante
+
+Os scripts buscavam tabelas com limit=10000 (ou 1000, ou sem limite) em uma
+requisição só, truncando em silêncio o que passasse disso, ou com offset, que
+fica mais lento a cada página. Aqui a tabela é lida por chave (keyset):
+
+    GET tabela?order=id.asc&limit=N&id=gt.<último id da página anterior>
+
+- iter_rows devolve as linhas uma a uma (gerador): quem consome pode gravar em
+  CSV, montar um mapeamento etc. sem ter a tabela inteira na memória
+- a próxima página é buscada em segundo plano enquanto a atual é processada
+- a leitura só termina com uma página vazia: se o servidor limitar as páginas
+  (max-rows do PostgREST) abaixo de page_size, nada é perdido
+
+A chave precisa ser única e não nula (normalmente a chave primária, id). Ela
+também pode ser composta, como ('updated_at', 'id'), para ler só o que mudou
+depois de um cursor (after): linhas com updated_at nulo ficam de fora.
+O tamanho da página pode ser alterado com SUPABASE_PAGE_SIZE (padrão: 1000).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from supabase_client import SupabaseClient
+
+PAGE_SIZE_ENV = 'SUPABASE_PAGE_SIZE'
+DEFAULT_PAGE_SIZE = 1000
+
+Filters = Iterable[Tuple[str, str]]
+Key = Union[str, Sequence[str]]
+
+
+def page_size() -> int:
+    """Linhas por página configuradas em SUPABASE_PAGE_SIZE"""
+    value = os.getenv(PAGE_SIZE_ENV, '').strip()
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    size = int(value)
+    if size <= 0:
+        raise ValueError(f"{PAGE_SIZE_ENV} deve ser positivo: {value}")
+    return size
+
+
+def _select_with_keys(select: str, keys: Sequence[str]) -> str:
+    columns = [column.strip() for column in select.split(',')]
+    if '*' in columns:
+        return select
+    return ','.join([*(key for key in keys if key not in columns), *columns])
+
+
+def _quote(value: Any) -> str:
+    """Valor dentro de or=(...): aspas protegem ':', '.', ',' e parênteses (datas ISO)"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _after_filter(keys: Sequence[str], cursor: Sequence[Any]) -> Tuple[str, str]:
+    """
+    Filtro "depois do cursor" em ordem lexicográfica das chaves:
+    (a, b) > (x, y)  <=>  a > x  ou  (a = x e b > y)
+    """
+    if len(keys) == 1:
+        return keys[0], f'gt.{cursor[0]}'
+    terms = []
+    for position, key in enumerate(keys):
+        equal = [f'{previous}.eq.{_quote(cursor[index])}' for index, previous in enumerate(keys[:position])]
+        greater = f'{key}.gt.{_quote(cursor[position])}'
+        terms.append(f"and({','.join([*equal, greater])})" if equal else greater)
+    return 'or', f"({','.join(terms)})"
+
+
+def row_cursor(row: Dict[str, Any], key: Key) -> Tuple[Any, ...]:
+    """Valores das chaves de uma linha (cursor para retomar a leitura depois dela)"""
+    keys = [key] if isinstance(key, str) else list(key)
+    return tuple(row[column] for column in keys)
+
+
+def iter_pages(client: SupabaseClient, table: str, select: str = '*', key: Key = 'id',
+               filters: Filters = (), size: Optional[int] = None, prefetch: bool = True,
+               after: Optional[Sequence[Any]] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Páginas da tabela em ordem crescente de key (uma coluna ou várias). filters são
+    pares (coluna, filtro PostgREST), ex.: [('created_at', 'gte.2024-01-01')].
+    after: cursor (valores de key) a partir do qual ler, exclusive
+    """
+    size = size or page_size()
+    keys = [key] if isinstance(key, str) else list(key)
+    base_params = [('select', _select_with_keys(select, keys)), *filters,
+                   *((column, 'not.is.null') for column in keys[:-1]),
+                   ('order', ','.join(f'{column}.asc' for column in keys)), ('limit', str(size))]
+
+    def fetch(cursor: Optional[Sequence[Any]]) -> List[Dict[str, Any]]:
+        params = list(base_params)
+        if cursor is not None:
+            params.append(_after_filter(keys, cursor))
+        return client.request_json('GET', table, params=params, empty=[])
+
+    if not prefetch:
+        page = fetch(after)
+        while page:
+            yield page
+            page = fetch(row_cursor(page[-1], keys))
+        return
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = fetch(after)
+        while page:
+            # A busca da próxima página só depende da última chave desta
+            upcoming = executor.submit(fetch, row_cursor(page[-1], keys))
+            yield page
+            page = upcoming.result()
+    finally:
+        # Consumidor parou no meio (break/exceção): não espera a busca em andamento
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_rows(client: SupabaseClient, table: str, select: str = '*', key: Key = 'id',
+              filters: Filters = (), size: Optional[int] = None, prefetch: bool = True,
+              after: Optional[Sequence[Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Linhas da tabela, uma a uma, em ordem crescente de key"""
+    for page in iter_pages(client, table, select, key, filters, size, prefetch, after):
+        yield from page
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contagem de linhas e agregados das tabelas sem baixar os dados
+
+Contar linhas com GET select=*&limit=10000 e len() transfere a tabela inteira
+(e erra acima de 10000). Aqui:
+- a contagem vem de um HEAD com Prefer: count=exact|planned|estimated, lida do
+  cabeçalho Content-Range (0-0/1234): nenhuma linha é transferida
+  - exact: COUNT(*) no banco (preciso, mais lento em tabelas grandes)
+  - planned: estimativa do planejador do Postgres (instantânea)
+  - estimated: exata até o limite db-max-rows, estimada acima disso
+- agregados como o max(updated_at) saem de um GET ordenado com limit=1
+  (funciona mesmo sem as funções de agregação do PostgREST habilitadas)
+- várias tabelas são consultadas ao mesmo tempo
+
+Uso:
+    stats = table_stats(client, ['clients', 'contracts'], max_columns=['updated_at'])
+    stats['clients'] -> {'count': 1234, 'max': {'updated_at': '2024-...'}}
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from supabase_client import SupabaseClient, SupabaseHTTPError
+
+COUNT_METHODS = ('exact', 'planned', 'estimated')
+
+Filters = Iterable[Tuple[str, str]]
+
+
+def parse_content_range(value: Optional[str]) -> Optional[int]:
+    """Total de '0-0/1234' ou '*/1234' ('*/*' ou ausente: None)"""
+    if not value or '/' not in value:
+        return None
+    total = value.rsplit('/', 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def count_rows(client: SupabaseClient, table: str, method: str = 'exact', filters: Filters = ()) -> Optional[int]:
+    """Número de linhas da tabela (com os filtros PostgREST informados), via HEAD"""
+    if method not in COUNT_METHODS:
+        raise ValueError(f"Método de contagem deve ser um de {', '.join(COUNT_METHODS)}: {method}")
+    response = client.head(table, params=[*filters, ('limit', '1')], headers={'Prefer': f'count={method}'})
+    return parse_content_range(response.headers.get('content-range'))
+
+
+def column_max(client: SupabaseClient, table: str, column: str) -> Any:
+    """Maior valor não nulo da coluna (None se a tabela estiver vazia)"""
+    rows = client.request_json('GET', table, params=[('select', column), (column, 'not.is.null'),
+                                                     ('order', f'{column}.desc'), ('limit', '1')], empty=[])
+    return rows[0][column] if rows else None
+
+
+def _table_stats(client: SupabaseClient, table: str, method: str, max_columns: Sequence[str]) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {'count': None}
+    try:
+        stats['count'] = count_rows(client, table, method)
+    except SupabaseHTTPError as e:
+        stats['error'] = f"HTTP {e.status}: {e.text[:200]}"
+        return stats
+    except Exception as e:
+        stats['error'] = str(e)
+        return stats
+
+    if max_columns:
+        stats['max'] = {}
+        for column in max_columns:
+            # Coluna inexistente nesta tabela: fica None, sem invalidar a contagem
+            try:
+                stats['max'][column] = column_max(client, table, column)
+            except SupabaseHTTPError:
+                stats['max'][column] = None
+    return stats
+
+
+def table_stats(client: SupabaseClient, tables: Sequence[str], method: str = 'exact',
+                max_columns: Sequence[str] = (), workers: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Contagem (e, opcionalmente, o máximo de max_columns) de cada tabela, consultadas
+    em paralelo. Uma tabela inexistente ou sem acesso volta com 'error' em vez de
+    derrubar as demais
+    """
+    if not tables:
+        return {}
+    workers = workers or min(len(tables), client.pool_size)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {table: executor.submit(_table_stats, client, table, method, max_columns) for table in tables}
+        return {table: future.result() for table, future in futures.items()}
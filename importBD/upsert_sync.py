@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Importação incremental (upsert por external_id) para as tabelas do Supabase
+
+O modo antigo (replace) apaga a tabela inteira e reinsere tudo: a importação
+custa o tamanho da planilha e, enquanto roda, a tabela fica vazia ou pela metade.
+No modo upsert:
+- as linhas atuais da tabela são lidas (external_id + colunas comparadas), em
+  páginas ordenadas por external_id
+- só as linhas novas ou alteradas são enviadas, com
+  POST ?on_conflict=external_id e Prefer: resolution=merge-duplicates
+- opcionalmente, as linhas cujo external_id sumiu da origem são apagadas
+  (depois do upsert, para a tabela nunca ficar sem os dados atuais)
+
+Linhas sem external_id na tabela não são tocadas; na origem, são ignoradas
+(não há como casá-las com o que já existe). Exige um índice único em external_id.
+
+Configuração:
+    SUPABASE_IMPORT_MODE=replace|upsert   (padrão: replace)
+    SUPABASE_DELETE_MISSING=1             (só no modo upsert)
+"""
+
+import hashlib
+import json
+import math
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+from batch_uploader import BatchResult, UploadSummary, chunked, upload_batches
+from supabase_client import SupabaseClient
+from table_reader import iter_rows
+
+MODE_ENV = 'SUPABASE_IMPORT_MODE'
+DELETE_MISSING_ENV = 'SUPABASE_DELETE_MISSING'
+MODES = ('replace', 'upsert')
+DEFAULT_KEY = 'external_id'
+
+
+def import_mode() -> str:
+    """Modo de importação configurado em SUPABASE_IMPORT_MODE"""
+    mode = os.getenv(MODE_ENV, '').strip().lower() or 'replace'
+    if mode not in MODES:
+        raise ValueError(f"{MODE_ENV} deve ser um de {', '.join(MODES)}: {mode}")
+    return mode
+
+
+def delete_missing_enabled() -> bool:
+    return os.getenv(DELETE_MISSING_ENV, '').strip().lower() in ('1', 'true', 'sim')
+
+
+def _normalize(value: Any) -> Any:
+    """Mesma representação para o valor da origem e o devolvido pelo PostgREST"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        # numeric volta do banco como número; 100 e 100.0 são o mesmo valor
+        return round(float(value), 6)
+    return str(value)
+
+
+def row_fingerprint(row: Dict[str, Any], columns: Sequence[str]) -> str:
+    values = [_normalize(row.get(column)) for column in columns]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def fetch_fingerprints(client: SupabaseClient, table: str, columns: Sequence[str],
+                       key: str = DEFAULT_KEY) -> Dict[str, str]:
+    """
+    external_id -> impressão digital das colunas comparadas, para todas as linhas
+    da tabela com external_id (lidas em páginas por external_id)
+    """
+    select = ','.join(dict.fromkeys([key, *columns]))
+    return {str(row[key]): row_fingerprint(row, columns)
+            for row in iter_rows(client, table, select=select, key=key, filters=[(key, 'not.is.null')])}
+
+
+class SyncPlan:
+    """O que precisa ser escrito/apagado para a tabela ficar igual à origem"""
+
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []  # novas ou alteradas, na ordem da origem
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.duplicates = 0  # external_id repetido na origem (vale a última linha)
+        self.without_key = 0
+        self.missing: List[str] = []  # na tabela, mas não mais na origem
+
+
+def plan_sync(rows: Iterable[Dict[str, Any]], existing: Dict[str, str], columns: Sequence[str],
+              key: str = DEFAULT_KEY) -> SyncPlan:
+    plan = SyncPlan()
+    latest: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        row_key = row.get(key)
+        if row_key is None or row_key == '':
+            plan.without_key += 1
+            continue
+        row_key = str(row_key)
+        if row_key in latest:
+            plan.duplicates += 1
+            # Reinsere no fim: a ordem segue a última ocorrência
+            del latest[row_key]
+        latest[row_key] = row
+
+    for row_key, row in latest.items():
+        current = existing.get(row_key)
+        if current is None:
+            plan.new += 1
+        elif current != row_fingerprint(row, columns):
+            plan.changed += 1
+        else:
+            plan.unchanged += 1
+            continue
+        plan.rows.append(row)
+
+    plan.missing = [row_key for row_key in existing if row_key not in latest]
+    return plan
+
+
+def upsert_rows(client: SupabaseClient, table: str, rows: Sequence[Dict[str, Any]], key: str = DEFAULT_KEY):
+    """Upsert de um lote; levanta exceção se falhar"""
+    client.post(table, data=list(rows), params={'on_conflict': key},
+                headers={'Prefer': 'resolution=merge-duplicates,return=minimal'})
+
+
+def _in_filter(values: Iterable[str]) -> str:
+    quoted = ('"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"' for value in values)
+    return f"in.({','.join(quoted)})"
+
+
+def existing_keys(client: SupabaseClient, table: str, keys: Sequence[str], key: str = DEFAULT_KEY) -> Set[str]:
+    """Quais dos external_id informados já estão na tabela"""
+    keys = [str(value) for value in keys if value not in (None, '')]
+    if not keys:
+        return set()
+    rows = client.request_json('GET', table, params={'select': key, key: _in_filter(keys)}, empty=[])
+    return {str(row[key]) for row in rows}
+
+
+def delete_keys(client: SupabaseClient, table: str, keys: Sequence[str], key: str = DEFAULT_KEY):
+    """Apaga as linhas com os external_id informados; levanta exceção se falhar"""
+    client.delete(table, params={key: _in_filter(keys)}, headers={'Prefer': 'return=minimal'})
+
+
+class SyncResult:
+    def __init__(self, plan: SyncPlan, upload: UploadSummary, deleted: Optional[UploadSummary]):
+        self.plan = plan
+        self.upload = upload
+        self.deleted = deleted
+
+    @property
+    def succeeded_rows(self) -> int:
+        """Linhas que ficaram iguais à origem (escritas agora ou já iguais)"""
+        return self.upload.succeeded_rows + self.plan.unchanged
+
+    @property
+    def failed_rows(self) -> int:
+        return self.upload.failed_rows
+
+
+def sync_table(client: SupabaseClient, table: str, rows: Sequence[Dict[str, Any]], columns: Sequence[str],
+               key: str = DEFAULT_KEY, delete_missing: bool = False, batch_size: int = 100,
+               max_in_flight: Optional[int] = None,
+               on_result: Optional[Callable[[BatchResult], None]] = None, bisect: bool = False) -> SyncResult:
+    """
+    Deixa table igual a rows (linhas já no formato da tabela), escrevendo só a diferença.
+    columns são as colunas comparadas para decidir se uma linha mudou
+    """
+    existing = fetch_fingerprints(client, table, columns, key)
+    plan = plan_sync(rows, existing, columns, key)
+    print(f"🔎 {table}: {plan.new} novas, {plan.changed} alteradas, {plan.unchanged} sem mudança, "
+          f"{len(plan.missing)} ausentes da origem")
+    if plan.duplicates:
+        print(f"⚠️  {plan.duplicates} linhas com {key} repetido na origem (vale a última)")
+    if plan.without_key:
+        print(f"⚠️  {plan.without_key} linhas sem {key} ignoradas")
+
+    upload = upload_batches(chunked(plan.rows, batch_size), lambda batch: upsert_rows(client, table, batch, key),
+                            max_in_flight, on_result=on_result, bisect=bisect)
+
+    deleted = None
+    if delete_missing and plan.missing:
+        if upload.failed_rows:
+            # Com lotes falhando, a origem não foi aplicada por inteiro: não apaga nada
+            print(f"⚠️  {len(plan.missing)} linhas ausentes mantidas (houve falhas no upsert)")
+        else:
+            print(f"🗑️  Removendo {len(plan.missing)} linhas ausentes da origem...")
+            deleted = upload_batches(chunked(plan.missing, batch_size),
+                                     lambda batch: delete_keys(client, table, batch, key), max_in_flight)
+            print(f"✅ {deleted.succeeded_rows} removidas, {deleted.failed_rows} com erro")
+
+    return SyncResult(plan, upload, deleted)
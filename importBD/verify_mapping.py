@@ -1,10 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
-import urllib.request
-import urllib.parse
-import urllib.error
+from supabase_client import SupabaseHTTPError, get_client
 
 # Configuração do Supabase
 SUPABASE_URL = "https://sxbslulfitfsijqrzljd.supabase.co"
@@ -12,32 +9,13 @@ SUPABASE_ANON_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZS
 
 def make_supabase_request(method, endpoint, params=None, data=None):
     """Faz uma requisição HTTP para o Supabase"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    
-    if params:
-        query_string = urllib.parse.urlencode(params)
-        url += f"?{query_string}"
-    
-    headers = {
-        'apikey': SUPABASE_ANON_KEY,
-        'Authorization': f'Bearer {SUPABASE_ANON_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    if data:
-        data = json.dumps(data).encode('utf-8')
-    
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    
     try:
-        with urllib.request.urlopen(req) as response:
-            if response.status in [200, 201, 204]:
-                try:
-                    return json.loads(response.read().decode('utf-8'))
-                except:
-                    return {'success': True}
-            return None
-    except urllib.error.HTTPError as e:
+        response = get_client(SUPABASE_URL, SUPABASE_ANON_KEY).request(method, endpoint, params=params, data=data)
+        try:
+            return response.json()
+        except ValueError:
+            return {'success': True}
+    except SupabaseHTTPError as e:
         print(f"Erro HTTP {e.code}: {e.reason}")
         return None
     except Exception as e:
@@ -4,10 +4,7 @@
 Script para verificar se as datas dos contratos foram atualizadas com sucesso
 """
 
-import json
-import urllib.request
-import urllib.parse
-import urllib.error
+from supabase_client import SupabaseHTTPError, get_client
 
 # Configuração do Supabase
 SUPABASE_URL = "https://sxbslulfitfsijqrzljd.supabase.co"
@@ -15,24 +12,10 @@ SUPABASE_ANON_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZS
 
 def make_supabase_request(method, endpoint, params=None):
     """Faz uma requisição HTTP para o Supabase"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    
-    if params:
-        url += "?" + urllib.parse.urlencode(params)
-    
-    headers = {
-        'apikey': SUPABASE_ANON_KEY,
-        'Authorization': f'Bearer {SUPABASE_ANON_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    req = urllib.request.Request(url, headers=headers, method=method)
-    
     try:
-        with urllib.request.urlopen(req) as response:
-            return json.loads(response.read().decode('utf-8'))
-    except urllib.error.HTTPError as e:
-        print(f"❌ Erro HTTP {e.code}: {e.read().decode('utf-8')}")
+        return get_client(SUPABASE_URL, SUPABASE_ANON_KEY).request_json(method, endpoint, params=params)
+    except SupabaseHTTPError as e:
+        print(f"❌ Erro HTTP {e.code}: {e.text}")
         return None
     except Exception as e:
         print(f"❌ Erro na requisição: {e}")